@@ -0,0 +1,141 @@
+"""
+黄色ライン検出のベンチマーク
+1画素ずつ調べる方法（scanLinePython）、NumPyでまとめて調べる方法（scanLineNumpy）、
+色の早見表を引く方法（ColorLUT）の処理時間を、いくつかのカメラ解像度で比べます。
+NumPyの結果が元の方法と一致するか、早見表の判定が何%の画素で一致するかも確認します。
+追跡窓は、線が動いたり曲がったりする画像の列で、速い方法で済んだ割合と、画像全体を調べたときとの違いを表示します。
+
+使い方:  python benchmarks/bench_lane_detector.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lane_detector
+
+YELLOW    = [95, 187, 203]
+THRESHOLD = 30
+SIZES     = [(128, 64), (256, 128), (640, 480)]
+
+
+"""
+テスト用の画像（BGRA）を作ります。灰色の道路に、少し斜めの黄色い線を描きます。
+"""
+def makeFrame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(60, 120, size=(height, width, 4), dtype=np.uint8)
+    image[:, :, 3] = 255
+    for y in range(height):
+        x0 = int(width * (0.2 + 0.1 * y / height))
+        line = image[y, x0:x0 + max(2, width // 32), :3]
+        line[:] = np.asarray(YELLOW) + rng.integers(-20, 20, size=line.shape)
+    return image
+
+
+"""
+テスト用の、走っているときのような画像（BGRA）の列を作ります。
+黄色い線は、左右にゆっくり揺れながら、まっすぐ → 曲がる → 逆に曲がる と形を変え、
+ときどき（jump_every フレームごとに）大きく横に跳びます（車線変更や、見失った後のような場面）。
+"""
+def makeCurveSequence(width, height, count, seed=0, jump_every=60):
+    rng = np.random.default_rng(seed)
+    line_width = max(2, width // 32)
+    rows = np.arange(height)
+    v = (height - 1 - rows) / float(height) # 画面の一番下が0、上に行くほど大きい
+    frames = []
+    for i in range(count):
+        image = rng.integers(60, 120, size=(height, width, 4), dtype=np.uint8)
+        image[:, :, 3] = 255
+        offset = 0.3 + 0.1 * np.sin(i * 0.05) + (0.25 if (i // jump_every) % 2 else 0.0)
+        curvature = 0.6 * np.sin(i * 0.02)
+        centers = width * (offset + 0.1 * v + curvature * v ** 2)
+        for y in range(height):
+            x0 = int(centers[y])
+            if 0 <= x0 < width:
+                line = image[y, x0:x0 + line_width, :3]
+                line[:] = np.asarray(YELLOW) + rng.integers(-20, 20, size=line.shape)
+        frames.append(image)
+    return frames
+
+
+"""
+関数 func を何回か実行して、1回あたりの平均時間[ms]を返します。
+"""
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def main():
+    start = time.perf_counter()
+    lut = lane_detector.ColorLUT([YELLOW], THRESHOLD)
+    print("ColorLUT build: %.2f ms" % ((time.perf_counter() - start) * 1000.0))
+    print("%-10s %12s %12s %9s %6s %10s %9s" % ("size", "python[ms]", "numpy[ms]", "speedup",
+          "same", "lut[ms]", "lut_agree"))
+    for width, height in SIZES:
+        image = makeFrame(width, height)
+        y_start = int(1.0 * height / 3.0)
+
+        slow = lambda: lane_detector.scanLinePython(image, YELLOW, THRESHOLD, y_start)
+        fast = lambda: lane_detector.scanLineNumpy(image, YELLOW, THRESHOLD, y_start)
+
+        python_ms = timeit(slow, 1 if width * height > 100000 else 3)
+        numpy_ms  = timeit(fast, 200)
+        same = slow() == fast()
+
+        roi = image[y_start:]
+        lut_ms = timeit(lambda: lane_detector.lineCentroid(lut.classify(roi)), 200)
+        agree = np.mean(lut.classify(roi) == lane_detector.colorMask(roi, YELLOW, THRESHOLD))
+        print("%-10s %12.3f %12.3f %8.0fx %6s %10.3f %8.2f%%" % ("%dx%d" % (width, height),
+              python_ms, numpy_ms, python_ms / numpy_ms, same, lut_ms, agree * 100.0))
+
+    # 追跡窓: 2フレーム目からは前の重心のまわりだけを調べます。
+    # 同じ画像を何度も調べると、いつも速い方法で済んでしまうので、線が動いたり曲がったりする画像の列を使います。
+    # 速い方法で済んだ割合（fast path）と一緒に、画像全体を調べたときと答えが違ったフレームの割合も表示します。
+    print("%-10s %9s %12s %10s %10s %13s" % ("size", "full[ms]", "tracked[ms]", "fast_path", "mismatch",
+          "max_dx[px]"))
+    for width, height in SIZES:
+        frames = makeCurveSequence(width, height, 300)
+        full = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD, track_half_width=0)
+        tracked = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD)
+        full_results = [(full.scan(image), full.lane_shape) for image in frames]
+        tracked_results = [(tracked.scan(image), tracked.lane_shape) for image in frames]
+        mismatch, max_dx = 0, 0.0
+        for (full_sums, full_shape), (tracked_sums, tracked_shape) in zip(full_results, tracked_results):
+            if full_sums != tracked_sums or full_shape != tracked_shape:
+                mismatch += 1
+            if full_sums[1] > 0 and tracked_sums[1] > 0:
+                max_dx = max(max_dx, abs(full_sums[0] / full_sums[1] - tracked_sums[0] / tracked_sums[1]))
+        fast_path = tracked.fastPathRatio()
+        full_ms = timeit(lambda: [full.scan(image) for image in frames], 3) / len(frames)
+        tracked_ms = timeit(lambda: [tracked.scan(image) for image in frames], 3) / len(frames)
+        print("%-10s %9.3f %12.3f %9.0f%% %9.1f%% %13.2f" % ("%dx%d" % (width, height), full_ms, tracked_ms,
+              100.0 * fast_path, 100.0 * mismatch / len(frames), max_dx))
+
+    # 線の形: 列ごとの重心1つ（lineCentroid）と、行ごとの重心＋2次式の当てはめの比較
+    for width, height in SIZES:
+        image = makeFrame(width, height)
+        detector = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD, track_half_width=0)
+        mask = detector.mask(image[detector.y_start:])
+        detector.scanRegion(image[detector.y_start:])
+        print("%dx%d centroid %.3f ms, row centroids + fit %.3f ms" % (width, height,
+              timeit(lambda: lane_detector.lineCentroid(mask), 500),
+              timeit(lambda: (lane_detector.rowCentroids(mask), detector.fitLaneShape()), 500)))
+
+    # 探したい色が複数ある場合: NumPyの方法は色の数だけ時間が増えますが、早見表は変わりません。
+    colors = [YELLOW, [255, 255, 255], [40, 40, 200]]
+    multi_lut = lane_detector.ColorLUT(colors, THRESHOLD)
+    numpy_detector = lane_detector.LaneDetector(640, 480, colors, THRESHOLD, backend="numpy")
+    image = makeFrame(640, 480)
+    roi = image[int(480 / 3.0):]
+    print("3 colors at 640x480: numpy %.3f ms, lut %.3f ms" % (
+          timeit(lambda: numpy_detector.mask(roi), 200), timeit(lambda: multi_lut.classify(roi), 200)))
+
+
+if __name__ == '__main__':
+    main()
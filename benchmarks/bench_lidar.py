@@ -0,0 +1,59 @@
+"""
+LiDAR処理のベンチマーク
+180本（Sick LMS 291）のスキャンで、障害物のかたまり分け（segmentScan）と
+通路の判定（nearestCorridorHit）に何マイクロ秒かかるかを測ります。
+かたまり分けは1ms（1000us）よりずっと短くなるはずです。
+
+使い方:  python benchmarks/bench_lidar.py
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lidar_processing
+
+LIDAR_WIDTH = 180
+LIDAR_FOV   = math.pi
+DIST_MAX    = 20.0
+
+
+"""
+テスト用のスキャンを作ります。遠くの壁の前に、num_objects 個の物（車や電柱）を置きます。
+"""
+def makeScan(num_objects, seed=0):
+    rng = np.random.default_rng(seed)
+    scan = np.full(LIDAR_WIDTH, np.inf)
+    scan[:30] = 40.0 + rng.normal(0.0, 0.05, 30)
+    for _ in range(num_objects):
+        start = rng.integers(0, LIDAR_WIDTH - 10)
+        scan[start:start + rng.integers(1, 10)] = rng.uniform(2.0, 18.0)
+    return scan.tolist() # getRangeImage() と同じくリストで渡す
+
+
+""" 関数 func を repeat 回実行して、1回あたりの平均時間[us]を返します """
+def timeit(func, repeat=5000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1e6 / repeat
+
+
+def main():
+    geometry = lidar_processing.getLidarGeometry(LIDAR_WIDTH, LIDAR_FOV)
+    start, end = geometry.corridorRange(0.5 * 2.015 + 0.1, 3.0)
+    print("%-10s %10s %14s %16s" % ("objects", "segments", "segment[us]", "corridor[us]"))
+    for num_objects in (0, 2, 10, 40):
+        scan = makeScan(num_objects)
+        obstacles = lidar_processing.segmentScan(scan, geometry, DIST_MAX)
+        segment_us = timeit(lambda: lidar_processing.segmentScan(scan, geometry, DIST_MAX))
+        corridor_us = timeit(lambda: lidar_processing.nearestCorridorHit(
+            scan, geometry, start, end, 0.5 * 2.015 + 0.1, DIST_MAX))
+        print("%-10d %10d %14.1f %16.1f" % (num_objects, len(obstacles), segment_us, corridor_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+RobotCar のよく呼ばれる処理のベンチマーク
+colorDiff, calcSteeringAngle, calcObstacleAngleDist, maFilter, control, integrateScan（地図の更新）,
+repulsiveField（全部のレーザーからの反発力）, dwaPlan（DWA の候補の採点）を
+1つずつ何回も呼んで、
+  ns_per_op          : 1回あたりの時間[ns]（何回か測った中の中央値）
+  peak_bytes_per_op  : 1回の処理の途中で一時的に使ったメモリ[バイト]（tracemalloc で測ります）
+  net_blocks_per_op  : 1回の処理のあとに残ったメモリの個数（増え続けるならメモリが漏れています）
+  budget_percent     : 制御の1周期（RobotCar.TIME_STEP = 30ms）のうち、何%を使うか
+をカメラ・LiDARの解像度ごとに測り、結果を JSON ファイルに保存します。
+RobotCar は、にせものの Webots（webots_stub）の上で作るので、Webots は要りません。
+
+使い方:
+  python benchmarks/bench_robot_car.py                          # 作り物のコースで測る → bench_robot_car.json
+  python benchmarks/bench_robot_car.py --capture capture.bin    # 記録したセンサのデータでも測る
+  python benchmarks/bench_robot_car.py --out new.json --compare old.json   # 前の結果と比べる
+比べるときは、REGRESSION_RATIO 倍より遅くなった処理に "REGRESSION" と表示して、終了コード 1 を返します。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("CAR_LOG_LEVEL", "WARNING") # 測っている間はログを表示しません
+import webots_stub
+import lidar_processing
+import dwa_planner
+import occupancy_grid
+
+# (カメラの横幅, カメラの高さ, LiDARの本数)
+CONFIGS = [(128, 64, 180), (256, 128, 360), (640, 480, 720)]
+OBSTACLES = [(-106.8, -22.0, 1.0), (-103.0, -35.0, 0.5), (-110.0, -45.0, 2.0)]
+NUM_FRAMES = 32          # 使い回す入力のフレーム数
+REGRESSION_RATIO = 1.2   # 前の結果よりこれ倍以上遅ければ REGRESSION
+
+
+"""
+webots_stub の世界で RobotCar を作り、コースを少し走らせながら、カメラ画像とLiDARのデータを集めます。
+sources を渡すと、作り物の代わりにそのソース（記録したデータなど）を使います。
+"""
+def makeRobotCar(sources, num_frames=NUM_FRAMES):
+    world = webots_stub.install(webots_stub.World(duration=None, obstacles=OBSTACLES, sources=sources))
+    import robot_car_auto_02
+    car = robot_car_auto_02.RobotCar()
+    car.driver.setCruisingSpeed(40)
+
+    images, scans = [], []
+    while len(images) < num_frames:
+        if car.driver.step() == -1:
+            break
+        if world.step_count % 3 == 0:
+            image = np.frombuffer(car.camera.getImage(), np.uint8)
+            images.append(image.reshape((car.camera_height, car.camera_width, 4)).copy())
+            scans.append(list(car.lidar.getRangeImage())) # getRangeImage() と同じくリストで渡す
+    return car, images, scans
+
+
+""" 入力を順番に使い回して op を呼ぶ関数を作ります """
+def cycle(op, inputs):
+    state = {"i": 0}
+    count = len(inputs)
+    def run():
+        i = state["i"]
+        op(inputs[i])
+        state["i"] = i + 1 if i + 1 < count else 0
+    return run
+
+
+""" func の1回あたりの時間[ns]を、repeat 回測った中央値で返します """
+def measureTime(func, number, repeat=5):
+    func() # 1回目はキャッシュ作りなどが入るので測りません
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter_ns() - start) / number)
+    return statistics.median(samples)
+
+
+""" func の1回あたりの (一時的に使った最大のメモリ[バイト], 残ったメモリの個数) を返します """
+def measureAllocations(func, number=200):
+    func()
+    tracemalloc.start()
+    peak_total = 0
+    start_blocks = sys.getallocatedblocks()
+    for _ in range(number):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - current
+    net_blocks = sys.getallocatedblocks() - start_blocks
+    tracemalloc.stop()
+    return peak_total / number, net_blocks / number
+
+
+""" 1つの設定（入力の種類と解像度）で、全部の処理を測って結果のリストを返します """
+def runConfig(label, car, images, scans):
+    yellow = car.YELLOW
+    pixel = images[0][images[0].shape[0] // 2, images[0].shape[1] // 4]
+    angles = np.linspace(-0.6, 0.6, 64).tolist()
+    # 地図は run3 のときだけ作られるので、測るための地図をここで作ります
+    grid = occupancy_grid.OccupancyGrid(car.MAP_SIZE, car.MAP_RESOLUTION)
+    x, y, heading = webots_stub.controller.getWorld().pose() # 集めたスキャンの最後の位置
+    integrate = lambda scan: grid.integrateScan(x, y, heading, scan, car.lidar_geometry, car.LIDAR_OFFSET)
+    # 間引かない（stride = 1 の）ときの時間を測りたいので、時間の上限は無いことにします
+    field = lidar_processing.RepulsiveField(car.lidar_geometry, car.APF_INFLUENCE_DIST, budget_ns=float("inf"))
+    planner = dwa_planner.DwaPlanner(car.SPEED / 3.6, car.WHEELBASE, car.CAR_WIDTH, car.LIDAR_OFFSET,
+                                     horizon=car.DWA_HORIZON, margin=car.DWA_MARGIN)
+    plan = lambda scan: planner.plan(scan, car.lidar_geometry, 0.5 * car.SPEED / 3.6, 0.0)
+    ops = [
+        ("colorDiff",             lambda: car.colorDiff(pixel, yellow), 20000),
+        ("calcSteeringAngle",     cycle(car.calcSteeringAngle, images), 500),
+        ("calcObstacleAngleDist", cycle(car.calcObstacleAngleDist, scans), 2000),
+        ("maFilter",              cycle(car.maFilter, angles), 20000),
+        ("control",               cycle(car.control, angles), 20000),
+        ("integrateScan",         cycle(integrate, scans), 500),
+        ("repulsiveField",        cycle(field.compute, scans), 5000),
+        ("dwaPlan",               cycle(plan, scans), 500),
+    ]
+    budget_ns = car.TIME_STEP * 1e6
+    results = []
+    for name, func, number in ops:
+        ns_per_op = measureTime(func, number)
+        peak_bytes, net_blocks = measureAllocations(func)
+        results.append({
+            "name": name, "config": label, "ns_per_op": ns_per_op,
+            "peak_bytes_per_op": peak_bytes, "net_blocks_per_op": net_blocks,
+            "budget_percent": 100.0 * ns_per_op / budget_ns,
+        })
+        print("%-22s %-18s %12.0f %12.0f %10.2f %9.3f%%" % (name, label, ns_per_op, peak_bytes,
+              net_blocks, results[-1]["budget_percent"]))
+    return results
+
+
+""" いつ・どのコミットで・どんな環境で測ったか """
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "platform": platform.platform()}
+
+
+""" 前の結果（JSON）と比べて表示します。遅くなった処理があれば True を返します """
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = {(r["name"], r["config"]): r for r in json.load(f)["results"]}
+    print("\ncompared with %s" % old_path)
+    print("%-22s %-18s %12s %12s %8s" % ("op", "config", "old[ns]", "new[ns]", "ratio"))
+    regressed = False
+    for result in results:
+        before = old.get((result["name"], result["config"]))
+        if before is None:
+            continue
+        ratio = result["ns_per_op"] / before["ns_per_op"]
+        mark = ""
+        if ratio >= REGRESSION_RATIO:
+            mark, regressed = "  REGRESSION", True
+        print("%-22s %-18s %12.0f %12.0f %8.2f%s" % (result["name"], result["config"],
+              before["ns_per_op"], result["ns_per_op"], ratio, mark))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RobotCar の処理ごとのベンチマーク")
+    parser.add_argument("--capture", help="sensor_capture で記録したデータでも測る")
+    parser.add_argument("--out", default="bench_robot_car.json", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", help="比べる前の結果（JSON ファイル）")
+    args = parser.parse_args()
+
+    print("%-22s %-18s %12s %12s %10s %10s" % ("op", "config", "ns/op", "peak B/op",
+          "blocks/op", "budget"))
+    results = []
+    for width, height, lidar_width in CONFIGS:
+        sources = {"camera": webots_stub.sources.SyntheticCamera(width, height),
+                   "Sick LMS 291": webots_stub.sources.RaycastLidar(lidar_width)}
+        car, images, scans = makeRobotCar(sources)
+        results += runConfig("synthetic_%dx%d_%d" % (width, height, lidar_width), car, images, scans)
+
+    if args.capture:
+        capture = webots_stub.sources.CaptureSource(args.capture)
+        sources = {"camera": capture.camera(), "Sick LMS 291": capture.lidar(), "gps": capture.gps()}
+        car, images, scans = makeRobotCar(sources)
+        results += runConfig("capture_%dx%d_%d" % (car.camera_width, car.camera_height, car.lidar_width),
+                             car, images, scans)
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=1)
+    print("results saved to %s" % args.out)
+
+    if args.compare and compare(args.compare, results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
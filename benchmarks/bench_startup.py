@@ -0,0 +1,130 @@
+"""
+コントローラの起動の速さのベンチマーク
+スクリプトを Webots と同じように __main__ として動かし、最初の driver.step()（robot.step()）が呼ばれるまでの
+  first_step_ms : スクリプトを動かし始めてから、最初の step() までの時間[ms]（import と初期化の合計）
+  modules       : その間に新しく読み込んだモジュールの数
+  optional      : 読み込んでしまった「使うときだけ読み込むはずの部品」（cv2 など）
+を測ります。import のキャッシュが効かないように、1回ごとに新しい Python のプロセスで動かして、中央値を取ります。
+ワールドにたくさんの車がいると、この時間が車の数だけ足されます。
+webots_stub 自身とセンサの元（sources）の準備は、測る前に済ませておきます（本物の Webots には無い時間なので）。
+
+使い方:
+  python benchmarks/bench_startup.py                         # → bench_startup.json
+  python benchmarks/bench_startup.py --repeat 15 --compare old.json
+比べるときは、REGRESSION_RATIO 倍より遅くなったスクリプトに "REGRESSION" と表示して、終了コード 1 を返します。
+"""
+import argparse
+import json
+import os
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPTS = ["robot_car_01.py", "robot_car_auto_02.py", "robot_car_auto_03.py", "robot_car_auto_04_proto.py"]
+OPTIONAL_MODULES = ["cv2", "telemetry", "sensor_capture", "perception_worker", "profiler",
+                    "pose_estimator", "obstacle_memory", "occupancy_grid", "dwa_planner"]
+REPEAT = 9               # 1つのスクリプトを何回（何プロセス）測るか
+REGRESSION_RATIO = 1.2   # 前の結果よりこれ倍以上遅ければ REGRESSION
+
+
+"""
+子プロセスの中で1回だけ測ります。結果は JSON にして1行で表示します。
+コントローラの表示（print やログ）は、測る邪魔にならないように捨てます。
+"""
+def measureChild(script):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("CAR_LOG_LEVEL", "WARNING")
+    import webots_stub
+
+    # センサの元は先に作っておき、1コマ進んだら世界が終わるようにします
+    world = webots_stub.World(duration=0.0, sources={
+        "camera": webots_stub.sources.SyntheticCamera(),
+        "Sick LMS 291": webots_stub.sources.RaycastLidar(),
+        "gps": webots_stub.sources.PoseGps()})
+    webots_stub.install(world)
+    first_step = {}
+    def onStep(world):
+        if not first_step:
+            first_step["time"] = time.perf_counter()
+            first_step["modules"] = set(sys.modules)
+    world.addObserver(onStep)
+
+    out = sys.stdout
+    before = set(sys.modules)
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        start = time.perf_counter()
+        runpy.run_path(os.path.join(ROOT, script), run_name="__main__")
+        sys.stdout = out
+    loaded = first_step["modules"] - before
+    print(json.dumps({"first_step_ms": (first_step["time"] - start) * 1e3, "modules": len(loaded),
+                      "optional": sorted(name for name in OPTIONAL_MODULES if name in loaded)}), file=out)
+
+
+""" 新しいプロセスで repeat 回測って、中央値などをまとめます """
+def measure(script, repeat):
+    samples = []
+    for _ in range(repeat):
+        done = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", script],
+                              cwd=ROOT, capture_output=True, text=True, check=True)
+        samples.append(json.loads(done.stdout.strip().splitlines()[-1]))
+    times = [s["first_step_ms"] for s in samples]
+    return {"script": script, "first_step_ms": statistics.median(times), "min_ms": min(times),
+            "max_ms": max(times), "modules": samples[-1]["modules"], "optional": samples[-1]["optional"]}
+
+
+""" 前の結果（JSON）と比べて表示します。遅くなったスクリプトがあれば True を返します """
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = {r["script"]: r for r in json.load(f)["results"]}
+    print("\ncompared with %s" % old_path)
+    print("%-28s %10s %10s %8s" % ("script", "old[ms]", "new[ms]", "ratio"))
+    regressed = False
+    for result in results:
+        before = old.get(result["script"])
+        if before is None:
+            continue
+        ratio = result["first_step_ms"] / before["first_step_ms"]
+        mark = ""
+        if ratio >= REGRESSION_RATIO:
+            mark, regressed = "  REGRESSION", True
+        print("%-28s %10.1f %10.1f %8.2f%s" % (result["script"], before["first_step_ms"],
+              result["first_step_ms"], ratio, mark))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コントローラの最初の step() までの時間を測ります")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS, help="測るスクリプト")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="1つのスクリプトを測る回数")
+    parser.add_argument("--out", default="bench_startup.json", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", help="比べる前の結果（JSON ファイル）")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measureChild(args.child)
+        return
+
+    print("%-28s %10s %10s %10s %8s  %s" % ("script", "median[ms]", "min[ms]", "max[ms]", "modules",
+          "optional modules loaded"))
+    results = []
+    for script in args.scripts:
+        result = measure(script, args.repeat)
+        results.append(result)
+        print("%-28s %10.1f %10.1f %10.1f %8d  %s" % (script, result["first_step_ms"], result["min_ms"],
+              result["max_ms"], result["modules"], ", ".join(result["optional"]) or "-"))
+
+    from bench_robot_car import metadata
+    with open(args.out, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=1)
+    print("results saved to %s" % args.out)
+
+    if args.compare and compare(args.compare, results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+黄色ライン検出のバックエンド比べ
+"python", "numpy", "lut", "opencv" の全部のバックエンドに同じフレームを順番に流して、
+1フレームあたりの処理時間と、操舵角（P制御の部分）が "python"（元の方法）とどれくらい一致するかを表示します。
+
+使い方:
+  python benchmarks/compare_lane_backends.py                  # 作り物の走行画像と、しきい値ぎりぎりの色の画像で比べる
+  python benchmarks/compare_lane_backends.py frames.npy       # 記録した画像（N x 高さ x 横幅 x 4 のBGRA）で比べる
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lane_detector
+
+YELLOW     = [95, 187, 203]
+THRESHOLD  = 30
+TARGET_POS = 0.25 # RobotCar.calcSteeringAngle と同じ目標位置
+CAMERA_FOV = 1.0  # 操舵角に直すときの視野角[rad]
+
+
+"""
+作り物の走行画像を作ります。黄色い線が左右にゆっくりゆれる、num_frames 枚の連続画像です。
+"""
+def makeSequence(width=128, height=64, num_frames=200, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(60, 120, size=(num_frames, height, width, 4), dtype=np.uint8)
+    frames[:, :, :, 3] = 255
+    line_width = max(2, width // 32)
+    for i in range(num_frames):
+        center = 0.3 + 0.1 * np.sin(i / 20.0)
+        for y in range(height):
+            x0 = int(width * (center + 0.1 * y / height))
+            line = frames[i, y, x0:x0 + line_width, :3]
+            line[:] = np.asarray(YELLOW) + rng.integers(-20, 20, size=line.shape)
+    return frames
+
+
+"""
+しきい値ぎりぎりの色の線を描いた画像を作ります。makeSequence と同じ動きの線ですが、線の画素の色は
+目標の色からのズレ（B, G, R の差の絶対値の合計）が しきい値*3 の前後 margin 以内になるように選びます。
+早見表（"lut"）のように色を粗くする方法は、ここで元の方法と答えが変わります。
+"""
+def makeBoundarySequence(width=128, height=64, num_frames=200, margin=6, seed=1):
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(60, 120, size=(num_frames, height, width, 4), dtype=np.uint8)
+    frames[:, :, :, 3] = 255
+    line_width = max(4, width // 16)
+    yellow = np.asarray(YELLOW)
+    for i in range(num_frames):
+        center = 0.3 + 0.1 * np.sin(i / 20.0)
+        for y in range(height):
+            x0 = int(width * (center + 0.1 * y / height))
+            line = frames[i, y, x0:x0 + line_width, :3]
+            # ズレの合計を決めてから、3色にランダムに分けます（符号もランダム）
+            total = THRESHOLD * 3 + rng.integers(-margin, margin + 1, size=len(line))
+            share = rng.dirichlet(np.ones(3), size=len(line))
+            diff  = np.floor(share * total[:, None]).astype(int)
+            diff[:, 0] += total - diff.sum(axis=1) # 切り捨てた分は B に足して、合計をちょうど total にします
+            sign  = rng.choice([-1, 1], size=diff.shape)
+            color = yellow + sign * diff
+            color = np.where((color < 0) | (color > 255), yellow - sign * diff, color) # 範囲外なら反対向きにずらします
+            line[:] = color[:len(line)]
+    return frames
+
+
+""" 1つのバックエンドに全フレームを流して、各フレームの処理時間[ms]と操舵角を返します """
+def runBackend(backend, frames):
+    height, width = frames.shape[1], frames.shape[2]
+    detector = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD, backend=backend)
+    latency  = np.empty(len(frames))
+    steering = np.full(len(frames), np.nan)
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        sumx, pixel_count = detector.scan(frame)
+        latency[i] = (time.perf_counter() - start) * 1000.0
+        if pixel_count > 0:
+            y_ave = float(sumx) / (pixel_count * width)
+            steering[i] = (y_ave - TARGET_POS) * CAMERA_FOV
+    return latency, steering
+
+
+""" 全部のバックエンドに frames を流して、時間と "python" との一致を表示します """
+def compareBackends(label, frames):
+    print("\n%s frames: %d (%dx%d)" % (label, frames.shape[0], frames.shape[2], frames.shape[1]))
+
+    results = {}
+    for backend in lane_detector.LaneDetector.BACKENDS:
+        try:
+            results[backend] = runBackend(backend, frames)
+        except ImportError as error:
+            print("%-7s skipped (%s)" % (backend, error))
+
+    _, reference = results["python"]
+    print("%-7s %10s %10s %10s %14s %8s" % ("backend", "mean[ms]", "p95[ms]", "max[ms]",
+          "max|d steer|", "agree"))
+    for backend, (latency, steering) in results.items():
+        found = ~np.isnan(reference) & ~np.isnan(steering)
+        same_found = np.mean(np.isnan(reference) == np.isnan(steering))
+        error = np.abs(steering[found] - reference[found])
+        max_error = error.max() if error.size else 0.0
+        agree = same_found * np.mean(error < 1e-9) if error.size else same_found
+        print("%-7s %10.3f %10.3f %10.3f %14.2e %7.1f%%" % (backend, latency.mean(),
+              np.percentile(latency, 95), latency.max(), max_error, agree * 100.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="黄色ライン検出のバックエンドの速さと答えを比べます")
+    parser.add_argument("frames", nargs="?",
+                        help="記録した画像の .npy ファイル（N x 高さ x 横幅 x 4 のBGRA）。無ければ作り物の画像で比べます")
+    args = parser.parse_args()
+
+    if args.frames:
+        compareBackends(args.frames, np.load(args.frames, mmap_mode="r"))
+    else:
+        compareBackends("synthetic", makeSequence())
+        compareBackends("boundary colours", makeBoundarySequence())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+障害物の探し方の比べ
+calcObstacleAngleDist の「正面のまっすぐの通路」（SWEPT_FOOTPRINT = False）と
+「曲がっていく道すじに沿った車の形」（SWEPT_FOOTPRINT = True）で、run1 と run2 を同じ障害物の置き方で走らせ、
+ぶつかった回数・1周の時間・車線の真ん中からのずれを並べて表示します。
+走らせ方と採点は gain_sweep.py と同じです（にせものの Webots のコースを使うので、Webots は要りません）。
+最後に走り方ごとの衝突の合計を比べ、曲がる道すじの方が多ければ "REGRESSION" と表示して、終了コード 1 を返します。
+
+使い方:
+  python benchmarks/compare_obstacle_sweep.py
+  python benchmarks/compare_obstacle_sweep.py --runs run2 --duration 60 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gain_sweep
+
+# 障害物の置き方 (道のり[m], 車線の真ん中からのずれ[m], 半径[m])。最初は gain_sweep.py の既定と同じです
+LAYOUTS = [
+    gain_sweep.OBSTACLE_PLACES,
+    [(100.0, 0.3, 0.8), (250.0, -0.3, 0.8), (380.0, 0.0, 1.0)],
+    [(200.0, 0.6, 0.8), (330.0, -0.6, 0.8), (470.0, 0.2, 1.0)],
+    [(120.0, -0.4, 0.9), (280.0, 0.4, 0.8), (440.0, -0.2, 0.8)],
+    [(170.0, 0.0, 1.0), (350.0, 0.3, 0.9), (460.0, -0.6, 0.8)],
+]
+
+
+"""
+1つの (置き方, 走り方, 探し方) で走らせて、結果を返します（別のプロセスで呼ばれます）。
+結果は Python の普通の数だけにします（NumPy の数を返すと、受け取る側が途中で numpy を読み込み、
+そのとき作られた次のプロセスが読み込みのロックを持ったまま止まってしまうことがあるため）。
+"""
+def evaluate(job):
+    layout, run, swept, duration = job
+    gain_sweep.OBSTACLE_PLACES = LAYOUTS[layout]
+    result = gain_sweep.evaluate(({"SWEPT_FOOTPRINT": swept}, duration, "robot_car_auto_02", run))
+    lap_time = float(result["lap_time"]) if result["lap_time"] is not None else None
+    return {"layout": layout, "run": run, "swept": swept, "lap_time": lap_time,
+            "cte_rms": float(result["cte_rms"]), "cte_max": float(result["cte_max"]),
+            "collisions": int(result["collisions"])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="障害物の探し方（まっすぐの通路・曲がる道すじ）を比べます")
+    parser.add_argument("--runs", default="run1,run2", help="比べる走り方（カンマ区切り）")
+    parser.add_argument("--duration", type=float, default=90.0, help="1回の走行の時間[s]（シミュレーションの時間）")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="同時に動かすプロセスの数")
+    args = parser.parse_args()
+
+    runs = args.runs.split(",")
+    jobs = [(layout, run, swept, args.duration)
+            for run in runs for layout in range(len(LAYOUTS)) for swept in (False, True)]
+    # 1つのプロセスで走らせるのは1回だけにします（RobotCar のクラス定数を書き換えるため）
+    with multiprocessing.Pool(args.processes, maxtasksperchild=1) as pool:
+        results = list(pool.imap(evaluate, jobs))
+
+    print("%-5s %6s %-8s %9s %8s %8s %10s" % ("run", "layout", "search", "lap[s]", "cte_rms", "cte_max",
+          "collisions"))
+    for result in results:
+        lap = "%9.1f" % result["lap_time"] if result["lap_time"] is not None else "%9s" % "-"
+        print("%-5s %6d %-8s %s %8.3f %8.3f %10d" % (result["run"], result["layout"],
+              "swept" if result["swept"] else "straight", lap, result["cte_rms"], result["cte_max"],
+              result["collisions"]))
+
+    regressed = False
+    print("\ncollisions in total")
+    for run in runs:
+        straight = sum(r["collisions"] for r in results if r["run"] == run and not r["swept"])
+        swept    = sum(r["collisions"] for r in results if r["run"] == run and r["swept"])
+        mark = ""
+        if swept > straight:
+            mark, regressed = "  REGRESSION", True
+        print("%-5s straight %3d  swept %3d%s" % (run, straight, swept, mark))
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
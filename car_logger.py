@@ -0,0 +1,179 @@
+"""
+コントローラのログ（走行中の様子の表示）をまとめて扱う部品です。
+
+これまでは毎コマ print() していたので、長く走らせると Webots のコンソールへの書き込みだけで
+かなりの時間を使っていました。car_logger は Python標準の logging を使って、
+  - レベル : DEBUG（細かい値）/ INFO（普段見たいこと）/ WARNING（おかしなこと）を分けます。
+  - 回数制限 : 同じ名前（event）のログは、interval 秒に1回だけ表示します。
+               間引いた回数は、次に表示するときに "(+N suppressed)" として一緒に表示します。
+               秒はシミュレーションの時間（clock=driver.getTime）で数えるので、実際の時間より速く
+               走らせても、表示される量は変わりません（clock を渡さないときだけ、実際の時間で数えます）。
+  - 裏で書き込み : ログはキュー（順番待ちの列）に入れるだけで、文字列に直して書き込むのは
+                   裏のスレッドが行うので、制御ループは待たされません。
+  - 値のまま記録 : ログは「名前 + 値の組（step=12, dist=4.2 など）」のまま記録して、
+                   書き込むときに初めて文字列にします（JSON Lines でも出力できます）。
+
+使い方:
+  log = car_logger.getLogger("robot_car_auto_02", clock=driver.getTime)
+  log.info("obstacle", step=step, angle=obstacle_angle, dist=obstacle_dist)
+
+設定は環境変数で変えられます（Webotsのコントローラの引数を変えずに済みます）。
+  CAR_LOG_LEVEL    : 表示するレベル（既定 INFO）。DEBUG にすると細かい値も表示します
+  CAR_LOG_INTERVAL : 同じ名前のログを表示する最短の間隔[s]（既定 5.0）。0 なら間引きません
+                     （毎コマ 30ms ごとのログなら、5秒に1回で 1/160 くらいになります）
+  CAR_LOG_FORMAT   : "text"（既定）または "json"（1行に1つのJSON）
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+DEFAULT_LEVEL    = os.environ.get("CAR_LOG_LEVEL", "INFO").upper()
+DEFAULT_INTERVAL = float(os.environ.get("CAR_LOG_INTERVAL", "5.0"))
+DEFAULT_FORMAT   = os.environ.get("CAR_LOG_FORMAT", "text")
+QUEUE_SIZE       = 10000 # キューに貯められるログの数（あふれた分は捨てて数えておきます）
+
+
+""" ログ1件を「時刻 レベル 名前 event key=value ...」の1行（または JSON）に直します """
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+        if json_lines:
+            import json # JSON で出すときだけ読み込みます（コントローラの起動を速くするため）
+            self.dumps = json.dumps
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        suppressed = getattr(record, "suppressed", 0)
+        if self.json_lines:
+            data = {"time": record.created, "level": record.levelname, "logger": record.name,
+                    "event": record.msg}
+            data.update(fields)
+            if suppressed:
+                data["suppressed"] = suppressed
+            return self.dumps(data, default=str)
+        text = "%.3f %s %s %s" % (record.created, record.levelname, record.name, record.msg)
+        for key, value in fields.items():
+            if isinstance(value, float):
+                text += " %s=%.4g" % (key, value)
+            else:
+                text += " %s=%s" % (key, value)
+        if suppressed:
+            text += " (+%d suppressed)" % suppressed
+        return text
+
+
+"""
+キューに入れるだけの handler です。
+標準の QueueHandler は入れる前に文字列に直してしまうので、値のままキューに入れるようにしています。
+キューがいっぱいのときは、待たずにそのログを捨てて dropped_count で数えます。
+"""
+class BufferedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_count = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+"""
+名前（event）ごとに回数を制限してログを出す入れ物です。getLogger() で作ります。
+debug / info / warning の第1引数は event の名前、残りのキーワード引数が記録する値です。
+clock は今の時刻[s]を返す関数です（driver.getTime など）。None なら実際の時間（time.monotonic）を使います。
+"""
+class CarLogger():
+    def __init__(self, logger, interval, clock=None):
+        self.logger   = logger
+        self.interval = interval
+        self.clock    = clock if clock is not None else time.monotonic
+        self.last_time  = {} # event -> 前回表示した時刻
+        self.suppressed = {} # event -> 前回表示してから間引いた回数
+
+    """ 同じ event のログを表示する最短の間隔[s]を変えます """
+    def setInterval(self, interval):
+        self.interval = interval
+
+    def log(self, level, event, fields):
+        # 表示しないレベルなら、ここで終わり（ほとんど時間はかかりません）
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = 0
+        if self.interval > 0:
+            now = self.clock()
+            last = self.last_time.get(event)
+            # 時刻が戻ったとき（シミュレーションを最初からやり直したとき）は、間引かずに表示します
+            if last is not None and 0.0 <= now - last < self.interval:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return
+            self.last_time[event] = now
+            suppressed = self.suppressed.pop(event, 0)
+        self.logger.log(level, event, extra={"fields": fields, "suppressed": suppressed})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, fields)
+
+
+_listener = None
+_handler  = None
+
+
+"""
+ログの出力先を準備します（getLogger() が最初に呼ばれたときに、既定の設定で自動的に呼ばれます）。
+stream に書き込むのは裏のスレッドで、プログラムが終わるときに残りを全部書き出します。
+"""
+def setup(level=DEFAULT_LEVEL, stream=None, json_lines=(DEFAULT_FORMAT == "json")):
+    global _listener, _handler
+    shutdown()
+    writer = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    writer.setFormatter(StructuredFormatter(json_lines))
+    log_queue = queue.Queue(QUEUE_SIZE)
+    _handler  = BufferedQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, writer)
+    _listener.start()
+
+    root = logging.getLogger("car")
+    root.handlers[:] = [_handler]
+    root.setLevel(level)
+    root.propagate = False
+
+
+""" 貯まっているログを全部書き出して、裏のスレッドを止めます """
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _handler.dropped_count:
+            print("car_logger: dropped %d records (queue full)" % _handler.dropped_count)
+
+
+atexit.register(shutdown)
+
+
+"""
+名前 name のロガーを返します。interval は同じ event を表示する最短の間隔[s]です。
+clock には、シミュレーションの時刻を返す関数（driver.getTime）を渡してください。
+"""
+def getLogger(name, interval=None, clock=None):
+    if _listener is None:
+        setup()
+    if interval is None:
+        interval = DEFAULT_INTERVAL
+    return CarLogger(logging.getLogger("car." + name), interval, clock)
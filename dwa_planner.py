@@ -0,0 +1,185 @@
+"""
+ダイナミックウィンドウ法（DWA: Dynamic Window Approach）で、次の速度とハンドルの角度を選ぶ部品です（run3 で使います）。
+
+  1. 候補を作る : (速度, ハンドルの角度) の組をたくさん用意します。
+                  速度は、今の速度から window_time[s] の間に加速・減速して届く範囲（ダイナミックウィンドウ）だけを使います。
+  2. 先を読む   : 候補ごとに、その速度とハンドルのまま horizon[s] 走ったときの道すじを、
+                  robot_car_auto_04_proto.py と同じアッカーマン（自転車モデル）の式で dt[s] ごとに計算します。
+  3. 採点する   : 道すじと LiDAR の点の距離を、全部の候補・全部の点についてまとめて NumPy で計算し、
+                    heading   : カメラの線を追うハンドルの角度（target_steer）に近いほど高い
+                                （黄色い線は車の左にあるので、target_steer より左の候補は line_side_factor 倍だけ低くします。
+                                  障害物を左からよけて線を越えると、カメラが線を見失ってしまうためです）
+                    clearance : 障害物から離れて通るほど高い（clearance_cap[m] より離れていれば同じ）
+                    velocity  : 速いほど高い
+                    smooth    : 前回選んだハンドルの角度に近いほど高い（左右に迷ってふらつかないように）
+                  の重み付きの合計が一番高い候補を選びます。
+                  道すじの途中で障害物にぶつかる候補は、ぶつからない候補が1つも無いときだけ、
+                  しかもぶつかる前に止まれる（v² <= 2 * 減速度 * ぶつかるまでの道のり）ものだけを使います。
+
+【車の形】車は、車の位置（後ろの車軸）から LiDAR（前の端）までに並べた circles 個の円（半径 = 車幅の半分 + margin）で表します。
+前の端だけを調べると、障害物の横を通り過ぎるときに、カーブの内側を通る車の後ろの方がぶつかってしまうためです。
+
+【速さ】速度とハンドルの角度の格子は決まっているので、全部の候補の道すじは最初に1回だけ計算しておき（rollouts）、
+毎回はダイナミックウィンドウに入る行だけを取り出して採点します。
+レーザーが max_rays 本より多い LiDAR では、間引いて max_rays 本くらいにします（円の大きさより十分細かいので）。
+ウィンドウに入る速度 5〜8 段 x 角度 41 段 = 200〜330 候補、180 本の LiDAR なら 1回 数ms で、30ms のセンサの周期に収まります。
+
+【座標のきまり】lidar_processing と同じく、車の座標は x が前、y が右（プラス）です。ハンドルの角度もプラスが右です。
+原点は車の位置（後ろの車軸）で、LiDAR はそこから sensor_offset[m] 前にあります。
+"""
+import math
+import time
+
+import numpy as np
+
+
+class DwaPlanner():
+    def __init__(self, max_speed, wheelbase=2.995, car_width=2.015, sensor_offset=3.6,
+                 max_steering=0.5, speed_samples=31, steering_samples=41, horizon=2.0, dt=0.1,
+                 max_accel=4.0, max_decel=4.0, window_time=0.5, margin=0.3, circles=3, max_rays=180,
+                 clearance_cap=3.0, heading_weight=1.0, clearance_weight=1.5, velocity_weight=0.3,
+                 smooth_weight=0.3, line_side_factor=1.5):
+        self.max_speed     = max_speed     # 一番速い速度[m/s]
+        self.wheelbase     = wheelbase     # ホイールベース[m]（PROTOファイルの値）
+        self.sensor_offset = sensor_offset # 車の位置から LiDAR（車の前の端）までの距離[m]
+        self.radius        = 0.5 * car_width + margin # 車の円の中心からこれより近い LiDAR の点には「ぶつかる」
+        self.half_width    = 0.5 * car_width
+        self.max_steering  = max_steering
+        self.horizon, self.dt = horizon, dt
+        self.max_accel, self.max_decel = max_accel, max_decel
+        self.window_time   = window_time
+        self.circles       = circles
+        self.max_rays      = max_rays
+        self.clearance_cap = clearance_cap
+        self.heading_weight   = heading_weight
+        self.clearance_weight = clearance_weight
+        self.velocity_weight  = velocity_weight
+        self.smooth_weight    = smooth_weight
+        self.line_side_factor = line_side_factor
+
+        # 候補の格子（速度の行 x ハンドルの角度の列）
+        self.speeds    = np.linspace(0.0, max_speed, speed_samples)
+        self.steerings = np.linspace(-max_steering, max_steering, steering_samples)
+        self.rollouts  = self.rollOut(self.speeds, self.steerings)
+        self.rollout_sq = (self.rollouts ** 2).sum(axis=3) # 道すじの点の |a|²（距離の計算で使います）
+
+        # 前回の計算の様子（ログ・ベンチマーク用）
+        self.elapsed_ns       = 0
+        self.candidate_count  = 0 # 採点した候補の数
+        self.admissible_count = 0 # そのうち、使える候補の数
+        self.collision_free   = True # 使った候補が、道すじの最後までぶつからないものなら True
+        self.clearance        = math.inf # 選んだ候補の、障害物までのすきま[m]
+        self.steering         = 0.0 # 前回選んだハンドルの角度[rad]
+
+    """
+    全部の (速度, ハンドルの角度) の候補の道すじを、アッカーマンの式で計算します。
+    1コマ dt[s] ごとに、向き ψ += v * tan(δ) / ホイールベース * dt、位置 += v * (cos ψ, sin ψ) * dt です。
+    (速度の数, 角度の数, 点の数, 2) の配列を返します。点は「コマ（今を含めて horizon/dt + 1 個）x 車の円」の順に並びます。
+    """
+    def rollOut(self, speeds, steerings):
+        steps = int(round(self.horizon / self.dt))
+        v = speeds[:, None, None]
+        yaw_rate = v * np.tan(steerings)[None, :, None] / self.wheelbase
+        yaw = yaw_rate * (np.arange(steps + 1) * self.dt)                   # 各コマの向き（今は 0）
+        # 車の位置（後ろの車軸）の道すじ: 向きを変えてから進む（04_proto と同じ順番）
+        x = np.concatenate([np.zeros_like(yaw[:, :, :1]),
+                            np.cumsum(v * self.dt * np.cos(yaw[:, :, 1:]), axis=2)], axis=2)
+        y = np.concatenate([np.zeros_like(yaw[:, :, :1]),
+                            np.cumsum(v * self.dt * np.sin(yaw[:, :, 1:]), axis=2)], axis=2)
+        # 車の円は、車の位置から向きの方へ 0 〜 sensor_offset[m] 前に並んでいます
+        offsets = np.linspace(0.0, self.sensor_offset, self.circles)
+        circle_x = x[..., None] + offsets * np.cos(yaw)[..., None]
+        circle_y = y[..., None] + offsets * np.sin(yaw)[..., None]
+        rollouts = np.stack([circle_x, circle_y], axis=4).astype(np.float32)
+        return rollouts.reshape(len(speeds), len(steerings), (steps + 1) * self.circles, 2)
+
+    """
+    今の速度 speed[m/s] から window_time[s] の間に届く速度の行の範囲 (start, end) を返します。
+    speed_limit[m/s] より速い行は使いません（速すぎるときは、なるべく速く減速する行だけになります）。
+    """
+    def speedWindow(self, speed, speed_limit):
+        low  = max(0.0, speed - self.max_decel * self.window_time)
+        high = min(speed_limit, self.max_speed, speed + self.max_accel * self.window_time)
+        low  = min(low, high)
+        spacing = self.speeds[1] - self.speeds[0] if len(self.speeds) > 1 else 1.0
+        start = int(np.searchsorted(self.speeds, low - 0.5 * spacing))
+        end   = int(np.searchsorted(self.speeds, high + 0.5 * spacing, side="right"))
+        start = min(start, len(self.speeds) - 1)
+        return start, max(end, start + 1)
+
+    """ LiDAR の距離データ ranges を、道すじまで届きそうな範囲の点（車の座標、M x 2）にします """
+    def scanPoints(self, ranges, geometry, reach):
+        stride = max(1, -(-geometry.width // self.max_rays)) # 切り上げの割り算
+        ranges = np.asarray(ranges, dtype=np.float32)[::stride]
+        near = ranges < reach # inf と nan はここで外れます
+        r = ranges[near]
+        return np.stack([self.sensor_offset + r * geometry.cos[::stride][near],
+                         r * geometry.sin[::stride][near]], axis=1).astype(np.float32)
+
+    """
+    次の速度[m/s]とハンドルの角度[rad]を選んで (速度, 角度) を返します。
+      ranges       : lidar.getRangeImage()
+      geometry     : lidar_processing.getLidarGeometry() で作った LidarGeometry
+      speed        : 今の速度[m/s]
+      target_steer : カメラの線を追うためのハンドルの角度（これに近い候補ほど点数が高い）
+      speed_limit  : この速度[m/s]より速い候補は使いません（カーブの手前の減速など）
+      extra_points : LiDAR の点に加えて調べる点（車の座標、M x 2）。もう LiDAR に見えない、地図で覚えている障害物など
+    使える候補が1つも無いときは、速度 0（急ブレーキ）と、一番すきまの大きいハンドルの角度を返します。
+    """
+    def plan(self, ranges, geometry, speed, target_steer, speed_limit=None, extra_points=None):
+        start_time = time.perf_counter_ns()
+        if speed_limit is None:
+            speed_limit = self.max_speed
+        start, end = self.speedWindow(speed, speed_limit)
+        speeds     = self.speeds[start:end]
+        rollouts   = self.rollouts[start:end]                                 # (速度, 角度, 点, 2)
+        rollout_sq = self.rollout_sq[start:end]
+        reach = speeds[-1] * self.horizon + self.radius + self.clearance_cap # これより遠い点は関係ありません
+        points = self.scanPoints(ranges, geometry, reach)
+        if extra_points is not None and len(extra_points) > 0:
+            points = np.concatenate([points, np.asarray(extra_points, dtype=np.float32)])
+
+        if len(points) == 0:
+            dist = np.full(rollout_sq.shape, np.inf, dtype=np.float32)
+        else:
+            # 道すじの点 a と LiDAR の点 b の距離² |a - b|² = |a|² + |b|² - 2 a・b を、全部の組についてまとめて計算し、
+            # 道すじの点ごとに一番近い LiDAR の点までの距離を取ります。
+            # a・b の部分は行列の掛け算1回で済むので、引き算で (a - b) の配列を作るよりずっと速くなります。
+            cross = rollouts.reshape(-1, 2) @ (-2.0 * points.T)            # (候補の点, LiDAR の点)
+            cross += (points * points).sum(axis=1)
+            dist_sq = cross.min(axis=1).reshape(rollout_sq.shape) + rollout_sq
+            dist = np.sqrt(np.maximum(dist_sq, 0.0))                       # (速度, 角度, 点)
+
+        # ぶつからない候補を使います。1つも無ければ、ぶつかるまでに止まれる候補を使います
+        hit = dist < self.radius
+        collision_free = ~hit.any(axis=2)
+        admissible = collision_free
+        if not collision_free.any():
+            hit_step = hit.argmax(axis=2) // self.circles
+            travel = speeds[:, None] * self.dt * hit_step                   # ぶつかるまでの道のり[m]
+            admissible = speeds[:, None] ** 2 <= 2.0 * self.max_decel * travel
+        clearance = np.clip(dist.min(axis=2) - self.half_width, 0.0, self.clearance_cap)
+
+        error = self.steerings - target_steer
+        error = np.where(error < 0.0, -self.line_side_factor * error, error) # 左（マイナス）へのずれは重く
+        heading = 1.0 - error[None, :] / (2.0 * self.max_steering)
+        score = self.heading_weight * heading + \
+            self.clearance_weight * clearance / self.clearance_cap + \
+            self.velocity_weight * (speeds / self.max_speed)[:, None]
+        score -= self.smooth_weight * np.abs(self.steerings - self.steering)[None, :] / (2.0 * self.max_steering)
+        score = np.where(admissible, score, -np.inf)
+
+        self.candidate_count  = score.size
+        self.admissible_count = int(np.count_nonzero(admissible))
+        self.collision_free   = bool(collision_free.any())
+        if self.admissible_count == 0:
+            column = int(np.argmax(clearance.max(axis=0)))
+            self.clearance = float(clearance[:, column].max())
+            self.steering = float(self.steerings[column])
+            self.elapsed_ns = time.perf_counter_ns() - start_time
+            return 0.0, self.steering
+        row, column = np.unravel_index(int(np.argmax(score)), score.shape)
+        self.clearance = float(clearance[row, column])
+        self.steering = float(self.steerings[column])
+        self.elapsed_ns = time.perf_counter_ns() - start_time
+        return float(speeds[row]), self.steering
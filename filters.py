@@ -0,0 +1,122 @@
+"""
+センサの値や指令値のふらつきを滑らかにするフィルタをまとめたモジュールです。
+
+どのフィルタも、最初に決めた大きさの箱（リングバッファ）を使い回すので、
+list.append() / list.pop(0) のように毎回メモリを確保したり、要素をずらしたりしません。
+  "sma"    : 単純移動平均（過去N回の平均）。合計を覚えておくので、1回の計算は N に関係なく一定です。
+  "ema"    : 指数移動平均（新しい値ほど重く平均する）。係数 alpha（0〜1）が大きいほど新しい値を信じます。
+  "median" : 過去N回の中央値。1回だけ飛び出したおかしな値を無視できます。
+"""
+
+
+""" 単純移動平均フィルタ（過去 size 回の平均） """
+class MovingAverageFilter():
+    def __init__(self, size):
+        self.size   = size
+        self.buffer = [0.0] * size # 過去の値を入れておく箱（一周したら古い値から上書きします）
+        self.reset()
+
+    """ 覚えている値を全部忘れます """
+    def reset(self):
+        self.index = 0   # 次に書き込む箱の番号
+        self.count = 0   # 箱に入っている値の数（最大 size）
+        self.total = 0.0 # 箱に入っている値の合計
+
+    """ 新しい値を入れて、平均を返します """
+    def update(self, value):
+        if self.count == self.size:
+            self.total -= self.buffer[self.index] # 一番古い値を合計から引く
+        else:
+            self.count += 1
+        self.buffer[self.index] = value
+        self.total += value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            # 足し算・引き算を繰り返すと小数の誤差がたまるので、一周ごとに合計を計算し直します
+            if self.count == self.size:
+                self.total = sum(self.buffer)
+        return self.total / self.count
+
+
+""" 指数移動平均フィルタ """
+class EmaFilter():
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.reset()
+
+    """ 覚えている値を忘れます """
+    def reset(self):
+        self.value = None
+
+    """ 新しい値を入れて、平均を返します """
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+""" 中央値フィルタ（過去 size 回の中央値） """
+class MedianFilter():
+    def __init__(self, size):
+        self.size    = size
+        self.buffer  = [0.0] * size
+        self.scratch = [0.0] * size # 並べ替え用の作業場所（これも使い回します）
+        self.reset()
+
+    """ 覚えている値を全部忘れます """
+    def reset(self):
+        self.index = 0
+        self.count = 0
+
+    """ 新しい値を入れて、中央値を返します """
+    def update(self, value):
+        self.buffer[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+        # 箱がいっぱいになるまで（最初の size-1 回）は、入っている値だけで中央値を出します
+        if self.count < self.size:
+            values = sorted(self.buffer[:self.count])
+            return values[self.count // 2]
+
+        # 作業場所に写して並べ替え、真ん中の値を取り出します
+        self.scratch[:] = self.buffer
+        self.scratch.sort()
+        return self.scratch[self.size // 2]
+
+
+"""
+フィルタの種類（"sma", "ema", "median"）と設定値から、フィルタを作ります。
+"sma", "median" の設定値は過去何回分か、"ema" の設定値は係数 alpha です。
+"""
+def makeFilter(kind, param):
+    if kind == "sma":
+        return MovingAverageFilter(int(param))
+    if kind == "ema":
+        return EmaFilter(float(param))
+    if kind == "median":
+        return MedianFilter(int(param))
+    raise ValueError("unknown filter type: %r" % (kind,))
+
+
+"""
+複数の信号（操舵角、障害物の距離、速度など）のフィルタをまとめて持つ入れ物です。
+config は {信号の名前: (フィルタの種類, 設定値)} の辞書です。
+"""
+class FilterBank():
+    def __init__(self, config):
+        self.filters = {}
+        for channel, (kind, param) in config.items():
+            self.filters[channel] = makeFilter(kind, param)
+
+    """ 信号 channel に新しい値を入れて、フィルタを通した値を返します """
+    def update(self, channel, value):
+        return self.filters[channel].update(value)
+
+    """ 信号 channel のフィルタが覚えている値を忘れます """
+    def reset(self, channel):
+        self.filters[channel].reset()
@@ -0,0 +1,194 @@
+"""
+PID制御のゲインと反発力のゲインを、たくさんの組み合わせでまとめて試すプログラムです。
+
+これまでは Webots で1回ずつ走らせて、手で調整していました。
+gain_sweep.py は、にせものの Webots（webots_stub）の作り物のコースで RobotCar を走らせて、
+ゲインの組み合わせごとに
+  lap_time   : 1周にかかった時間[s]（1周できなければ空欄）
+  cte_rms    : 車線の真ん中からのずれ（クロストラック誤差）の二乗平均[m]
+  cte_max    : 車線の真ん中からのずれの最大値[m]
+  collisions : 障害物にぶつかった回数
+を測り、良い順に並べて表示します。組み合わせごとに別のプロセスで動かすので、CPUのコアの数だけ速くなります。
+
+試すゲイン（RobotCar のクラス定数）: TARGET_POS, PID_KP, PID_KI, PID_KD, K_REP
+
+使い方:
+  python gain_sweep.py                                       # 既定の格子（全部の組み合わせ）
+  python gain_sweep.py --kd 1,2,3 --ki 0,0.01 --k-rep 2,3,5  # 試す値を指定（カンマ区切り）
+  python gain_sweep.py --random 64                           # 既定の範囲からランダムに64通り
+  python gain_sweep.py --processes 8 --duration 90 --out sweep.json
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+# 試すゲインと、格子（--grid）の既定の値・ランダム（--random）の範囲
+PARAMS = {
+    "TARGET_POS": {"grid": [0.25],            "range": (0.15, 0.35)},
+    "PID_KP":     {"grid": [0.5, 1.0, 1.5],   "range": (0.3, 2.0)},
+    "PID_KI":     {"grid": [0.0, 0.01],       "range": (0.0, 0.03)},
+    "PID_KD":     {"grid": [1.0, 2.0, 3.0],   "range": (0.0, 4.0)},
+    "K_REP":      {"grid": [3.0],             "range": (1.0, 6.0)},
+}
+LANE_OFFSET = 1.0     # 車線の真ん中は、黄色い線の右側 1.0[m]（ここからスタートします）
+OBSERVE_EVERY = 3     # 採点する間隔[コマ]（10msのコマなら30msごと。RobotCar の制御の周期と同じ）
+CAR_RADIUS  = 1.2     # ぶつかったかどうかを調べるときの、車の大きさ（半径[m]）
+OBSTACLE_PLACES = [(150.0, 0.0, 0.8), (300.0, 0.5, 0.8), (420.0, -0.5, 1.0)] # (道のり[m], 車線の真ん中からのずれ[m], 半径[m])
+FAILED_LAP_PENALTY = 1000.0 # 1周できなかったときの点数（大きいほど悪い）
+CTE_WEIGHT = 20.0           # 点数に足す cte_rms の重み
+COLLISION_PENALTY = 100.0   # ぶつかった1回あたりの点数
+
+
+"""
+走りを採点する入れ物です。webots_stub の World に addObserver で登録すると、1コマごとに呼ばれます。
+"""
+class LapObserver():
+    def __init__(self, world, obstacles):
+        self.world = world
+        self.obstacles = obstacles
+        self.previous = None
+        self.distance = 0.0 # 進んだ道のり[m]（コースに沿って）
+        self.lap_time = None
+        self.cte_sum_sq = 0.0
+        self.cte_max = 0.0
+        self.samples = 0
+        self.collisions = 0
+        self.touching = False
+
+    def __call__(self, world):
+        if world.step_count % OBSERVE_EVERY:
+            return
+        x, y, _ = world.pose()
+        track = world.track
+        progress, line_dist = track.locate((x, y))
+        if self.previous is not None:
+            # 1周の切れ目をまたいだときも、進んだ分だけ足します
+            delta = (progress - self.previous + 0.5 * track.perimeter) % track.perimeter - 0.5 * track.perimeter
+            self.distance += delta
+            if self.lap_time is None and self.distance >= track.perimeter:
+                self.lap_time = world.time
+        self.previous = progress
+
+        # クロストラック誤差は、線からの距離と車線の真ん中（LANE_OFFSET）との差です
+        cte = abs(line_dist - LANE_OFFSET)
+        self.cte_sum_sq += cte * cte
+        self.cte_max = max(self.cte_max, cte)
+        self.samples += 1
+
+        # 障害物に触れた瞬間だけ数えます（触れている間ずっと数えないように）
+        touching = any(math.hypot(x - ox, y - oy) < r + CAR_RADIUS for ox, oy, r in self.obstacles)
+        if touching and not self.touching:
+            self.collisions += 1
+        self.touching = touching
+
+
+"""
+1つのゲインの組み合わせで走らせて、結果の辞書を返します（別のプロセスで呼ばれます）。
+"""
+def evaluate(job):
+    gains, duration, script, run = job
+    os.environ["CAR_LOG_LEVEL"] = "ERROR" # ログは表示しません
+    import webots_stub
+
+    track = webots_stub.Track()
+    obstacles = []
+    for s, offset, radius in OBSTACLE_PLACES:
+        x, y, _ = track.pointAt(s, LANE_OFFSET + offset)
+        obstacles.append((x, y, radius))
+    world = webots_stub.install(webots_stub.World(duration=duration, track=track, obstacles=obstacles,
+                                                  start_pose=track.startPose(LANE_OFFSET)))
+    observer = LapObserver(world, obstacles)
+    world.addObserver(observer)
+
+    import importlib
+    module = importlib.import_module(script)
+    module.RobotCar.USE_PERCEPTION_WORKER = False
+    for name, value in gains.items():
+        setattr(module.RobotCar, name, value)
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        robot_car = module.RobotCar()
+        getattr(robot_car, run)()
+    cte_rms = math.sqrt(observer.cte_sum_sq / max(observer.samples, 1))
+    lap_time = observer.lap_time
+    score = (lap_time if lap_time is not None else FAILED_LAP_PENALTY) + \
+        CTE_WEIGHT * cte_rms + COLLISION_PENALTY * observer.collisions
+    return {"gains": gains, "lap_time": lap_time, "cte_rms": cte_rms, "cte_max": observer.cte_max,
+            "collisions": observer.collisions, "distance": observer.distance, "score": score,
+            "wall_time": time.perf_counter() - start}
+
+
+""" 指定した値の全部の組み合わせ（格子）を作ります """
+def gridConfigs(values):
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+""" 範囲の中からランダムに count 通りの組み合わせを作ります（seed が同じなら同じ組み合わせ） """
+def randomConfigs(count, seed):
+    rng = random.Random(seed)
+    return [{name: round(rng.uniform(*spec["range"]), 4) for name, spec in PARAMS.items()}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RobotCar のゲインをまとめて試します")
+    for name in PARAMS:
+        parser.add_argument("--" + name.lower().replace("_", "-").replace("pid-", ""), dest=name,
+                            help="%s の値（カンマ区切り。既定 %s）" % (name, PARAMS[name]["grid"]))
+    parser.add_argument("--random", type=int, help="格子の代わりに、範囲からランダムに選ぶ数")
+    parser.add_argument("--seed", type=int, default=0, help="ランダムに選ぶときの種")
+    parser.add_argument("--duration", type=float, default=90.0, help="1回の走行の時間[s]（シミュレーションの時間）")
+    parser.add_argument("--script", default="robot_car_auto_02", help="RobotCar を読み込むスクリプト")
+    parser.add_argument("--run", default="run2", choices=["run1", "run2", "run3"], help="使う走り方")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="同時に動かすプロセスの数")
+    parser.add_argument("--top", type=int, default=20, help="表示する数")
+    parser.add_argument("--out", help="全部の結果を保存する JSON ファイル")
+    args = parser.parse_args()
+
+    if args.random:
+        configs = randomConfigs(args.random, args.seed)
+    else:
+        values = {}
+        for name, spec in PARAMS.items():
+            text = getattr(args, name)
+            values[name] = [float(v) for v in text.split(",")] if text else spec["grid"]
+        configs = gridConfigs(values)
+
+    print("%d configurations, %d processes, %.0f s each" % (len(configs), args.processes, args.duration))
+    jobs = [(gains, args.duration, args.script, args.run) for gains in configs]
+    start = time.perf_counter()
+    results = []
+    # 1つのプロセスで走らせるのは1回だけにします（RobotCar のクラス定数を書き換えるため）
+    with multiprocessing.Pool(args.processes, maxtasksperchild=1) as pool:
+        for i, result in enumerate(pool.imap_unordered(evaluate, jobs), 1):
+            results.append(result)
+            print("\r%d/%d done" % (i, len(jobs)), end="", flush=True)
+    elapsed = time.perf_counter() - start
+    print("\nfinished in %.1f s (%.1f s of simulation per second)" % \
+        (elapsed, len(jobs) * args.duration / elapsed))
+
+    results.sort(key=lambda r: r["score"])
+    names = list(PARAMS)
+    print("%4s " % "rank" + " ".join("%10s" % n for n in names) +
+          " %9s %8s %8s %10s %8s" % ("lap[s]", "cte_rms", "cte_max", "collisions", "score"))
+    for rank, result in enumerate(results[:args.top], 1):
+        lap = "%9.1f" % result["lap_time"] if result["lap_time"] is not None else "%9s" % "-"
+        print("%4d " % rank + " ".join("%10.4g" % result["gains"][n] for n in names) +
+              " %s %8.3f %8.3f %10d %8.1f" % (lap, result["cte_rms"], result["cte_max"],
+                                              result["collisions"], result["score"]))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+        print("results saved to %s" % args.out)
+
+
+if __name__ == '__main__':
+    main()
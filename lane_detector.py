@@ -0,0 +1,357 @@
+"""
+黄色ライン検出の部品をまとめたモジュールです。
+robot_car_auto_02.py / robot_car_auto_03.py の RobotCar.calcSteeringAngle から使います。
+
+1画素ずつPythonのforループで調べると、128x64の画像でも数十ミリ秒かかってしまい、
+センサ周期（TIME_STEP=30ms）に間に合いません。
+そこで、NumPyを使って「画像全体をまとめて一度に」計算する方法を用意しています。
+（Webotsの controller / vehicle モジュールは使わないので、単体でベンチマークできます）
+
+検出の方法（バックエンド）は LaneDetector の backend で選べます。
+  "python" : 1画素ずつ colorDiff で調べる元の方法（遅いですが、答え合わせ用）
+  "numpy"  : colorMask で画像全体をまとめて調べる方法
+  "lut"    : 色の早見表（ColorLUT）を引く方法（速いですが、しきい値の近くの色は colorDiff と答えが違うことがあります）
+  "opencv" : OpenCV の inRange でマスクを作り、moments で重心を求める方法
+"""
+import numpy as np
+
+
+"""
+画素と目標の色の差の平均を計算（RobotCar.colorDiff と同じ計算）
+"""
+def colorDiff(pixel, color):
+    diff = 0
+    for i in range(0, 3):
+        diff += abs(int(pixel[i]) - int(color[i]))
+    return diff / 3
+
+
+"""
+【元の方法】1画素ずつ調べて、黄色い点の「X座標の合計」と「個数」を返します。
+画像の上から y_start 行目より下だけを調べます。
+"""
+def scanLinePython(image, color, threshold, y_start):
+    height, width = image.shape[0], image.shape[1]
+    sumx = 0
+    pixel_count = 0
+    for y in range(y_start, height):
+        for x in range(0, width):
+            if colorDiff(image[y, x], color) < threshold:
+                sumx += x
+                pixel_count += 1
+    return sumx, pixel_count
+
+
+"""
+【元の方法】1画素ずつ調べて、黄色の画素を True にしたマスクを作ります（答え合わせ用）。
+"""
+def maskPython(roi, color, threshold):
+    mask = np.zeros(roi.shape[:2], dtype=bool)
+    for y in range(0, roi.shape[0]):
+        for x in range(0, roi.shape[1]):
+            if colorDiff(roi[y, x], color) < threshold:
+                mask[y, x] = True
+    return mask
+
+
+"""
+【NumPyの方法】画像 roi のうち、目標の色とのズレが threshold 未満の画素を True にした「マスク」を返します。
+"""
+def colorMask(roi, color, threshold):
+    # B, G, R それぞれのズレの絶対値を足し合わせます（colorDiff の diff と同じ値）。
+    # uint8のまま引き算すると 0-1=255 のように桁あふれするので、int16に変換してから引きます。
+    # （.sum(axis=2) で3色をまとめて足すより、1色ずつ足す方がずっと速いです）
+    diff = np.abs(roi[:, :, 0].astype(np.int16) - int(color[0]))
+    for i in range(1, 3):
+        diff += np.abs(roi[:, :, i].astype(np.int16) - int(color[i]))
+
+    # 「diff/3 < threshold」は「diff < threshold*3」と同じです。割り算をしない分、速くなります。
+    return diff < threshold * 3
+
+
+"""
+マスクから、黄色い点の「X座標の合計」と「個数」を計算します。
+"""
+def lineCentroid(mask, x_offset=0):
+    # 列ごとに黄色い点の個数を数え、X座標をかけて合計すると sumx になります。
+    # x_offset は、マスクが画像の途中の列から始まるとき（追跡窓）の左端のX座標です。
+    column_count = np.count_nonzero(mask, axis=0)
+    pixel_count = int(column_count.sum())
+    sumx = int(np.dot(column_count, np.arange(x_offset, x_offset + mask.shape[1])))
+    return sumx, pixel_count
+
+
+"""
+【NumPyの方法】画像全体をまとめて計算して、scanLinePython と同じ (sumx, pixel_count) を返します。
+"""
+def scanLineNumpy(image, color, threshold, y_start):
+    # 調べる範囲（道路がある下の方）を切り出してから計算します。
+    return lineCentroid(colorMask(image[y_start:], color, threshold))
+
+
+"""
+マスク（True/False）の「行ごと」に、黄色い点の個数とX座標の合計を計算します。
+行ごとの値を全部足すと lineCentroid と同じ (sumx, pixel_count) になるので、1回の計算で両方がわかります。
+マスクに「横幅 x 2」の表 [1, X座標] をかける行列の掛け算1回で、個数と合計を同時に求めます
+（NumPyの行列計算（BLAS）はとても速いので、列ごとに数える lineCentroid よりも速く終わります）。
+（float32 で計算しますが、横幅が数千ピクセルまでなら誤差なく整数のままです）
+"""
+def rowCentroids(mask, x_offset=0):
+    sums = rowSums(mask, x_offset)
+    return sums[:, 0], sums[:, 1]
+
+
+""" rowCentroids の中身です。[行ごとの個数, 行ごとのX座標の合計] を (行の数 x 2) の1つの配列で返します """
+def rowSums(mask, x_offset=0):
+    weights = np.empty((mask.shape[1], 2), dtype=np.float32)
+    weights[:, 0] = 1.0
+    weights[:, 1] = np.arange(x_offset, x_offset + mask.shape[1])
+    return np.dot(mask.astype(np.float32), weights)
+
+
+"""
+【OpenCVの方法】colorMask と同じマスクを、OpenCVの関数で作ります（255=黄色, 0=それ以外）。
+BGRAの画像にそのまま inRange をかけると「各色が±しきい値の箱の中か」という別の判定になってしまうので、
+absdiff で色のズレを求め、transform で B+G+R を足してから、inRange で「しきい値*3 未満」を取り出します。
+（足し算の結果は255で頭打ちになりますが、しきい値*3 が255より小さければ判定は変わりません）
+"""
+def colorMaskOpenCV(cv2, roi, color, threshold):
+    channels = roi.shape[2]
+    diff = cv2.absdiff(roi, (float(color[0]), float(color[1]), float(color[2]), 0.0)[:channels])
+    weight = np.array([[1.0, 1.0, 1.0, 0.0][:channels]], dtype=np.float32) # アルファは足さない
+    total = cv2.transform(diff, weight)
+    return cv2.inRange(total, 0, threshold * 3 - 1)
+
+
+"""
+【OpenCVの方法】マスクの moments から、黄色い点の「X座標の合計」と「個数」を計算します。
+m00 が点の個数、m10 がX座標の合計です（binaryImage=True なら 0以外を1として数えます）。
+"""
+def lineCentroidOpenCV(cv2, mask, x_offset=0):
+    moments = cv2.moments(mask, True)
+    pixel_count = int(round(moments["m00"]))
+    sumx = int(round(moments["m10"])) + x_offset * pixel_count
+    return sumx, pixel_count
+
+
+"""
+色の早見表（3次元ルックアップテーブル）
+B, G, R をそれぞれ 2**bits 段階（bits=6なら64段階）に粗くして、
+「この色は黄色か？」の答えを 64x64x64 の表に最初に書き込んでおきます。
+毎フレームの判定は、表を引くだけ（NumPyのインデックス参照1回）で終わります。
+※ bits=8 にすると粗くしない（colorDiff と完全に同じ）表になりますが、16MB使います。
+"""
+class ColorLUT():
+    def __init__(self, colors, threshold, bits=6):
+        self.bits  = bits
+        self.shift = 8 - bits # 0〜255 を 0〜(2**bits-1) にするための右シフト量
+        self.build(colors, threshold)
+
+    """
+    早見表を作り直します。目標の色やしきい値を変えたときに呼びます。
+    colors に複数の色を渡すと「どれか1色に近ければ True」の表になります（毎フレームの計算量は同じです）。
+    """
+    def build(self, colors, threshold):
+        self.colors    = [list(color) for color in colors]
+        self.threshold = threshold
+
+        levels = 1 << self.bits
+        step   = 1 << self.shift
+        # 各段階の代表値（段階の真ん中の値）。例: bits=6 なら 0〜3 の代表は 1.5
+        values = np.arange(levels) * step + (step - 1) / 2.0
+
+        # 表の並びは [R][G][B] です（BGRAの4バイトを1つの整数として読むと、この順に並ぶため）。
+        table = np.zeros((levels, levels, levels), dtype=bool)
+        for color in self.colors:
+            # B, G, R のズレを1次元で計算してから、足し算を3次元に広げます（262144マスでも一瞬です）。
+            db = np.abs(values - color[0])
+            dg = np.abs(values - color[1])
+            dr = np.abs(values - color[2])
+            diff = dr[:, None, None] + dg[None, :, None] + db[None, None, :]
+            table |= diff < threshold * 3
+        self.table = table.ravel()
+
+    """ 画像 roi（BGRまたはBGRA）を表で引いて、黄色の画素を True にしたマスクを返します """
+    def classify(self, roi):
+        bits, shift = self.bits, self.shift
+        mask = (1 << bits) - 1
+        if roi.shape[2] == 4 and roi.strides[2] == 1 and roi.strides[1] == 4:
+            # BGRAの1画素（4バイト）を1つの32ビット整数として読むと、下から B, G, R, A の順に並んでいます。
+            # シフトとビットマスクで、各色の上位 bits ビットを取り出して並べると、そのまま表の番号になります。
+            pixel = roi.view(np.dtype('<u4'))[:, :, 0]
+            index = (pixel >> (16 + shift - 2 * bits)) & (mask << (2 * bits))
+            index |= (pixel >> (8 + shift - bits)) & (mask << bits)
+            index |= (pixel >> shift) & mask
+        else:
+            index = (roi[:, :, 2] >> shift).astype(np.int32)
+            index <<= bits
+            index |= roi[:, :, 1] >> shift
+            index <<= bits
+            index |= roi[:, :, 0] >> shift
+        return self.table.take(index)
+
+
+"""
+黄色ライン検出器
+カメラの大きさと探したい色を最初に覚えておき、毎フレーム scan() を呼び出します。
+backend で検出の方法（"python", "numpy", "lut", "opencv"）を選びます。
+
+【追跡窓】30msの間に線はほとんど動かないので、前のフレームで見つけた線の重心のまわり
+（左右 track_half_width の帯）だけを調べます。黄色い点が min_pixels 個より少ないときや、
+線が窓の左右の端にかかっている（窓の外まで続いていて切れている）ときは、画像全体を調べ直します。
+なので線が1本だけなら、追跡窓で済んだフレームでも、画像全体を調べたときと同じ重心と線の形になります。
+
+【線の形】行ごとの重心に2次式 x = c0 + c1*v + c2*v^2 を当てはめます（v は画面の一番下が0、上に行くほど大きい）。
+  lane_shape = (横ずれ c0, 向き c1, 曲がり具合 2*c2)。x は画面の横幅に対する割合（0.0〜1.0）です。
+遠くの行で線が曲がり始めていれば、曲がり具合（curvature）が大きくなるので、カーブの手前で減速できます。
+"""
+class LaneDetector():
+    BACKENDS = ("python", "numpy", "lut", "opencv")
+
+    def __init__(self, width, height, colors, threshold, backend="numpy",
+                 track_half_width=0.15, min_pixels=20, min_fit_rows=4):
+        if backend not in self.BACKENDS:
+            raise ValueError("unknown lane detector backend: %r" % (backend,))
+        self.width     = width
+        self.height    = height
+        # 空や遠くの景色を探しても無駄なので、画像の「上から1/3より下」だけを調べます。
+        self.y_start   = int(1.0 * height / 3.0)
+        self.backend   = backend
+        self.lut       = None
+        self.cv2       = None
+        if backend == "opencv":
+            import cv2 # OpenCVはこのバックエンドを選んだときだけ読み込みます
+            self.cv2 = cv2
+        self.setTarget(colors, threshold)
+
+        # 追跡窓の設定（track_half_width は画面の横幅に対する割合。0にすると追跡しません）
+        self.track_half_width = int(track_half_width * width)
+        self.min_pixels       = min_pixels
+        self.track_x          = None # 前のフレームで見つけた線の重心のX座標（見失ったらNone）
+
+        # 追跡窓だけで済んだフレームの数を数えます（節約できた計算量の目安）
+        self.frame_count = 0
+        self.fast_count  = 0
+
+        # 線の形の当てはめ用に、各行の v, v^2, v^3, v^4 を最初に計算しておきます（毎フレーム同じなので）
+        rows = np.arange(self.y_start, height)
+        v = (height - 1 - rows) / float(height)
+        self.row_powers   = np.stack([np.ones_like(v), v, v ** 2, v ** 3, v ** 4])
+        self.min_fit_rows = min_fit_rows
+        self.region_mask  = None  # 最後に調べた範囲のマスク（追跡窓の端に線がかかっているかを調べます）
+        self.row_sums     = None  # 最後のフレームの、行ごとの [個数, X座標の合計]（rowSums）
+        self.row_count    = None  # 最後のフレームの、行ごとの黄色い点の個数
+        self.row_sumx     = None  # 最後のフレームの、行ごとのX座標の合計
+        self.lane_shape   = None  # (offset, heading, curvature)。当てはめられないときはNone
+
+    """ 探したい色としきい値を変更します（早見表もここで作り直します） """
+    def setTarget(self, colors, threshold):
+        self.colors    = colors
+        self.threshold = threshold
+        if self.backend == "lut":
+            if self.lut is None:
+                self.lut = ColorLUT(colors, threshold)
+            else:
+                self.lut.build(colors, threshold)
+
+    """ 画像 roi の中で、探したい色の画素を True にしたマスクを返します """
+    def mask(self, roi):
+        if self.backend == "python":
+            # 元の方法は答え合わせ用なので、1色目だけを調べます
+            return maskPython(roi, self.colors[0], self.threshold)
+        if self.backend == "lut":
+            return self.lut.classify(roi)
+        if self.backend == "opencv":
+            mask = colorMaskOpenCV(self.cv2, roi, self.colors[0], self.threshold)
+            for color in self.colors[1:]:
+                mask |= colorMaskOpenCV(self.cv2, roi, color, self.threshold)
+            return mask
+        mask = colorMask(roi, self.colors[0], self.threshold)
+        for color in self.colors[1:]:
+            mask |= colorMask(roi, color, self.threshold)
+        return mask
+
+    """
+    画像 roi（左端のX座標が x_offset）の中の、黄色い点の「X座標の合計」と「個数」を返します。
+    同時に、行ごとの個数とX座標の合計を self.row_count / self.row_sumx に残します。
+    全体の合計は行ごとの値を足すだけなので、マスクを調べるのは rowCentroids の1回だけです。
+    """
+    def scanRegion(self, roi, x_offset=0):
+        mask = self.mask(roi)
+        if self.backend == "opencv":
+            mask = mask > 0 # OpenCVのマスクは 0/255 なので、True/False に直します
+        self.region_mask = mask
+        self.row_sums = rowSums(mask, x_offset)
+        self.row_count, self.row_sumx = self.row_sums[:, 0], self.row_sums[:, 1]
+        pixel_count, sumx = self.row_sums.sum(axis=0, dtype=np.float64).tolist()
+        return int(sumx), int(pixel_count)
+
+    """
+    行ごとの重心に2次式を当てはめて、(横ずれ, 向き, 曲がり具合) を返します。
+    黄色い点が多い行ほど信用する（重み付き最小二乗法）ので、点が0個の行は自動的に無視されます。
+    3x3の連立方程式は小さすぎてNumPyを呼ぶと逆に遅いので、クラメルの公式で普通に解きます。
+    """
+    def fitLaneShape(self):
+        rows_found = np.count_nonzero(self.row_count)
+        if rows_found < 2:
+            return None
+
+        # 重み付きの和 S[k] = Σ w*v^k と T[k] = Σ w*x*v^k（w*x は行ごとのX座標の合計）
+        # 行ごとの [個数, X座標の合計] の配列に v^k の表を1回かけるだけで、両方がまとめて求まります。
+        moments = np.dot(self.row_powers, self.row_sums).tolist()
+        s0, s1, s2, s3, s4 = [m[0] for m in moments]
+        t0, t1, t2 = [m[1] / self.width for m in moments[:3]]
+
+        # 行が少ないときは直線（曲がり具合0）を当てはめます
+        if rows_found < self.min_fit_rows:
+            det = s0 * s2 - s1 * s1
+            if det == 0.0:
+                return None
+            return (t0 * s2 - s1 * t1) / det, (s0 * t1 - s1 * t0) / det, 0.0
+
+        det = s0 * (s2 * s4 - s3 * s3) - s1 * (s1 * s4 - s3 * s2) + s2 * (s1 * s3 - s2 * s2)
+        if det == 0.0:
+            return None
+        c0 = (t0 * (s2 * s4 - s3 * s3) - s1 * (t1 * s4 - s3 * t2) + s2 * (t1 * s3 - s2 * t2)) / det
+        c1 = (s0 * (t1 * s4 - s3 * t2) - t0 * (s1 * s4 - s3 * s2) + s2 * (s1 * t2 - t1 * s2)) / det
+        c2 = (s0 * (s2 * t2 - t1 * s3) - s1 * (s1 * t2 - t1 * s2) + t0 * (s1 * s3 - s2 * s2)) / det
+        return c0, c1, 2.0 * c2
+
+    """ 黄色い点の「X座標の合計」と「個数」を返します（線の形は self.lane_shape に入ります） """
+    def scan(self, image):
+        self.frame_count += 1
+        roi = image[self.y_start:]
+
+        # 1. 前のフレームの重心のまわりだけを調べます（速い方法）
+        if self.track_x is not None and self.track_half_width > 0:
+            x0 = max(0, self.track_x - self.track_half_width)
+            x1 = min(self.width, self.track_x + self.track_half_width + 1)
+            sumx, pixel_count = self.scanRegion(roi[:, x0:x1], x0)
+            if pixel_count >= self.min_pixels and not self.touchesEdge(x0, x1):
+                self.fast_count += 1
+                self.track_x = sumx // pixel_count
+                self.lane_shape = self.fitLaneShape()
+                return sumx, pixel_count
+
+        # 2. 見失った・自信がないときは、今まで通り画像全体を調べます
+        sumx, pixel_count = self.scanRegion(roi)
+        self.track_x = sumx // pixel_count if pixel_count > 0 else None
+        self.lane_shape = self.fitLaneShape() if pixel_count > 0 else None
+        return sumx, pixel_count
+
+    """
+    追跡窓（左端 x0, 右端 x1 の手前まで）の左右の端の列に、黄色い点があるかどうかを返します。
+    端に点があるときは、線が窓の外まで続いていて途中で切れているので、重心や線の形がずれてしまいます。
+    （画像の端と同じ側は、その先に画素が無いので調べません）
+    """
+    def touchesEdge(self, x0, x1):
+        mask = self.region_mask
+        if x0 > 0 and mask[:, 0].any():
+            return True
+        return x1 < self.width and bool(mask[:, -1].any())
+
+    """ 追跡窓だけで済んだフレームの割合（0.0〜1.0）を返します """
+    def fastPathRatio(self):
+        if self.frame_count == 0:
+            return 0.0
+        return float(self.fast_count) / self.frame_count
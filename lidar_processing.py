@@ -0,0 +1,342 @@
+"""
+LiDAR（Sick LMS 291）の距離データを処理する部品をまとめたモジュールです。
+robot_car_auto_02.py / robot_car_auto_03.py の RobotCar.calcObstacleAngleDist から使います。
+
+レーザー1本ずつPythonのforループで調べる代わりに、NumPyで全部のレーザーをまとめて計算します。
+（Webotsの controller / vehicle モジュールは使わないので、単体でベンチマークできます）
+
+【座標のきまり】
+  レーザーの角度は RobotCar と同じく angle = (i / lidar_width - 0.5) * lidar_fov です。
+  正面が0、プラスが右側、マイナスが左側です。
+  車の座標は x が前方向、y が横方向（右がプラス）で、x = 距離 * cos(角度), y = 距離 * sin(角度) です。
+"""
+import time
+
+import numpy as np
+
+
+"""
+各レーザーの角度[rad]を計算します（lidar_width 本分の配列）
+"""
+def rayAngles(lidar_width, lidar_fov):
+    return (np.arange(lidar_width) / float(lidar_width) - 0.5) * lidar_fov
+
+
+"""
+LiDARの形（レーザーの本数と視野角）だけで決まる値を、まとめて覚えておく入れ物です。
+  angles : 各レーザーの角度[rad]
+  sin, cos : 各レーザーの sin(角度), cos(角度)
+  units  : 各レーザーの向きの単位ベクトル（車の座標で (cos, sin)、lidar_width x 2 の配列）
+毎回計算し直さなくてよいように、getLidarGeometry() で作って使い回します。
+"""
+class LidarGeometry():
+    def __init__(self, lidar_width, lidar_fov):
+        self.width  = lidar_width
+        self.fov    = lidar_fov
+        self.angles = rayAngles(lidar_width, lidar_fov)
+        self.sin    = np.sin(self.angles)
+        self.cos    = np.cos(self.angles)
+        self.units  = np.stack([self.cos, self.sin], axis=1)
+        self.corridor_ranges = {} # (half_width, near_dist) -> (start, end)
+
+    """
+    車の正面の通路（幅 half_width*2）に、near_dist[m]より先で入ってくるレーザーの番号の範囲 (start, end) を返します。
+    角度θのレーザーが通路の端（横方向 half_width）に届くのは、前方向 half_width/tan|θ| の所なので、
+    |θ| <= atan(half_width / near_dist) のレーザーだけを調べれば十分です。
+    例: 車幅2.015m＋マージン0.1m、near_dist=3m なら ±20度（180本/180度のLiDARで70番〜110番）になります。
+    """
+    def corridorRange(self, half_width, near_dist):
+        key = (half_width, near_dist)
+        if key not in self.corridor_ranges:
+            limit = np.arctan2(half_width, near_dist)
+            inside = np.flatnonzero(np.abs(self.angles) <= limit)
+            if inside.size == 0:
+                self.corridor_ranges[key] = (self.width // 2, self.width // 2)
+            else:
+                self.corridor_ranges[key] = (int(inside[0]), int(inside[-1]) + 1)
+        return self.corridor_ranges[key]
+
+
+_geometry_cache = {} # (レーザーの本数, 視野角) -> LidarGeometry
+
+
+"""
+レーザーの本数と視野角に合った LidarGeometry を返します。
+同じ形のLiDARなら、2回目からは最初に作ったものをそのまま返します（別の機種に変えてもコードの変更はいりません）。
+"""
+def getLidarGeometry(lidar_width, lidar_fov):
+    key = (int(lidar_width), float(lidar_fov))
+    if key not in _geometry_cache:
+        _geometry_cache[key] = LidarGeometry(lidar_width, lidar_fov)
+    return _geometry_cache[key]
+
+
+"""
+車の正面の通路（幅 half_width*2）の中にある、一番近い障害物のレーザー番号と距離を返します。
+見つからなければ (None, None) を返します。
+
+  lidar_data : lidar.getRangeImage() のリスト（またはNumPy配列）
+  geometry   : getLidarGeometry() で作った LidarGeometry
+  start, end : 調べるレーザーの番号の範囲（start 〜 end-1）
+  half_width : 通路の半分の幅[m]（車幅の半分＋安全マージン）
+  dist_max   : これより遠いものは無視する距離[m]
+
+レーザー1本1本を「車の座標（前方向 x, 横方向 y）」に直して、それぞれが通路に入っているかを調べます。
+平均の角度と平均の距離で1回だけ判定する方法と違って、近くの物と遠くの物が混ざっても
+「どこにも無い真ん中の障害物」を作ってしまうことがありません。
+"""
+def nearestCorridorHit(lidar_data, geometry, start, end, half_width, dist_max):
+    ranges = np.asarray(lidar_data[start:end], dtype=np.float64)
+
+    # 1. 遠すぎる（何も当たっていない inf も含む）レーザーは、距離0として計算から外します。
+    #    （inf のまま sin(0)=0 をかけると nan になるため）
+    hit = ranges < dist_max
+    ranges = np.where(hit, ranges, 0.0)
+
+    # 2. 車の座標に直して、横方向のずれ y が通路の半分の幅より小さければ「ぶつかる」
+    lateral = ranges * geometry.sin[start:end]
+    forward = ranges * geometry.cos[start:end]
+    collide = hit & (np.abs(lateral) < half_width)
+    if not collide.any():
+        return None, None
+
+    # 3. ぶつかるレーザーの中で、一番手前（前方向の距離 x が一番小さい）ものを選びます
+    nearest = int(np.argmin(np.where(collide, forward, np.inf)))
+    return start + nearest, float(ranges[nearest])
+
+
+
+"""
+車の形（車幅 x 車長の長方形）が、今のハンドルの角度のまま曲がっていく道すじ（円弧）に沿って通る所に、
+LiDAR の点が入っているかを調べる部品です。まっすぐの通路を調べる nearestCorridorHit() の代わりに使います。
+まっすぐの通路だと、カーブでは「本当はよけて通る障害物」を見つけてしまい、「カーブの内側の障害物」を見落とします。
+
+【座標】原点は後ろの車軸（GPS の位置）で、LiDAR（車の前の端）はそこから sensor_offset[m] 前です。
+ハンドルの角度 δ のとき、車は回転の中心 (0, R)（R = ホイールベース / tan δ、プラスが右）のまわりを回ります。
+車の形が通る所は、中心からの距離が
+  内側 R_in  = |R| - half_width                              （後ろの車軸の高さの、内側の横）
+  外側 R_out = √((|R| + half_width)² + max(前, 後ろ)²)         （外側の前（後ろ）の角）
+の間の輪になります（δ = 0 のときは、幅 half_width*2 のまっすぐの通路です）。
+
+【早見表】ハンドルの角度を steering_steps 段に区切り、段ごと・レーザーごとに
+「LiDAR からの距離 r がいくつからいくつまでなら、その点が輪の中に入るか」（円とレーザーの交わり）を最初に計算しておきます。
+毎回は、今の角度の段の表を引いて、全部のレーザーの距離を区間と比べるだけです（1回のなめる計算）。
+輪の中の点だけについて、車がどれだけ進めば（道のり）その点に当たるかを計算し、一番手前のものを選びます。
+"""
+class SweptFootprint():
+    def __init__(self, geometry, half_width, car_length, sensor_offset, wheelbase, max_steering=0.5,
+                 steering_steps=41):
+        self.geometry   = geometry
+        self.half_width = half_width
+        self.front      = sensor_offset              # 後ろの車軸から車の前の端（LiDAR）まで[m]
+        self.rear       = car_length - sensor_offset # 後ろの車軸から車の後ろの端まで[m]
+        self.wheelbase  = wheelbase
+        self.max_steering = max_steering
+        self.steerings  = np.linspace(-max_steering, max_steering, steering_steps) # 量子化したハンドルの角度
+        self.buildTables()
+
+    """
+    段ごとの回転の半径 radius（まっすぐは inf）と、レーザーごとの輪の中に入る距離の区間の早見表を作ります。
+    LiDAR からの距離 r の点の、回転の中心からの距離² は r² + 2br + c（b, c は段とレーザーで決まる数）なので、
+    外側の円・内側の円との交わりは2次方程式の解で求まります。輪の中に入るのは
+      r <= outer_exit かつ（r < inner_enter または r > inner_exit）
+    の所です（レーザーが内側の円に入らなければ inner_enter = inner_exit = inf）。
+    """
+    def buildTables(self):
+        geometry = self.geometry
+        count = len(self.steerings)
+        self.radius      = np.full(count, np.inf)
+        self.outer_exit  = np.empty((count, geometry.width))
+        self.inner_enter = np.full((count, geometry.width), np.inf)
+        self.inner_exit  = np.full((count, geometry.width), np.inf)
+        reach = max(self.front, self.rear)
+        with np.errstate(divide="ignore"):
+            straight_exit = np.where(geometry.sin != 0.0, self.half_width / np.abs(geometry.sin), np.inf)
+        for k, steering in enumerate(self.steerings):
+            if abs(steering) < 1e-9:
+                self.outer_exit[k] = straight_exit # まっすぐ: 横のずれ |r sin θ| が half_width 以下の所
+                continue
+            radius = self.wheelbase / np.tan(steering)
+            self.radius[k] = radius
+            b = self.front * geometry.cos - radius * geometry.sin
+            c = self.front ** 2 + radius ** 2
+            r_out = (abs(radius) + self.half_width) ** 2 + reach ** 2
+            r_in  = max(abs(radius) - self.half_width, 0.0) ** 2
+            self.outer_exit[k] = -b + np.sqrt(np.maximum(b * b - (c - r_out), 0.0))
+            disc = b * b - (c - r_in)
+            root = np.sqrt(np.maximum(disc, 0.0))
+            enters = (disc > 0.0) & (-b - root > 0.0)
+            self.inner_enter[k] = np.where(enters, -b - root, np.inf)
+            self.inner_exit[k]  = np.where(enters, -b + root, np.inf)
+
+    """ ハンドルの角度 steering に一番近い段の番号を返します """
+    def tableIndex(self, steering):
+        steering = min(max(steering, -self.max_steering), self.max_steering)
+        step = self.steerings[1] - self.steerings[0]
+        return int(round((steering + self.max_steering) / step))
+
+    """
+    ハンドルの角度 steering のまま max_travel[m] 進む間に、車の形が当たる LiDAR の点のうち、
+    一番手前（当たるまでの道のりが一番短い）もののレーザー番号・距離・道のりを返します。
+    見つからなければ (None, None, None) を返します。dist_max[m] より遠い点は調べません。
+    """
+    def nearestHit(self, lidar_data, steering, max_travel, dist_max):
+        k = self.tableIndex(steering)
+        ranges = np.asarray(lidar_data, dtype=np.float64)
+        inside = (ranges < dist_max) & (ranges <= self.outer_exit[k]) & \
+            ((ranges < self.inner_enter[k]) | (ranges > self.inner_exit[k]))
+        index = np.flatnonzero(inside)
+        if index.size == 0:
+            return None, None, None
+        r = ranges[index]
+        x = self.front + r * self.geometry.cos[index]
+        y = r * self.geometry.sin[index]
+        radius = self.radius[k]
+        if np.isinf(radius):
+            travel = x - self.front
+            ahead = x >= 0.0
+        else:
+            # 回転の中心から見た点の距離 rho と、後ろの車軸から回った角度 phi
+            turn = abs(radius)
+            radial = turn - np.sign(radius) * y
+            rho = np.hypot(x, radial)
+            phi = np.arctan2(x, radial)
+            # 車の形のうち、距離 rho の所で一番先にある点の角度（前の端か、内側の横）
+            inner = max(turn - self.half_width, 0.0)
+            lead = np.where(rho * rho >= self.front ** 2 + inner ** 2,
+                            np.arcsin(np.minimum(self.front / rho, 1.0)),
+                            np.arctan2(np.sqrt(np.maximum(rho * rho - inner * inner, 0.0)), inner))
+            travel = turn * (phi - lead)
+            ahead = phi >= 0.0
+        travel = np.maximum(travel, 0.0) # もう車の形に入っている点は、道のり 0
+        candidate = ahead & (travel <= max_travel)
+        if not candidate.any():
+            return None, None, None
+        nearest = int(np.argmin(np.where(candidate, travel, np.inf)))
+        return int(index[nearest]), float(r[nearest]), float(travel[nearest])
+
+
+# segmentScan() が返す障害物の配列の形（1行が1つの障害物）
+OBSTACLE_DTYPE = np.dtype([
+    ("start_angle",  np.float32), # 障害物の左端（レーザー番号が小さい側）の角度[rad]
+    ("end_angle",    np.float32), # 障害物の右端の角度[rad]
+    ("nearest_dist", np.float32), # 障害物の一番近い点までの距離[m]
+    ("width",        np.float32), # 障害物の両端の点の間の長さ[m]
+])
+
+
+"""
+LiDARの距離データを、障害物ごとのかたまり（クラスタ）に分けます。
+となりのレーザーとの距離の差が jump + jump_ratio*距離 より大きい所、
+または「何かに当たっている／いない」が変わる所で区切ります。
+レーザーの本数に比例する時間（1回なめるだけ）で終わります。
+
+左に駐車中の車、右に電柱、のように2つの物があるとき、平均をとると
+「真ん中にある幻の障害物」になってしまいますが、この方法なら別々の障害物として返します。
+
+戻り値は OBSTACLE_DTYPE の配列です（障害物が無ければ長さ0）。
+"""
+def segmentScan(lidar_data, geometry, dist_max, jump=1.0, jump_ratio=0.1):
+    ranges = np.asarray(lidar_data, dtype=np.float64)
+    valid = ranges < dist_max
+    ranges = np.where(valid, ranges, dist_max) # inf を計算に入れないようにする
+
+    # 1. 区切りの場所を探します（boundary[i] が True なら、i番目のレーザーから新しいかたまり）
+    boundary = np.empty(len(ranges), dtype=bool)
+    boundary[0] = True
+    limit = jump + jump_ratio * np.minimum(ranges[1:], ranges[:-1])
+    boundary[1:] = (valid[1:] != valid[:-1]) | (np.abs(np.diff(ranges)) > limit)
+
+    # 2. 何かに当たっているかたまりだけを残します
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(ranges)) - 1
+    nearest = np.minimum.reduceat(ranges, starts)
+    keep = valid[starts]
+    starts, ends, nearest = starts[keep], ends[keep], nearest[keep]
+
+    # 3. 両端の点を車の座標に直して、障害物の幅（両端の間の長さ）を求めます
+    first = geometry.units[starts] * ranges[starts, None]
+    last  = geometry.units[ends] * ranges[ends, None]
+
+    obstacles = np.empty(len(starts), dtype=OBSTACLE_DTYPE)
+    obstacles["start_angle"]  = geometry.angles[starts]
+    obstacles["end_angle"]    = geometry.angles[ends]
+    obstacles["nearest_dist"] = nearest
+    obstacles["width"]        = np.hypot(*(last - first).T)
+    return obstacles
+
+
+"""
+障害物をよける向きを決めます（-1:左へ逃げる, +1:右へ逃げる）。
+blocking_angle は、ぶつかりそうな障害物の角度（calcObstacleAngleDist の結果）です。
+
+基本は「障害物のかたまりの中心と反対側」へ逃げますが、逃げる側の clear_dist[m] 以内に
+別の障害物があるときは、もう片方の方が空いていればそちらへ逃げます。
+（真横や後ろの壁は関係ないので、正面 ±front_angle[rad] の障害物だけを比べます）
+"""
+def escapeDirection(obstacles, blocking_angle, clear_dist=10.0, front_angle=np.pi / 3):
+    blocking = (obstacles["start_angle"] <= blocking_angle) & (blocking_angle <= obstacles["end_angle"])
+    if blocking.any():
+        target = obstacles[blocking][0]
+        center = 0.5 * (target["start_angle"] + target["end_angle"])
+    else:
+        center = blocking_angle
+    direction = -1 if center >= 0 else 1
+
+    # 逃げる側・反対側それぞれで、ぶつかりそうな障害物以外の一番近い距離を調べます
+    others = obstacles[~blocking]
+    centers = 0.5 * (others["start_angle"] + others["end_angle"])
+    front = np.abs(centers) <= front_angle
+    others, centers = others[front], centers[front]
+    left  = others["nearest_dist"][centers < 0]
+    right = others["nearest_dist"][centers >= 0]
+    left_clear  = left.min() if left.size else np.inf
+    right_clear = right.min() if right.size else np.inf
+    escape_clear, other_clear = (left_clear, right_clear) if direction < 0 else (right_clear, left_clear)
+    if escape_clear < clear_dist and other_clear > escape_clear:
+        direction = -direction
+    return direction
+
+
+"""
+LiDAR の全部のレーザーから、ポテンシャル法の反発力をベクトル（車の座標: 前 x, 右 y）で計算します。
+
+レーザーが距離 r で何かに当たっていたら、その点から車を押し返す力
+  -(cos θ, sin θ) * (1/r² - 1/influence_dist²)
+を、influence_dist[m] より近いレーザー全部について NumPy の1つの式で足し合わせます。
+（influence_dist で力がちょうど 0 になるように、1/influence_dist² を引いています）
+足し合わせた力に「レーザー1本が受け持つ角度」を掛けるので、レーザーの本数が変わっても力の大きさは変わりません。
+
+【計算時間の上限】1回の計算が budget_ns[ns] を超えたら、次からレーザーを stride 本に1本に間引き（2倍ずつ）、
+budget_ns の 1/4 より速ければ間引きを減らします。stride は max_stride より大きくしません。
+"""
+class RepulsiveField():
+    def __init__(self, geometry, influence_dist=10.0, budget_ns=500000, max_stride=8):
+        self.geometry = geometry
+        self.influence_dist = influence_dist
+        self.budget_ns  = budget_ns
+        self.max_stride = max_stride
+        self.stride = 1
+        self.elapsed_ns = 0 # 前回の計算にかかった時間[ns]
+        self.ray_count  = 0 # 前回の計算で力を出したレーザーの数
+
+    """ 距離データ lidar_data から反発力 (前 x, 右 y) を返します """
+    def compute(self, lidar_data):
+        start = time.perf_counter_ns()
+        stride = self.stride
+        geometry = self.geometry
+        ranges = np.asarray(lidar_data, dtype=np.float64)[::stride]
+        near = ranges < self.influence_dist # inf と nan はここで外れます
+        # 近すぎる点で力が無限に大きくならないように、距離は 0.1m より小さくしません
+        inv_sq = np.where(near, 1.0 / np.maximum(ranges, 0.1) ** 2 - 1.0 / self.influence_dist ** 2, 0.0)
+        weight = (geometry.fov / geometry.width) * stride
+        force_x = -weight * float(inv_sq @ geometry.cos[::stride])
+        force_y = -weight * float(inv_sq @ geometry.sin[::stride])
+        self.ray_count = int(np.count_nonzero(near))
+
+        self.elapsed_ns = time.perf_counter_ns() - start
+        if self.elapsed_ns > self.budget_ns and self.stride < self.max_stride:
+            self.stride *= 2
+        elif self.elapsed_ns < self.budget_ns // 4 and self.stride > 1:
+            self.stride //= 2
+        return force_x, force_y
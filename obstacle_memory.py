@@ -0,0 +1,103 @@
+"""
+見つけた障害物を、世界の座標で覚えておく部品です（run2 のポテンシャル法で使います）。
+
+LiDAR の正面の通路から障害物が外れても（車の横を通り過ぎる途中など）、まだ近くにある障害物から
+逃げ続けられるように、障害物の位置・大きさ・逃げる向きを覚えておきます。
+見えている間は位置と時刻を新しくし、max_age[s] のあいだ見えなかった障害物は忘れます。
+
+【空間ハッシュ】覚えた障害物は、地面を cell_size[m] 四方のマスに分けた辞書 {(マスの番号): [障害物, ...]} に入れます。
+近くの障害物を探すときは、まわりの 3 x 3 マスだけを見ればよいので、覚えている障害物が増えても
+1回の検索の時間は変わりません（cell_size は、探す半径と同じくらいにします）。
+
+障害物1つは [x, y, 半径, 最後に見た時刻, 逃げる向き] のリストです。
+"""
+import math
+
+# 障害物1つのリストの中身の番号
+X, Y, RADIUS, LAST_SEEN, DIRECTION = range(5)
+
+
+class ObstacleMemory():
+    def __init__(self, cell_size=10.0, max_age=1.5, match_dist=1.5):
+        self.cell_size  = cell_size
+        self.max_age    = max_age
+        self.match_dist = match_dist # これより近ければ、前に覚えた障害物と同じものとみなします[m]
+        self.cells = {}              # (ix, iy) -> 障害物のリスト
+        self.count = 0               # 覚えている障害物の数
+        self.last_prune = 0.0
+
+    def cellKey(self, x, y):
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    """ 点 (x, y) のまわり 3 x 3 マスの障害物のリストを、順番に返します """
+    def neighbourCells(self, x, y):
+        ix, iy = self.cellKey(x, y)
+        for jx in (ix - 1, ix, ix + 1):
+            for jy in (iy - 1, iy, iy + 1):
+                entries = self.cells.get((jx, jy))
+                if entries:
+                    yield entries
+
+    """ 点 (x, y) から match_dist 以内で一番近い、覚えている障害物を返します（無ければ None） """
+    def match(self, x, y):
+        best, best_dist = None, self.match_dist
+        for entries in self.neighbourCells(x, y):
+            for entry in entries:
+                dist = math.hypot(entry[X] - x, entry[Y] - y)
+                if dist <= best_dist:
+                    best, best_dist = entry, dist
+        return best
+
+    """ 覚えている障害物の位置を動かします（マスが変われば入れ直します） """
+    def move(self, entry, x, y):
+        old_key, new_key = self.cellKey(entry[X], entry[Y]), self.cellKey(x, y)
+        entry[X], entry[Y] = x, y
+        if old_key != new_key:
+            self.cells[old_key].remove(entry)
+            if not self.cells[old_key]:
+                del self.cells[old_key]
+            self.cells.setdefault(new_key, []).append(entry)
+
+    """
+    障害物を見たことを記録します。前に覚えた障害物と同じなら位置と時刻を新しくし、
+    違うなら new が True のときだけ新しく覚えます。逃げる向き direction は、最初に覚えたときのものを使い続けます。
+    覚えている（覚えた）障害物を返します（覚えなかったときは None）。
+    """
+    def observe(self, x, y, radius, now, direction=0.0, new=True):
+        entry = self.match(x, y)
+        if entry is not None:
+            self.move(entry, x, y)
+            entry[RADIUS] = radius
+            entry[LAST_SEEN] = now
+            return entry
+        if not new:
+            return None
+        entry = [x, y, radius, now, direction]
+        self.cells.setdefault(self.cellKey(x, y), []).append(entry)
+        self.count += 1
+        return entry
+
+    """ max_age より長く見ていない障害物を忘れます（max_age に1回だけ全部を見直します） """
+    def prune(self, now):
+        if now - self.last_prune < self.max_age:
+            return
+        self.last_prune = now
+        for key in list(self.cells):
+            alive = [entry for entry in self.cells[key] if now - entry[LAST_SEEN] <= self.max_age]
+            self.count -= len(self.cells[key]) - len(alive)
+            if alive:
+                self.cells[key] = alive
+            else:
+                del self.cells[key]
+
+    """ 点 (x, y) から radius[m] 以内に表面がある、max_age 以内に見た障害物のリストを返します """
+    def query(self, x, y, radius, now):
+        self.prune(now)
+        found = []
+        for entries in self.neighbourCells(x, y):
+            for entry in entries:
+                if now - entry[LAST_SEEN] > self.max_age:
+                    continue
+                if math.hypot(entry[X] - x, entry[Y] - y) - entry[RADIUS] <= radius:
+                    found.append(entry)
+        return found
@@ -0,0 +1,191 @@
+"""
+LiDAR と GPS の位置から、車のまわりの地図（占有格子地図）を少しずつ作る部品です。
+
+地面を resolution[m] 四方のマス目に分け、マスごとに「障害物がある確からしさ」を
+対数オッズ（log-odds）l = log(p / (1 - p)) で覚えます。足し算だけで更新できるのが便利な点です。
+  レーザーが通り抜けたマス : l += l_free（空いている方へ）
+  レーザーが当たったマス   : l += l_occ （障害物がある方へ）
+l は [l_min, l_max] の範囲に収めるので、一度決まったマスも、状況が変われば書き換わります。
+
+【動く窓（ローリングウィンドウ）】
+地図は size x size マスの決まった大きさの NumPy 配列で、いつも車を真ん中にした範囲だけを覚えます。
+世界のマス (ix, iy) は、配列の [ix % size, iy % size] に入れます（端と端がつながった配列）。
+車が進んで窓がずれたときは、窓から出ていった列・行を 0（分からない）に戻すだけで、配列をずらしてコピーはしません。
+どれだけ長く走っても、メモリは size x size のままです。
+
+【速さ】レーザー1本ずつ Python のループでマスをたどる代わりに、全部のレーザーの上に resolution ごとに
+並べた点を NumPy でまとめて計算します。センサの近くではレーザー同士の間がマスより狭く、何本も同じマスを
+通るので、となりの点との間が resolution くらいになるように、近い所ほどレーザーを間引いて並べます
+（この並べ方は LiDAR の形ごとに最初に1回だけ作ります）。それでも同じマスに何回も点が入ったときは、
+1回のスキャンで足すのは1回だけです（np.unique のような並べ替えを使わずに重複を取り除きます）。
+180本・30m なら 1回の更新は 1ms くらいで、30ms のセンサの周期に十分収まります。
+
+【座標のきまり】世界の座標は Webots と同じ（地面が x-y 平面、heading は x 軸から反時計回り）、
+レーザーの角度は lidar_processing と同じ（プラスが右）です。
+"""
+import math
+
+import numpy as np
+
+
+class OccupancyGrid():
+    def __init__(self, size=256, resolution=0.25, max_range=30.0,
+                 l_occ=0.85, l_free=-0.4, l_min=-4.0, l_max=4.0):
+        self.size       = size
+        self.resolution = resolution
+        self.max_range  = max_range # これより遠い所は地図に書きません（窓の半分くらいが目安）
+        self.l_occ, self.l_free = l_occ, l_free
+        self.l_min, self.l_max  = l_min, l_max
+        self.log_odds = np.zeros((size, size), dtype=np.float32)
+        self.flat     = self.log_odds.reshape(-1) # 同じメモリを1列に並べて見たもの
+        self.inv_resolution = 1.0 / resolution
+        self.wrap = np.arange(2 * size) % size    # cellIndex() で使う、size で割った余りの早見表
+        self.origin   = None # 窓の左下のマスの、世界のマス番号 (ix, iy)
+
+        # レーザーの上に並べる点の、センサからの距離（マスの大きさごと）
+        self.sample_dist = (np.arange(int(max_range / resolution)) + 0.5) * resolution
+        self.pattern_key = None # samplePattern() で作った並べ方の LiDAR の形 (本数, 視野角)
+        # 重複を取り除くための作業用の配列（毎回作り直さないように、最初に確保します）
+        self.owner = np.zeros(size * size, dtype=np.int32)
+        self.stamp = np.zeros(size * size, dtype=np.int32)
+        self.positions = np.arange(0, dtype=np.int32)
+        self.scan_count = 0
+
+    """ 車の位置 (x, y) が窓の真ん中になるように、窓をずらします """
+    def scrollTo(self, x, y):
+        cx = int(math.floor(x / self.resolution)) - self.size // 2
+        cy = int(math.floor(y / self.resolution)) - self.size // 2
+        if self.origin is None:
+            self.origin = (cx, cy)
+            return
+        ox, oy = self.origin
+        if cx == ox and cy == oy:
+            return
+        if abs(cx - ox) >= self.size or abs(cy - oy) >= self.size:
+            self.log_odds[:] = 0.0
+        else:
+            # 窓から出ていった列（x）と行（y）を、分からない（0）に戻します
+            if cx > ox:
+                self.log_odds[np.arange(ox, cx) % self.size, :] = 0.0
+            elif cx < ox:
+                self.log_odds[np.arange(cx + self.size, ox + self.size) % self.size, :] = 0.0
+            if cy > oy:
+                self.log_odds[:, np.arange(oy, cy) % self.size] = 0.0
+            elif cy < oy:
+                self.log_odds[:, np.arange(cy + self.size, oy + self.size) % self.size] = 0.0
+        self.origin = (cx, cy)
+
+    """
+    世界の点 (px, py)（配列）が入るマスの、配列を1列に並べたときの番号と、窓の中かどうか（inside）を返します。
+    番号は窓の中の点の分だけです（inside が True の点の順）。
+    """
+    def cellIndex(self, px, py):
+        ox, oy = self.origin
+        rx = np.floor(px * self.inv_resolution - ox).astype(np.intp) # 窓の左下から数えたマス番号
+        ry = np.floor(py * self.inv_resolution - oy).astype(np.intp)
+        inside = (rx >= 0) & (rx < self.size) & (ry >= 0) & (ry < self.size)
+        # 割り算の余り（%）は遅いので、0 〜 2*size-1 の余りの早見表 wrap を引きます
+        rows = self.wrap[rx[inside] + ox % self.size]
+        cols = self.wrap[ry[inside] + oy % self.size]
+        return rows * self.size + cols, inside
+
+    """ 番号の重複を取り除きます（並べ替えずに、それぞれのマスで最後に書き込んだ1つだけを残します） """
+    def uniqueCells(self, cells):
+        count = len(cells)
+        if len(self.positions) < count:
+            self.positions = np.arange(count, dtype=np.int32)
+        positions = self.positions[:count]
+        self.owner[cells] = positions
+        return cells[self.owner[cells] == positions]
+
+    """
+    通り抜けたマスを調べる点の並べ方（レーザーの番号, センサからの距離）を、LiDAR の形ごとに1回だけ作ります。
+    距離 d でのとなりのレーザーとの間は d * (視野角 / 本数) なので、これが resolution より狭い所では
+    stride 本に1本だけ使います。
+    """
+    def samplePattern(self, geometry):
+        key = (geometry.width, geometry.fov)
+        if self.pattern_key != key:
+            spacing = geometry.fov / geometry.width
+            rays, dists = [], []
+            for dist in self.sample_dist:
+                stride = max(1, int(self.resolution / (dist * spacing)))
+                index = np.arange(0, geometry.width, stride)
+                rays.append(index)
+                dists.append(np.full(len(index), dist))
+            self.pattern_rays = np.concatenate(rays)
+            self.pattern_dist = np.concatenate(dists)
+            self.pattern_key  = key
+        return self.pattern_rays, self.pattern_dist
+
+    """
+    LiDAR の1回分のスキャンを地図に書き込みます。
+      x, y, heading : 車の位置と向き（GpsPoseEstimator の結果）
+      ranges        : lidar.getRangeImage()（何にも当たらないレーザーは inf）
+      geometry      : lidar_processing.getLidarGeometry() で作った LidarGeometry
+      sensor_offset : 車の位置（GPS）から LiDAR までの、前方向の距離[m]
+    """
+    def integrateScan(self, x, y, heading, ranges, geometry, sensor_offset=0.0):
+        self.scrollTo(x, y)
+        sx = x + sensor_offset * math.cos(heading)
+        sy = y + sensor_offset * math.sin(heading)
+        ranges = np.asarray(ranges, dtype=np.float64)
+        directions = heading - geometry.angles # プラスが右なので、世界の角度では引きます
+        dx, dy = np.cos(directions), np.sin(directions)
+        valid = ~np.isnan(ranges)
+        hit = valid & (ranges < self.max_range)
+
+        # 1. 当たったマス（レーザーの先の点）
+        hx = sx + ranges[hit] * dx[hit]
+        hy = sy + ranges[hit] * dy[hit]
+        occupied = self.uniqueCells(self.cellIndex(hx, hy)[0])
+
+        # 2. 通り抜けたマス（当たった点の手前まで、samplePattern() で並べた点）
+        rays, dist = self.samplePattern(geometry)
+        free_dist = np.where(hit, ranges, np.where(valid, self.max_range, 0.0))
+        along = dist < free_dist[rays] - 0.5 * self.resolution
+        rays, dist = rays[along], dist[along]
+        free = self.cellIndex(sx + dist * dx[rays], sy + dist * dy[rays])[0]
+
+        # 3. このスキャンで当たったマスは、通り抜けたことにしません
+        self.scan_count += 1
+        self.stamp[occupied] = self.scan_count
+        free = self.uniqueCells(free[self.stamp[free] != self.scan_count])
+
+        self.flat[free] = np.maximum(self.flat[free] + self.l_free, self.l_min)
+        self.flat[occupied] = np.minimum(self.flat[occupied] + self.l_occ, self.l_max)
+
+    """ 世界の点（N x 2 の配列）の対数オッズを返します（窓の外は 0 = 分からない） """
+    def logOddsAt(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.origin is None:
+            return np.zeros(len(points), dtype=np.float32)
+        cells, inside = self.cellIndex(points[:, 0], points[:, 1])
+        values = np.zeros(len(points), dtype=np.float32)
+        values[inside] = self.flat[cells]
+        return values
+
+    """ 世界の点 (x, y) に障害物がある確率が threshold より高ければ True """
+    def isOccupied(self, x, y, threshold=0.7):
+        return bool(self.logOddsAt([(x, y)])[0] > math.log(threshold / (1.0 - threshold)))
+
+    """
+    窓全体の「障害物がある確率」を、世界の向きに並べ直した size x size の配列で返します（表示・保存用）。
+    [i, j] が世界のマス (origin[0] + i, origin[1] + j) です。コピーを作るので、毎コマ呼ぶものではありません。
+    """
+    def probabilities(self):
+        if self.origin is None:
+            return np.full((self.size, self.size), 0.5, dtype=np.float32)
+        ox, oy = self.origin
+        window = np.roll(self.log_odds, (-ox % self.size, -oy % self.size), axis=(0, 1))
+        return 1.0 - 1.0 / (1.0 + np.exp(window))
+
+    """ 障害物がある確率が threshold より高いマスの、真ん中の世界の座標（N x 2 の配列）を返します """
+    def occupiedPoints(self, threshold=0.7):
+        if self.origin is None:
+            return np.empty((0, 2))
+        rows, cols = np.nonzero(self.log_odds > math.log(threshold / (1.0 - threshold)))
+        ox, oy = self.origin
+        ix = ox + (rows - ox) % self.size # 配列の番号から、窓の中の世界のマス番号に戻します
+        iy = oy + (cols - oy) % self.size
+        return (np.stack([ix, iy], axis=1) + 0.5) * self.resolution
@@ -0,0 +1,123 @@
+"""
+認識処理（カメラ画像の解析・LiDARの解析）を、別のスレッドで動かすための部品です。
+
+run1 / run2 では driver.step() の間に画像処理をしているので、重いフレームがあると
+シミュレーション全体が止まってしまいます。PerceptionWorker を使うと、
+  - 制御ループは最新のセンサデータを submit() で渡すだけで、すぐに次の step() に進めます。
+  - 裏のスレッドが、受け取ったデータを順番に処理します。
+  - 制御ループは latest() で「一番新しく出来上がった結果」と「その結果がどれくらい古いか」を受け取ります。
+
+【ダブルバッファ】データを入れる箱を2つ用意して、片方を裏のスレッドが処理している間に、
+もう片方へ次のデータを書き込みます。データのコピーは submit() の1回だけです。
+処理が追いつかず、処理される前に上書きされたフレームは dropped_count で数えます。
+（NumPy / OpenCV の計算中はPythonのGILが外れるので、スレッドでも並行に動きます）
+"""
+import threading
+
+import numpy as np
+
+
+class PerceptionWorker():
+    """
+    process: 認識処理の関数。process(image, lidar_data, *inputs) の戻り値が、そのまま結果になります。
+    image_shape: カメラ画像の形（高さ, 横幅, 4）。lidar_size: LiDARの点の数
+    """
+    def __init__(self, process, image_shape, lidar_size):
+        self.process = process
+
+        # 2つの箱（ダブルバッファ）。最初に1回だけ確保して、あとは使い回します。
+        self.images = [np.empty(image_shape, dtype=np.uint8) for _ in range(2)]
+        self.lidars = [np.empty(lidar_size, dtype=np.float32) for _ in range(2)]
+        self.stamps = [0.0, 0.0]
+        self.inputs = [(), ()] # 箱ごとの、submit() で一緒に渡された値の組
+
+        self.lock       = threading.Condition()
+        self.pending    = None # 処理待ちの箱の番号
+        self.processing = None # 裏のスレッドが処理中の箱の番号
+        self.running    = True
+
+        # 結果と、その結果を作ったデータの時刻
+        self.result       = None
+        self.result_stamp = None
+        self.last_read    = None # 前回 latest() で渡した結果の時刻
+
+        # 数えておくもの
+        self.submitted_count = 0 # 渡したフレームの数
+        self.processed_count = 0 # 処理し終わったフレームの数
+        self.dropped_count   = 0 # 処理される前に上書きされたフレームの数
+        self.stale_count     = 0 # latest() で、前回と同じ（新しくない）結果を渡した回数
+
+        self.thread = threading.Thread(target=self.loop, name="perception", daemon=True)
+        self.thread.start()
+
+    """
+    最新のセンサデータを渡します（制御ループから呼びます）。
+    camera_image は camera.getImage() のバイト列、lidar_data は lidar.getRangeImage() のリスト、
+    stamp はデータの時刻（driver.getTime()）です。
+    inputs は process にそのまま渡す値の組です。制御ループが書き換える値は、ここで写して渡してください
+    （裏のスレッドが、処理の途中で変わった値を読まないように）。
+    """
+    def submit(self, camera_image, lidar_data, stamp, inputs=()):
+        with self.lock:
+            # 裏のスレッドが使っていない方の箱に書き込みます
+            if self.processing is not None:
+                target = 1 - self.processing
+            elif self.pending is not None:
+                target = self.pending
+            else:
+                target = self.submitted_count % 2
+            if self.pending == target:
+                self.dropped_count += 1 # まだ処理されていないフレームを上書きする
+            self.pending = None         # 書き込み中は取り出されないようにする
+            self.submitted_count += 1
+
+        # コピーはここの1回だけ（ロックの外で行うので、裏のスレッドを待たせません）
+        image = self.images[target]
+        np.copyto(image, np.frombuffer(camera_image, np.uint8).reshape(image.shape))
+        self.lidars[target][:] = lidar_data
+        self.stamps[target] = stamp
+        self.inputs[target] = tuple(inputs)
+
+        with self.lock:
+            self.pending = target
+            self.lock.notify()
+
+    """
+    一番新しく出来上がった結果と、その古さ[s]を返します。まだ結果が無ければ (None, None) です。
+    now は今の時刻（driver.getTime()）です。
+    """
+    def latest(self, now):
+        with self.lock:
+            result, stamp = self.result, self.result_stamp
+        if stamp is None:
+            return None, None
+        if stamp == self.last_read:
+            self.stale_count += 1
+        self.last_read = stamp
+        return result, now - stamp
+
+    """ 裏のスレッドの中身：処理待ちの箱があれば取り出して処理します """
+    def loop(self):
+        while True:
+            with self.lock:
+                while self.pending is None and self.running:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                index = self.pending
+                self.pending, self.processing = None, index
+
+            result = self.process(self.images[index], self.lidars[index], *self.inputs[index])
+
+            with self.lock:
+                self.processing   = None
+                self.result       = result
+                self.result_stamp = self.stamps[index]
+                self.processed_count += 1
+
+    """ 裏のスレッドを止めます """
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        self.thread.join()
@@ -0,0 +1,49 @@
+"""
+GPS の位置だけから、車の向き（heading）と速さを推定する部品です。
+
+GPS は位置 (x, y, z) しか教えてくれないので、robot_car_01.py と同じく
+「前の位置から今の位置へ進んだ向き」を車の向きとします。
+ただし、毎コマの移動はとても小さく、GPS の誤差で向きがふらつくので、
+基準の位置から min_move[m] 以上進んだときだけ向きと速さを計算し直し、その位置を新しい基準にします。
+
+【座標のきまり】Webots と同じく、地面が x-y 平面で、heading は x 軸から反時計回りの角度[rad]です。
+"""
+import math
+
+
+class GpsPoseEstimator():
+    def __init__(self, min_move=0.5):
+        self.min_move = min_move
+        self.reset()
+
+    """ 推定を最初からやり直します """
+    def reset(self):
+        self.x, self.y = math.nan, math.nan
+        self.heading = math.nan
+        self.speed   = 0.0   # 推定した速さ[m/s]
+        self.anchor  = None  # 向きを計算する基準の (x, y, 時刻)
+
+    """ 向きが分かっていれば True（走り始めて min_move[m] 進むまでは分かりません） """
+    def isReady(self):
+        return not math.isnan(self.heading)
+
+    """
+    GPS の値 gps_values（gps.getValues()）と時刻 now[s] で推定を進め、(x, y, heading) を返します。
+    向きがまだ分からないときの heading は nan です。
+    """
+    def update(self, gps_values, now):
+        x, y = gps_values[0], gps_values[1]
+        if math.isnan(x) or math.isnan(y):
+            return self.x, self.y, self.heading
+        self.x, self.y = x, y
+        if self.anchor is None:
+            self.anchor = (x, y, now)
+            return self.x, self.y, self.heading
+        ax, ay, at = self.anchor
+        moved = math.hypot(x - ax, y - ay)
+        if moved >= self.min_move:
+            self.heading = math.atan2(y - ay, x - ax)
+            if now > at:
+                self.speed = moved / (now - at)
+            self.anchor = (x, y, now)
+        return self.x, self.y, self.heading
@@ -0,0 +1,109 @@
+"""
+走っている途中の「ある区間だけ」を調べるためのプロファイラです（robot_car_auto_03.py のキー操作で使います）。
+
+  P キー : cProfile を始める / 止める。止めたときに、時間のかかった関数の上位をコンソールに表示し、
+           profile_<日時>.prof（pstats で読めます）と profile_<日時>.txt（表）を保存します。
+  M キー : tracemalloc を始める（そのときのメモリの様子を覚えておく）/ 止める。止めたときに、
+           始めたときからメモリが増えた場所の上位を表示し、tracemalloc_<日時>.txt に保存します。
+
+カクついたときに P を押して、少し走らせてからもう一度 P を押せば、その区間だけのプロファイルが取れます。
+
+【止めているとき】cProfile も tracemalloc も、キーを押すまで一度も動かしません。
+止めている間は、キーが押されたかどうかを見る以外に何もしないので、走りは遅くなりません。
+cProfile は、それを始めたスレッド（メインループ）だけを測ります（perception_worker のスレッドは入りません）。
+"""
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+
+
+class LoopProfiler():
+    TOP = 15            # 表示する関数・場所の数
+    TRACE_FRAMES = 1    # tracemalloc で覚えておく呼び出し元の深さ
+
+    def __init__(self, directory=".", log=None):
+        self.directory = directory
+        self.log = log
+        self.profile = None   # cProfile.Profile（動いている間だけ）
+        self.snapshot = None  # tracemalloc の始めたときのスナップショット（動いている間だけ）
+        self.profile_start = 0.0
+        self.memory_start  = 0.0
+
+    """ ファイル名 <prefix>_<日時>.<ext> を作ります """
+    def reportPath(self, prefix, ext):
+        return os.path.join(self.directory, "%s_%s.%s" % (prefix, time.strftime("%Y%m%d_%H%M%S"), ext))
+
+    """ cProfile を始める / 止めます。sim_time はシミュレーションの時刻[s]（レポートに書きます） """
+    def toggleCpu(self, sim_time=0.0):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile_start = sim_time
+            self.profile.enable()
+            print("*** cProfile started (t=%.2f s) ***" % sim_time)
+            return
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.TOP)
+        stats.sort_stats("tottime").print_stats(self.TOP)
+        header = "cProfile: t=%.2f s - %.2f s (simulation time)\n" % (self.profile_start, sim_time)
+        prof_path = self.reportPath("profile", "prof")
+        text_path = prof_path[:-len(".prof")] + ".txt"
+        stats.dump_stats(prof_path)
+        with open(text_path, "w") as f:
+            f.write(header + stream.getvalue())
+
+        # コンソールには、自分の中で時間を使った（tottime の大きい）関数だけを短く表示します
+        print("*** cProfile stopped: " + header.strip())
+        print("%10s %10s %10s  %s" % ("ncalls", "tottime", "cumtime", "function"))
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in rows[:self.TOP]:
+            print("%10d %10.4f %10.4f  %s:%d(%s)" % (ncalls, tottime, cumtime,
+                  os.path.basename(filename), line, name))
+        print("saved %s, %s" % (prof_path, text_path))
+        if self.log is not None:
+            self.log.info("profile", file=prof_path, start=self.profile_start, end=sim_time)
+
+    """ tracemalloc を始める / 止めます。止めるときに、始めたときとの差をレポートにします """
+    def toggleMemory(self, sim_time=0.0):
+        if self.snapshot is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.TRACE_FRAMES)
+            self.snapshot = tracemalloc.take_snapshot()
+            self.memory_start = sim_time
+            print("*** tracemalloc started (t=%.2f s) ***" % sim_time)
+            return
+        current = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        baseline, self.snapshot = self.snapshot, None
+
+        # プロファイラ自身（tracemalloc・cProfile・pstats とこのファイル）のメモリは数えません
+        ignore = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)]
+        ignore.append(tracemalloc.Filter(False, __file__))
+        diff = current.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), "lineno")
+        header = "tracemalloc: t=%.2f s - %.2f s (simulation time), total %+.1f KiB\n" % (
+            self.memory_start, sim_time, sum(d.size_diff for d in diff) / 1024.0)
+        path = self.reportPath("tracemalloc", "txt")
+        with open(path, "w") as f:
+            f.write(header)
+            for d in diff:
+                f.write("%s\n" % d)
+
+        print("*** tracemalloc stopped: " + header.strip())
+        for d in diff[:self.TOP]:
+            print("  %s" % d)
+        print("saved %s" % path)
+        if self.log is not None:
+            self.log.info("tracemalloc", file=path, start=self.memory_start, end=sim_time)
+
+    """ 動いたままのものがあれば止めて、レポートを保存します（走り終わったときに呼びます） """
+    def stop(self, sim_time=0.0):
+        if self.profile is not None:
+            self.toggleCpu(sim_time)
+        if self.snapshot is not None:
+            self.toggleMemory(sim_time)
@@ -0,0 +1,71 @@
+"""
+保存したセンサのデータ（sensor_capture.py）を、Webots を使わずに RobotCar へもう一度流すプログラムです。
+
+にせものの Webots（webots_stub）のカメラ・LiDAR・GPS に、保存したデータ（CaptureSource）をつないでから
+robot_car_auto_02.py / 03.py を読み込みます。
+RobotCar の認識処理とハンドル操作のコードは、走行中とまったく同じものがそのまま動きます。
+シミュレーションの時間を待たずに、CPUの速さいっぱいで進めます。
+
+使い方:
+  1. RobotCar.CAPTURE_FILE = "capture.bin" にして、Webots で走らせて記録します。
+  2. python replay.py capture.bin                                  # robot_car_auto_02 の run2 で再生
+     python replay.py capture.bin --script robot_car_auto_03 --run run1
+     python replay.py capture.bin --out commands.npy              # 毎コマのハンドル・速度の指令を保存
+同じファイルを何回再生しても、同じ指令になります（結果を比べて、変更で動きが変わっていないか確かめられます）。
+"""
+import argparse
+import importlib
+import time
+
+import numpy as np
+
+import webots_stub
+
+# 毎コマ記録する指令（ハンドル・速度）の形
+COMMAND_DTYPE = np.dtype([("time", "<f8"), ("steering", "<f4"), ("speed", "<f4")])
+
+
+"""
+capture_path のデータを、script（robot_car_auto_02 など）の RobotCar の run（"run1" / "run2" / "run3"）で再生して、
+毎コマの指令（COMMAND_DTYPE の配列）と、そのときの RobotCar と World を返します。
+"""
+def replay(capture_path, script="robot_car_auto_02", run="run2"):
+    capture = webots_stub.sources.CaptureSource(capture_path)
+    world = webots_stub.install(webots_stub.World(
+        basic_time_step=capture.info.get("basic_time_step", 10.0), duration=None,
+        sources={"camera": capture.camera(), "Sick LMS 291": capture.lidar(), "gps": capture.gps()},
+        record_commands=True))
+    world.capture = capture
+    module = importlib.import_module(script)
+
+    # 同じ結果になるように、別スレッドでの認識処理と、記録（キャプチャ）は止めておきます
+    module.RobotCar.USE_PERCEPTION_WORKER = False
+    module.RobotCar.CAPTURE_FILE = None
+
+    robot_car = module.RobotCar()
+    getattr(robot_car, run)()
+    commands = np.array(world.commands, dtype=COMMAND_DTYPE)
+    return commands, robot_car, world
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RobotCar をセンサの記録で再生します")
+    parser.add_argument("capture", help="sensor_capture で保存したファイル")
+    parser.add_argument("--script", default="robot_car_auto_02", help="RobotCar を読み込むスクリプト")
+    parser.add_argument("--run", default="run2", choices=["run1", "run2", "run3"], help="使う走り方")
+    parser.add_argument("--out", help="毎コマの指令を保存する .npy ファイル")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    commands, robot_car, world = replay(args.capture, args.script, args.run)
+    elapsed = time.perf_counter() - start
+
+    print("replayed %d frames, %.1f s of simulation in %.2f s (%.0fx real time)" % \
+        (world.capture.frame_count, world.time, elapsed, world.time / max(elapsed, 1e-9)))
+    if args.out:
+        np.save(args.out, commands)
+        print("commands saved to %s" % args.out)
+
+
+if __name__ == '__main__':
+    main()
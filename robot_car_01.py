@@ -6,6 +6,7 @@ GPSから取得した現在位置と、直前位置との差分（移動ベク
 """
 
 import math
+import car_logger # 回数を制限して表示するログ
 from vehicle import Driver
 from controller import GPS
 
@@ -18,6 +19,9 @@ driver.setCruisingSpeed(20)
 gps = driver.getDevice("gps")
 gps.enable(TIME_STEP)
 
+# ログの準備。毎コマの値は、シミュレーションの時間で5秒に1回だけ表示します（CAR_LOG_LEVEL=DEBUG なら細かい値も表示）
+log = car_logger.getLogger("robot_car_01", clock=driver.getTime)
+
 # 車の向きを覚えるための変数
 prev_x, prev_y = 0.0, 0.0
 car_angle = 0.0 
@@ -35,8 +39,7 @@ while driver.step() != -1:
     # GPSの履歴から「今の車の向き（方角）」を計算
     if abs(x1 - prev_x) > 0.01: # 車両が1cm以上動いたら車の向きを更新
         car_angle = math.atan2(y1 - prev_y, x1 - prev_x)
-        print(f"car_angle(ラジアン）: {car_angle}")
-        print(f"car_angle(角度）: {math.degrees(car_angle)}")
+        log.debug("car_angle", rad=car_angle, deg=math.degrees(car_angle))
         prev_x, prev_y = x1, y1
 
     if 'wp_idx' not in locals(): wp_idx = 0
@@ -44,9 +47,7 @@ while driver.step() != -1:
 
     # 目標への方角（ワールド座標での角度）。角度は公式「アークタンジェント＊（高さ/底辺）」で求められる。
     target_angle = math.atan2(way_point[1] - y1, way_point[0] - x1)
-    
-    print(f"target_angle(ラジアン）: {target_angle}")
-    print(f"target_angle(角度）: {math.degrees(target_angle)}")
+    log.debug("target_angle", rad=target_angle, deg=math.degrees(target_angle))
     
     # 車とウェイポイントの２点の距離を計算（弾同士の当たり判定と同じ理屈）
     distance = math.sqrt((x1 - way_point[0])**2 + (y1 - way_point[1])**2)
@@ -54,8 +55,13 @@ while driver.step() != -1:
     # 次のウェイポイントに向かう
     if distance < 5:
         wp_idx = (wp_idx + 1) % len(targets)
+        log.info("next_waypoint", index=wp_idx, x=targets[wp_idx][0], y=targets[wp_idx][1])
 
     # 「目標の方角」から「今の車の向き」を引いて、ズレを出す
     # この diff が 0 になれば、車は目標を真っ直ぐ向いていることになります
     diff = target_angle - car_angle
+
+    # 今の状態を1つの記録にまとめて表示します（5秒に1回まで）
+    log.info("state", x=x1, y=y1, car_angle=car_angle, target_angle=target_angle,
+             distance=distance, diff=diff)
     driver.setSteeringAngle(0.5 * -diff)
\ No newline at end of file
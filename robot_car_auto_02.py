@@ -14,11 +14,22 @@ LIDAR（レーザースキャナー）を使って前方の障害物を検知し
 run1とrun2の違いとしては、
 run1ではif文によってハンドルの切り替え向きをしていたが、
 run2ではポテンシャル法によってハンドルの切り替えを合成している。
+run3ではダイナミックウィンドウ法で、たくさんの (速度, ハンドルの角度) の候補を先読みして一番よいものを選んでいる。
 
 """
-import cv2             # 画像処理のための強力なライブラリ「OpenCV」を読み込みます。
+# 起動を速くするため、いつも使うわけではない部品（OpenCV・記録・別スレッドなど）は、使うときに読み込みます。
+# OpenCV（cv2）は、lane_detector で backend="opencv" を選んだときだけ読み込まれます。
+# 車の向きの推定（pose_estimator）・障害物の記憶（obstacle_memory）・地図（occupancy_grid）・
+# ダイナミックウィンドウ法（dwa_planner）は、run2 / run3（と USE_OCCUPANCY_GRID）で使うときに読み込みます。
 import numpy as np     # 数値計算や配列（画像のピクセルデータなど）を高速に扱うためのライブラリ「NumPy」を読み込みます。
 import math
+import threading       # 認識処理の別スレッドと、PID やフィルタの記録を取り合わないための鍵（Lock）
+import lane_detector   # 黄色ライン検出（NumPyでまとめて計算する部品）
+import filters           # 移動平均などのフィルタ
+import scheduler         # 決まった間隔でタスクを実行する予定表
+import stage_timer       # 処理ごとの時間を測る部品
+import car_logger        # 回数を制限して表示するログ
+import lidar_processing  # LiDARの距離データをNumPyでまとめて処理する部品
 from vehicle import Driver  # Webotsの自動車専用の機能（アクセルやハンドル操作）を使うための設計図を読み込みます。
 from controller import GPS, Node # GPS（位置情報）などのセンサを使うための機能を読み込みます。
 
@@ -30,9 +41,52 @@ class RobotCar():
     # --- クラス変数（この車全体で共通して使う基本設定） ---
     SPEED   = 60        # 車が走る基本スピードを設定します。
     UNKNOWN = 99999.99  # カメラで黄色い線が全く見つからなかった時に、エラーの目印として使う異常な数値です。
+    YELLOW  = [95, 187, 203] # 探したい黄色の値です。(青=95, 緑=187, 赤=203)
+    YELLOW_THRESHOLD = 30    # 色のズレがこれ未満なら黄色だと認定します
+    LANE_BACKEND = "numpy"   # 黄色ラインの検出方法 "python"(元の方法), "numpy", "lut"(色の早見表。しきい値の近くの色は少し違う答えになります), "opencv"
+    LANE_TRACK_HALF_WIDTH = 0.15 # 追跡窓の半分の幅（画面の横幅に対する割合）。0なら毎回画像全体を調べます
+    LANE_MIN_PIXELS = 20         # 追跡窓の中の黄色い点がこれより少なければ、画像全体を調べ直します
+    LANE_STATS_INTERVAL = 1000   # 追跡窓の効き目（速い方法で済んだ割合）を表示する間隔[フレーム]
+    LANE_CURVATURE_LIMIT = 0.5   # 遠くの線の曲がり具合がこれを超えたら、カーブの手前で減速します
+    # PID制御のゲイン（効き目の強さ）と目標位置。gain_sweep.py でまとめて試せます
+    TARGET_POS = 0.25 # 画面の左から何割の位置に黄色い線が来るように走るか（0.5なら中央）
+    PID_KP = 1.0      # P制御の強さ（ズレ × カメラの視野角 に掛けます）
+    PID_KI = 0.01     # I制御の強さ（蓄積されたズレを直す力。※足し算で巨大な数字になるので、とても小さな値をかけます）
+    PID_KD = 2.0      # D制御の強さ（未来予測ブレーキの強さ。猛スピードで白線に近づいた時に、行き過ぎないようあえて逆ハンドルを切るための力）
+    K_REP  = 3.0      # run2 の反発力の強さ（ゲイン）。大きくすると遠くから大きく避けます。
+    OBSTACLE_MEMORY_AGE = 1.5 # run2 で、見えなくなった障害物を覚えておく時間[s]
+    APF_FIELD = False         # Trueなら run2 で、LiDAR の全部のレーザーからの反発力と引力を2次元の力として合成します
+    K_REP_FIELD = 30.0        # APF_FIELD の反発力の強さ（引力の大きさは1です）
+    APF_INFLUENCE_DIST = 10.0 # APF_FIELD で、これより遠い物からは反発力を受けません[m]
+    APF_BUDGET_NS = 500000    # APF_FIELD の反発力の計算時間の上限[ns]。超えたらレーザーを間引きます
+    DWA_HORIZON = 2.0         # run3 で、候補ごとに何秒先まで道すじを読むか[s]
+    DWA_MARGIN  = 0.3         # run3 で、車幅の半分に足す障害物とのすきま[m]
+    SWEPT_FOOTPRINT = True    # Trueなら障害物を、黄色い線を追うハンドルの角度で曲がっていく道すじ（円弧）に沿って探します（False は正面のまっすぐの通路）
+    SWEEP_HORIZON   = 1.5     # SWEPT_FOOTPRINT で、今の速さで何秒分の道のりまで調べるか[s]（20m より短くはしません）
+    USE_PERCEPTION_WORKER = False # Trueなら認識処理（カメラ・LiDARの解析）を別スレッドで行います
+    PERCEPTION_MAX_AGE = 0.2      # 別スレッドの結果がこれ[s]より古ければ使いません
+    STAGE_TIMING = False          # Trueなら処理（ステージ）ごとの時間を測って表示します
+    STAGE_REPORT_INTERVAL = 10.0  # 処理時間のまとめを表示する間隔[s]（シミュレーションの時間）
+    TELEMETRY_FILE = None         # 毎コマの値を記録するファイル名（例 "telemetry.bin"）。None なら記録しません
+    TELEMETRY_CAPACITY = 100000   # 記録しておく件数（30ms ごとなら約50分。超えたら古い記録から上書き）
+    CAPTURE_FILE = None           # センサのデータを保存するファイル名（例 "capture.bin"）。None なら保存しません
     FILTER_SIZE = 3     # 黄色ライン用のフィルタ
+    FILTER_CONFIG = {   # 信号ごとのフィルタ（種類, 設定値）。種類は "sma"(移動平均), "ema"(指数移動平均), "median"(中央値)
+        "steering":      ("sma", FILTER_SIZE), # 操舵角：過去3回の平均
+        "obstacle_dist": ("median", 3),        # 障害物の距離：過去3回の中央値（1回だけの誤検出を無視する）
+        "speed":         ("ema", 0.3),         # 速度指令：急に変えずになめらかに
+    }
     TIME_STEP   = 30    # センサ（カメラやGPS）のデータを取得する間隔です。60[ms]（1秒間に約16回）ごとに目を開いて景色を見ます。
+    VISION_PERIOD = TIME_STEP # カメラ画像を処理する間隔[ms]
+    LIDAR_PERIOD  = TIME_STEP # LiDARを処理する間隔[ms]
+    GPS_PERIOD    = TIME_STEP # GPSを読む間隔[ms]
+    USE_OCCUPANCY_GRID = False # Trueなら run1 / run2 でも、LiDAR と GPS で車のまわりの地図（占有格子地図）を作ります（run3 は地図を使うので、いつも作ります）
+    MAP_PERIOD     = TIME_STEP # 地図を更新する間隔[ms]
+    MAP_SIZE       = 256       # 地図の大きさ[マス]（MAP_SIZE x MAP_SIZE。車を真ん中にして一緒に動きます）
+    MAP_RESOLUTION = 0.25      # 地図の1マスの大きさ[m]（256マス x 0.25m = 64m 四方）
+    LIDAR_OFFSET   = 3.6       # GPS の位置から LiDAR までの、前方向の距離[m]
     CAR_WIDTH   = 2.015 # 車幅[m]
+    WHEELBASE   = 2.995 # ホイールベース[m]（robot_car_auto_04_proto.py と同じ、PROTOファイルの値）
     CAR_LENGTH  = 5.0   # 車長[m]    
     """ 
     コンストラクタ（初期化処理）
@@ -41,12 +95,16 @@ class RobotCar():
     def __init__(self):  
         # 1. ウエルカムメッセージを表示する関数を呼び出します。
         self.welcomeMessage()    
+
         
         # 2. 車の運転手（Driver）を呼び出し、初期設定をします。
         self.driver = Driver()                   # 車を操作するコントローラーの本体を作ります。
         self.driver.setSteeringAngle(0)          # 最初のハンドルの角度を 0（まっすぐ）にします。
         self.driver.setCruisingSpeed(self.SPEED) # アクセルを踏んで、スピードを20km/hに設定します。
         self.driver.setDippedBeams(True) # ヘッドライト転倒
+
+        # ログ（走行中の様子の表示）の準備。同じ名前のログは、シミュレーションの時間で5秒に1回だけ表示します。
+        self.log = car_logger.getLogger("robot_car_auto_02", clock=self.driver.getTime)
         
         # LIDAR (SICK LMS 291)
         self.lidar = self.driver.getDevice("Sick LMS 291")
@@ -56,8 +114,12 @@ class RobotCar():
         self.lidar_fov   = self.lidar.getFov();  
         
         # Liderの性能をコンソール（画面下の黒い部分）に表示して確認します。
-        print("lidar: width=%d max_range=%d fov=%g" % \
-            (self.lidar_width, self.lidar_range, self.lidar_fov))
+        self.log.info("lidar", width=self.lidar_width, max_range=self.lidar_range, fov=self.lidar_fov)
+
+        # 各レーザーの角度・sin・cos・向きなどを最初に1回だけ計算しておきます（毎回計算し直さないため）
+        # レーザーの本数と視野角ごとに作るので、別の機種のLiDARに変えてもそのまま使えます。
+        self.lidar_geometry = lidar_processing.getLidarGeometry(self.lidar_width, self.lidar_fov)
+        self.swept_footprint = None # 車の形が曲がって通る所の早見表（calcObstacleAngleDist で最初に1回だけ作ります）
         
         # 3. GPS（カーナビ）の準備
         self.gps = self.driver.getDevice("gps")  # 車に付いている "gps" という名前の装置を取得します。
@@ -73,21 +135,85 @@ class RobotCar():
         self.camera_fov    = self.camera.getFov()     # カメラの視野角（どれくらい広く見えるか）
         
         # カメラの性能をコンソール（画面下の黒い部分）に表示して確認します。
-        print("camera: width=%d height=%d fov=%g" % \
-            (self.camera_width, self.camera_height, self.camera_fov))
+        self.log.info("camera", width=self.camera_width, height=self.camera_height, fov=self.camera_fov)
+
+        # 黄色ライン検出器（画像全体をNumPyでまとめて調べます）
+        # 色の早見表はここで1回だけ作ります。色を変えるときは self.lane_detector.setTarget() を呼びます。
+        self.lane_detector = lane_detector.LaneDetector(
+            self.camera_width, self.camera_height, [self.YELLOW], self.YELLOW_THRESHOLD,
+            backend=self.LANE_BACKEND, track_half_width=self.LANE_TRACK_HALF_WIDTH,
+            min_pixels=self.LANE_MIN_PIXELS)
 
         # 5. ディスプレイ（カメラ映像を映し出すモニター）の準備
         self.display = self.driver.getDevice("display") # "display" という名前の装置を取得します。
         self.display.attachCamera(self.camera)          # モニターにカメラの映像を接続して映し出します。
         self.display.setColor(0xFF0000)                 # モニターの文字色などを赤色(RGBのRがMAX)に設定します。
         
-        # 6.移動平均用の過去のずれ
-        self.history = []
+        # 6.移動平均用のフィルタ（信号ごとに、過去の値を入れる箱を最初に用意します）
+        self.filters = filters.FilterBank(self.FILTER_CONFIG)
         
+        # 認識処理の結果（タスクが書き込み、ハンドル操作で使います）
+        self.gps_values       = None
+        self.steering_angle   = self.UNKNOWN
+        self.obstacle_angle   = self.UNKNOWN
+        self.obstacle_dist    = self.UNKNOWN
+        self.obstacles        = np.empty(0, dtype=lidar_processing.OBSTACLE_DTYPE)
+        self.lidar_data       = None # 最後に取得した LiDAR のスキャン（APF_FIELD の反発力・run3・地図・保存でも使います）
+        self.camera_image     = None # 最後に取得したカメラ画像（保存で使います）
+        self.camera_stamp     = 0.0  # camera_image を取得した時刻[s]
+        self.perception_ready = True # 別スレッドの結果がまだ無い・古いときだけ False になります
+
+        # 処理（ステージ）ごとの時間を測る準備（STAGE_TIMING が False なら何も測りません）
+        self.stage_timer = stage_timer.StageTimer(self.STAGE_TIMING, self.STAGE_REPORT_INTERVAL)
+        # 別スレッドの認識処理は、自分専用の StageTimer で測ります（同じ表を2つのスレッドで書き換えないため）
+        self.perception_timer = stage_timer.StageTimer(self.STAGE_TIMING, self.STAGE_REPORT_INTERVAL)
+
+        # GPS の位置の変化から車の向きを推定して、LiDAR のスキャンを地図に書き込みます
+        # （向きの推定は run2 / run3 と地図でだけ使うので、startPoseEstimator() を呼んだときに作ります）
+        self.pose_estimator = None
+        self.pose = (math.nan, math.nan, math.nan) # 推定した車の位置と向き (x, y, heading)
+        self.occupancy_grid = None
+        if self.USE_OCCUPANCY_GRID:
+            self.startMap()
+
+        # 認識処理を別スレッドで行う場合の準備（画像とLiDARの箱を2つずつ確保します）
+        # 認識処理（perceive）は PID の積み重ねやフィルタの記録を書き換えるので、
+        # perceive の間と、制御ループがそれらを消すとき（resumeAutoDrive）は perception_lock を持ちます。
+        self.perception_lock = threading.Lock()
+        self.perception     = None
+        self.perception_age = 0.0 # 使った認識結果の古さ[s]
+        if self.USE_PERCEPTION_WORKER:
+            import perception_worker # 認識処理を別スレッドで動かす部品（使うときだけ読み込みます）
+            self.perception = perception_worker.PerceptionWorker(self.perceive, \
+                (self.camera_height, self.camera_width, 4), self.lidar_width)
+
         # 7.PID制御用
         self.prev_error = 0.0 # 【D制御用】1コマ前の「ズレ」を記憶するメモ帳
         
         self.integral = 0.0   # 【I制御用】過去のズレの「積み重ね（合計）」
+
+        # 記録用：PID制御の (P, I, D) それぞれの項と、実際に送ったハンドルの角度・速度
+        # （別スレッドで計算しても3つがそろった値を読めるように、1つの組にまとめて置き換えます）
+        self.pid_terms = (0.0, 0.0, 0.0)
+        self.steering_command = 0.0
+        self.speed_command    = 0.0
+        # 記録用：APF_FIELD のときの引力と反発力（車の座標: 前 x, 右 y）。使わないときは nan
+        self.force_attractive = (math.nan, math.nan)
+        self.force_repulsive  = (math.nan, math.nan)
+        self.telemetry = None
+        if self.TELEMETRY_FILE is not None:
+            import telemetry # 毎コマの値をファイルに記録する部品（使うときだけ読み込みます）
+            self.telemetry = telemetry.TelemetryRecorder(self.TELEMETRY_FILE, self.TELEMETRY_CAPACITY)
+
+        # センサのデータの保存（replay.py で、Webots を使わずに同じデータを再生できます）
+        self.capture = None
+        if self.CAPTURE_FILE is not None:
+            import sensor_capture # センサのデータを保存する部品（使うときだけ読み込みます）
+            self.capture = sensor_capture.CaptureWriter(self.CAPTURE_FILE, {
+                "basic_time_step": self.driver.getBasicTimeStep(),
+                "camera_width": self.camera_width, "camera_height": self.camera_height,
+                "camera_fov": self.camera_fov, "lidar_width": self.lidar_width,
+                "lidar_range": self.lidar_range, "lidar_fov": self.lidar_fov})
         
     """ ウエルカムメッセージ """    
     def welcomeMessage(self):
@@ -98,23 +224,30 @@ class RobotCar():
 
     """ 
     移動平均フィルタ（データのふらつきを滑らかにする機能）
-    ※現在ここは空っぽで、入ってきた数値をそのまま返しています。
-    　もし車がガタガタふらつくなら、ここに「過去数回分のハンドルの角度の平均を計算する」処理を書くとスムーズになります。
+    信号（channel）ごとに FILTER_CONFIG で決めたフィルタに通して、滑らかにした値を返します。
+    過去の値は決まった大きさの箱（リングバッファ）に入れて使い回すので、1回の計算は記録の数に関係なく一定です。
+    黄色い線や障害物が見つからなかったとき（UNKNOWN）は、平均に混ぜずにそのまま返します。
     """
-    def maFilter(self, new_value):
-        N = 5  # 過去何回分の平均をとるか（この数字を変えると滑らかさが変わります）
-        
-        # 1. 新しいハンドルの角度をメモ帳の一番最後に追加する
-        self.history.append(new_value)
-        
-        # 2. もしメモ帳の記録が N回 を超えたら、一番古い記録（0番目）を消しゴムで消す
-        if len(self.history) > N:
-            self.history.pop(0)
-            
-        # 3. メモ帳に残っている直近 N回分 の合計を出し、記録の数で割って平均を出す
-        average = sum(self.history) / len(self.history)
-        
-        return new_value # 計算した平均値を、最終的なハンドルの角度として返す
+    def maFilter(self, new_value, channel="steering"):
+        if new_value == self.UNKNOWN:
+            return new_value
+        return self.filters.update(channel, new_value) # フィルタを通した値を、最終的な値として返す
+
+    """ 
+    速度指令をフィルタに通して、なめらかにアクセルを変えます。
+    0（急ブレーキ）のときだけは、フィルタを通さずにすぐ止めます。
+    smooth=False なら、フィルタを通さずにそのままの速度を送ります（run3 のダイナミックウィンドウ法は、
+    その速度で道すじを先読みしてぶつからないことを確かめているので、遅れて速度が変わると困るため）。
+    """
+    def setSpeed(self, speed, smooth=True):
+        t0 = self.stage_timer.begin()
+        if speed == 0 or not smooth:
+            self.filters.reset("speed")
+        else:
+            speed = self.maFilter(speed, "speed")
+        self.driver.setCruisingSpeed(speed)
+        self.stage_timer.end("actuators", t0)
+        self.speed_command = speed
 
     """ 
     ステアリングの制御（ハンドルの安全装置）
@@ -132,7 +265,10 @@ class RobotCar():
             steering_angle = -LIMIT_ANGLE
             
         # 安全確認が終わった角度を、実際のタイヤのモーターに送って曲がらせます。
+        t0 = self.stage_timer.begin()
         self.driver.setSteeringAngle(steering_angle)
+        self.stage_timer.end("actuators", t0)
+        self.steering_command = steering_angle
     
     """ 
     画素と黄色の差の平均を計算（これは黄色か？の判定テスト）
@@ -156,21 +292,14 @@ class RobotCar():
     カメラの画像全体を調べて黄色い線を見つけ出し、どれくらいハンドルを切ればいいか（操舵角）を計算します。
     """
     def calcSteeringAngle(self, image):
-        YELLOW = [95, 187, 203]   # 探したい黄色の値です。(青=95, 緑=187, 赤=203)
-        sumx = 0                  # 見つけた黄色の点の「X座標（横の位置）」を全て足し算するための箱です。
-        pixel_count = 0           # 黄色い点を「何個」見つけたかを数えるカウンターです。
-        
         # 【ステップ1】画像のどこを探すか？
         # 空や遠くの景色を探しても無駄なので、画像の「上から1/3より下（道路がある場所）」だけをスキャンします。
-        # yは縦（高さ）、xは横（幅）を表します。
-        for y in range(int(1.0*self.camera_height/3.0), self.camera_height):
-            for x in range(0, self.camera_width):
-                
-                # 【ステップ2】黄色かどうかの判定
-                # さっき作った colorDiff 関数で色のズレを測り、ズレが「30未満」なら黄色だと認定します！
-                if self.colorDiff(image[y,x], YELLOW) < 30: 
-                    sumx += x         # 見つけた点のX座標（横の位置）を足し算します。
-                    pixel_count += 1  # 見つけた個数を1つ増やします。
+        # 【ステップ2】黄色かどうかの判定
+        # colorDiff と同じ計算（色のズレが「30未満」なら黄色）を、NumPyで画像全体まとめて行います。
+        # 計算の方法は LANE_BACKEND で選びます（"numpy" は colorDiff と同じ答え、"lut" は色の早見表を引くだけで判定します）。
+        # sumx:見つけた黄色の点の「X座標（横の位置）」の合計, pixel_count:黄色い点の個数
+        # 同じ計算の中で、行ごとの重心から線の形（横ずれ・向き・曲がり具合）も求めています（lane_shape）。
+        sumx, pixel_count = self.lane_detector.scan(image)
    
         # 【ステップ3】ハンドルの角度の計算
         # もし黄色い点が1個も見つからなかったら、異常事態（UNKNOWN）を返して報告します。
@@ -182,7 +311,7 @@ class RobotCar():
             
             # ターゲット位置（0.0〜1.0）。0.25なら「画面の左から25%の位置に線が来るように走る」
             # 0.5なら中央を走る
-            TARGET_POS = 0.25
+            TARGET_POS = self.TARGET_POS
             
             # 比例制御
             # 見つけた黄色の全X座標の合計（sumx）を、(黄色い点の個数 × 画面の横幅) で割ります。
@@ -218,264 +347,640 @@ class RobotCar():
             # 3. 【D制御の素】ズレの変化スピード（微分）を計算する ＝ (今のズレ - 1コマ前のズレ)
             diff_error = error - self.prev_error
             
-            # 4. 効き目の強さ（ゲイン）を設定する
-            # D制御の強さ（未来予測ブレーキの強さ。猛スピードで白線に近づいた時に、行き過ぎないようあえて逆ハンドルを切るための力）
-            Kd = 2.0 
-            # I制御の強さ（蓄積されたズレを直す力。※足し算で巨大な数字になるので、とても小さな値をかけます） 
-            Ki = 0.01
+            # 4. 効き目の強さ（ゲイン）を設定する（クラスの先頭の PID_KP, PID_KI, PID_KD）
+            Kp = self.PID_KP
+            Kd = self.PID_KD
+            Ki = self.PID_KI
             
             # 5. P、I、D すべてを足し合わせて、最終的なハンドルの角度を決める！
-            steer_angle = ((y_ave - TARGET_POS) * self.camera_fov) + (Ki * self.integral) + (Kd * diff_error)
+            #    （それぞれの項は、あとで調べられるように記録用にも覚えておきます）
+            pid_p = Kp * (y_ave - TARGET_POS) * self.camera_fov
+            pid_i = Ki * self.integral
+            pid_d = Kd * diff_error
+            self.pid_terms = (pid_p, pid_i, pid_d)
+            steer_angle = pid_p + pid_i + pid_d
             
             # 6. 次の計算（1コマ後）のために、今のズレをメモ帳に書き残しておく
             self.prev_error = error
             
             return steer_angle  # 計算した「ハンドルを切る角度」を返します。
 
+    """ 
+    カーブの手前かどうか
+    calcSteeringAngle で当てはめた線の形（lane_shape）の曲がり具合が大きければ True を返します。
+    """
+    def isCurveAhead(self):
+        lane_shape = self.lane_detector.lane_shape
+        return lane_shape is not None and abs(lane_shape[2]) > self.LANE_CURVATURE_LIMIT
+
+    """
+    カメラ画像から操舵角を計算します（maFilterで滑らかにした値）。見つからなければUNKNOWN
+    timer は処理時間を測る StageTimer です（別スレッドでは perception_timer）。
+    """
+    def processCamera(self, cv_image, timer):
+        # 画像を calcSteeringAngle に渡して、ハンドルの角度を計算させます。
+        # さらに、その角度を maFilter（移動平均）に通して滑らかにします。
+        t0 = timer.begin()
+        steering_angle = self.calcSteeringAngle(cv_image)
+        timer.end("calcSteeringAngle", t0)
+        steering_angle = self.maFilter(steering_angle)
+        self.printLaneStats()
+        return steering_angle
+
+    """
+    LiDARから (障害物の方位, 障害物の距離, 障害物の一覧) を計算します
+    sweep_steering / speed_command は、SWEPT_FOOTPRINT で道すじを調べるハンドルの角度と速度指令です
+    （None なら今の self の値を使います）。
+    """
+    def processLidar(self, lidar_data, timer, sweep_steering=None, speed_command=None):
+        # 障害物の方位と距離を計算します
+        t0 = timer.begin()
+        obstacle_angle, obstacle_dist = self.calcObstacleAngleDist(lidar_data, sweep_steering, speed_command)
+        timer.end("calcObstacleAngleDist", t0)
+        if obstacle_dist == self.UNKNOWN:
+            # 障害物が見えなくなったら、前の障害物の距離の記録を捨てます
+            # （次に見つけた別の障害物の距離に、古い近い距離が混ざらないように）
+            self.filters.reset("obstacle_dist")
+        else:
+            obstacle_dist = self.maFilter(obstacle_dist, "obstacle_dist")
+        # 前方の障害物を1つずつに分けた一覧も作ります（よける向きを決めるのに使います）
+        t0 = timer.begin()
+        obstacles = self.calcObstacles(lidar_data)
+        timer.end("calcObstacles", t0)
+        return obstacle_angle, obstacle_dist, obstacles
+
+    """ 
+    認識処理（脳みそ）
+    カメラ画像から操舵角を、LiDARから障害物の方位と距離を計算して、
+    (操舵角, 障害物の方位, 障害物の距離, 障害物の一覧) を返します。別スレッドから呼ばれます。
+    制御ループが書き換える値（ハンドルの角度・速度の指令）は読まずに、submit() のときに写した
+    steering_command / speed_command を使います。時間は自分専用の perception_timer で測ります。
+    """
+    def perceive(self, cv_image, lidar_data, stamp, steering_command, speed_command):
+        timer = self.perception_timer
+        with self.perception_lock:
+            steering_angle = self.processCamera(cv_image, timer)
+            # 道すじは、同じフレームで求めた黄色い線を追う角度で調べます（見えなければ、今のハンドルの角度）
+            sweep_steering = steering_angle if steering_angle != self.UNKNOWN else steering_command
+            result = (steering_angle,) + self.processLidar(lidar_data, timer, sweep_steering, speed_command)
+        timer.report(stamp)
+        return result
+
+    """ 【タスク】GPSデータを取得して、車の位置と向きを推定します（pose_estimator。使わない走り方では推定しません） """
+    def readGps(self):
+        self.gps_values = self.gps.getValues()
+        if self.pose_estimator is not None:
+            self.pose = self.pose_estimator.update(self.gps_values, self.driver.getTime())
+
+    """ 車の位置と向きの推定を始めます（run2 / run3 と地図で使います。2回目からは何もしません） """
+    def startPoseEstimator(self):
+        if self.pose_estimator is None:
+            import pose_estimator # GPSの位置の変化から、車の向きを推定する部品（使うときだけ読み込みます）
+            self.pose_estimator = pose_estimator.GpsPoseEstimator()
+
+    """ LiDAR と GPS で、車のまわりの地図（占有格子地図）を作り始めます（2回目からは何もしません） """
+    def startMap(self):
+        if self.occupancy_grid is None:
+            import occupancy_grid # LiDARとGPSで、車のまわりの地図を作る部品（使うときだけ読み込みます）
+            self.occupancy_grid = occupancy_grid.OccupancyGrid(self.MAP_SIZE, self.MAP_RESOLUTION)
+        self.startPoseEstimator()
+
+    """ 【タスク】目を開けて景色を見て（カメラ画像の取得）、操舵角を計算します """
+    def updateVision(self):
+        timer = self.stage_timer
+        t0 = timer.begin()
+        camera_image = self.camera.getImage()
+        timer.end("getImage", t0)
+        self.camera_image, self.camera_stamp = camera_image, self.driver.getTime()
+        # カメラから届いたデータはコンピュータが読みにくい暗号のような形なので、
+        # OpenCV（画像処理ライブラリ）が計算しやすい「3次元の配列（縦×横×色）」に変換します。
+        t0 = timer.begin()
+        cv_image = np.frombuffer(camera_image, np.uint8).reshape((self.camera_height, self.camera_width, 4))
+        timer.end("frombuffer", t0)
+        self.steering_angle = self.processCamera(cv_image, timer)
+
+    """ 【タスク】LiDARの距離データを取得して、障害物を探します """
+    def updateLidar(self):
+        t0 = self.stage_timer.begin()
+        lidar_data = self.lidar.getRangeImage()
+        self.stage_timer.end("getRangeImage", t0)
+        self.lidar_data = lidar_data
+        self.obstacle_angle, self.obstacle_dist, self.obstacles = self.processLidar(lidar_data, self.stage_timer)
+
+    """ 
+    【タスク】カメラとLiDARのデータを別スレッドに渡して、一番新しく出来上がった結果を受け取ります。
+    結果がまだ無いときや、PERCEPTION_MAX_AGE より古いときは perception_ready を False にします。
+    """
+    def updatePerception(self):
+        now = self.driver.getTime()
+        t0 = self.stage_timer.begin()
+        self.lidar_data = self.lidar.getRangeImage()
+        self.stage_timer.end("getRangeImage", t0)
+        # 制御ループが書き換える値は、ここで写して一緒に渡します（別スレッドが途中で変わった値を読まないように）
+        self.camera_image, self.camera_stamp = self.camera.getImage(), now
+        t0 = self.stage_timer.begin()
+        self.perception.submit(self.camera_image, self.lidar_data, now,
+                               (now, self.steering_command, self.speed_command))
+        self.stage_timer.end("submit", t0)
+        result, age = self.perception.latest(now)
+        self.perception_ready = result is not None and age <= self.PERCEPTION_MAX_AGE
+        if self.perception_ready:
+            self.perception_age = age
+            self.steering_angle, self.obstacle_angle, self.obstacle_dist, self.obstacles = result
+
+    """
+    【タスク】LiDAR のスキャンを、推定した車の位置と向きで地図に書き込みます（向きが分かるまでは何もしません）
+    スキャンは "lidar"（または "perception"）のタスクで取得したもの（lidar_data）を使います。
+    """
+    def updateMap(self):
+        if not self.pose_estimator.isReady() or self.lidar_data is None:
+            return
+        x, y, heading = self.pose
+        t0 = self.stage_timer.begin()
+        self.occupancy_grid.integrateScan(x, y, heading, self.lidar_data, self.lidar_geometry,
+                                          self.LIDAR_OFFSET)
+        self.stage_timer.end("mapping", t0)
+
+    """ 
+    タスク（決まった間隔で実行する仕事）の予定表を作ります。
+    シミュレータの1コマの長さは getBasicTimeStep() で調べるので、ワールドの設定が変わっても大丈夫です。
+    重いタスク（画像処理・LiDAR処理）は、同じコマに重ならないように自動でずらします。
+    ハンドル操作などのタスクは、この後に呼び出し側で登録します（同じコマでは登録した順に実行されます）。
+    """
+    def makeScheduler(self):
+        tasks = scheduler.TaskScheduler(self.driver.getBasicTimeStep())
+        tasks.addTask("gps", self.GPS_PERIOD, self.readGps)
+        if self.perception is None:
+            tasks.addTask("vision", self.VISION_PERIOD, self.updateVision, heavy=True)
+            sensor_task = tasks.addTask("lidar", self.LIDAR_PERIOD, self.updateLidar, heavy=True)
+        else:
+            # 別スレッドで処理する場合は、データを渡すだけなので軽いタスクです
+            sensor_task = tasks.addTask("perception", self.TIME_STEP, self.updatePerception)
+        if self.occupancy_grid is not None:
+            tasks.addTask("mapping", self.MAP_PERIOD, self.updateMap, heavy=True)
+        if self.capture is not None:
+            # カメラ・LiDAR のタスクが取得したデータを保存するので、LiDAR を取得するタスクと同じコマの、その後で実行します
+            tasks.addTask("capture", self.VISION_PERIOD, self.captureSensors,
+                          phase_ms=sensor_task.phase * tasks.basic_time_step)
+        if self.stage_timer.enabled:
+            # 処理時間のまとめを、STAGE_REPORT_INTERVAL 秒（シミュレーションの時間）ごとに表示します
+            tasks.addTask("timing", self.TIME_STEP, self.reportStageTiming)
+        return tasks
+
+    """
+    【タスク】カメラ画像・LiDAR・GPS・時刻をそのまま保存します
+    装置から読み直さずに、タスクが取得して使ったデータ（camera_image, lidar_data, gps_values）を保存します。
+    時刻はカメラ画像を取得した時刻です（再生するときに、同じコマで同じ画像とスキャンが届くように）。
+    """
+    def captureSensors(self):
+        if self.camera_image is None or self.lidar_data is None or self.gps_values is None:
+            return
+        self.capture.write(self.camera_stamp, self.camera_image, self.lidar_data, self.gps_values)
+
+    """ 【タスク】今のコマの値（GPS、ハンドル、速度、障害物、PIDの各項、APF_FIELD の力）を1件記録します """
+    def recordTelemetry(self):
+        gps = self.gps_values if self.gps_values is not None else (math.nan, math.nan, math.nan)
+        self.telemetry.append((self.scheduler.step, self.driver.getTime(), gps[0], gps[1], gps[2],
+            self.steering_angle, self.steering_command, self.speed_command,
+            self.obstacle_angle, self.obstacle_dist) + self.pid_terms
+            + self.force_attractive + self.force_repulsive)
+
+    """ ハンドル操作のタスクの後に、記録のタスクを登録します（TELEMETRY_FILE があるときだけ） """
+    def addTelemetryTask(self):
+        if self.telemetry is not None:
+            self.scheduler.addTask("telemetry", self.TIME_STEP, self.recordTelemetry)
+
+    """ 【タスク】処理時間のまとめを、ときどき表示します """
+    def reportStageTiming(self):
+        self.stage_timer.report(self.driver.getTime())
+
+    """ 走行の終わりの後片付け（別スレッドを止めて、数えた値を表示します） """
+    def finish(self):
+        self.stage_timer.printSummary("total")
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.log.info("telemetry", file=self.TELEMETRY_FILE, records=self.telemetry.written)
+        if self.capture is not None:
+            self.capture.close()
+            self.log.info("capture", file=self.CAPTURE_FILE, frames=self.capture.frame_count)
+        if self.perception is not None:
+            self.perception.stop()
+            self.perception_timer.printSummary("perception worker") # 別スレッドが止まってから表示します
+            self.log.info("perception", submitted=self.perception.submitted_count,
+                processed=self.perception.processed_count, dropped=self.perception.dropped_count,
+                stale=self.perception.stale_count)
+        if self.occupancy_grid is not None:
+            self.log.info("map", scans=self.occupancy_grid.scan_count,
+                occupied_cells=len(self.occupancy_grid.occupiedPoints()))
+
+    """ 追跡窓だけで黄色ラインを見つけられたフレームの割合を、ときどき表示します """
+    def printLaneStats(self):
+        detector = self.lane_detector
+        if detector.frame_count % self.LANE_STATS_INTERVAL == 0:
+            self.log.info("lane_roi", frames=detector.frame_count,
+                fast_path_percent=100.0 * detector.fastPathRatio())
+
     """ 障害物の方位と距離を返す. 障害物を発見できないときはUNKNOWNを返す．
         ロボットカー正面の矩形領域に障害物がある検出する    
+        sweep_steering / speed_command は SWEPT_FOOTPRINT の道すじのハンドルの角度と速度指令です（None なら self の値）
     """
-    def calcObstacleAngleDist(self, lidar_data):
+    def calcObstacleAngleDist(self, lidar_data, sweep_steering=None, speed_command=None):
             # --- 【準備】ルールの設定 ---
-            OBSTACLE_HALF_ANGLE = 20.0 # 正面から左右にどれくらい（インデックス幅）スキャンするか
+            OBSTACLE_NEAR_DIST  = 3.0  # これより先（3m以上前方）で車の通路に入ってくるレーザーだけをスキャンする
             OBSTACLE_DIST_MAX   = 20.0 # これより遠いもの（20m以上）は無視する（止まらなくていい）
             OBSTACLE_MARGIN     = 0.1  # 車幅にプラスする「安全マージン（横の隙間）」10センチ
-            
-            sumx = 0            # 障害物に当たったレーザーの「角度（インデックス）」の合計
-            collision_count = 0 # 障害物に当たったレーザーの「本数」
-            obstacle_dist   = 0.0 # 障害物までの「距離」の合計
-    
+            half_width = 0.5 * self.CAR_WIDTH + OBSTACLE_MARGIN
+
+            # --- 【曲がる道すじで調べる場合】 ---
+            # まっすぐの通路は、カーブでは「よけて通れる外側の物」に反応し、「内側の物」を見落とします。
+            # そこで、黄色い線を追うハンドルの角度（steering_angle）のまま進んだときに、車の形（車幅＋マージン x 車長）が
+            # 円弧に沿って通る帯に入っているレーザーを、全部まとめて調べます（角度ごとの早見表は最初の1回だけ作ります）。
+            # 実際のハンドルの角度（steering_command）は、障害物をよけるためにもう曲げてあるので使いません。
+            # それを使うと、よけ始めたとたんに障害物が道すじから外れ、「もう無い」と思ってよけるのをやめてしまいます。
+            # 調べる道のりは、今の速さで SWEEP_HORIZON 秒分です（遅いときも OBSTACLE_DIST_MAX までは調べます）。
+            if self.SWEPT_FOOTPRINT:
+                if self.swept_footprint is None:
+                    self.swept_footprint = lidar_processing.SweptFootprint(self.lidar_geometry, half_width, \
+                        self.CAR_LENGTH, self.LIDAR_OFFSET, self.WHEELBASE)
+                # 別スレッドでは、submit() のときに写した値が sweep_steering / speed_command に入っています
+                if sweep_steering is None:
+                    sweep_steering = self.steering_angle
+                    if sweep_steering == self.UNKNOWN:
+                        sweep_steering = self.steering_command # 線が見えないときは、今のハンドルの角度で調べます
+                if speed_command is None:
+                    speed_command = self.speed_command
+                travel_max = max(OBSTACLE_DIST_MAX, speed_command / 3.6 * self.SWEEP_HORIZON)
+                index, obstacle_dist, travel = self.swept_footprint.nearestHit(lidar_data, \
+                    sweep_steering, travel_max, travel_max)
+                if index is None:
+                    return self.UNKNOWN, self.UNKNOWN
+                return float(self.lidar_geometry.angles[index]), obstacle_dist
+
             # --- 【ステップ1】正面だけを調べる ---
-            # 360度すべて調べると横や後ろの壁に反応してしまうので、「真正面（lidar_width/2）」を中心にして、
-            # 左右20本分（OBSTACLE_HALF_ANGLE）のレーザーだけをチェックします。
-            # ※左右20本というのは、角度ではない。liderの正面が0度となる。
-            # lidar: width=180 max_range=80 fov=3.14159なので、
-            # self.lidar_width/2 - OBSTACLE_HALF_ANGLEは、180/2-20で70,
-            # self.lidar_width/2 + OBSTACLE_HALF_ANGLEは、180/2+20で110
-            for i in range(int(self.lidar_width/2 - OBSTACLE_HALF_ANGLE), \
-                int(self.lidar_width/2 + OBSTACLE_HALF_ANGLE)):
-                
-                dist = lidar_data[i] # i番目のレーザーが測った距離
-                
-                # --- 【ステップ2】近い障害物をピックアップ ---
-                # もし距離が20m未満（遠すぎる壁や空ではない）なら、障害物としてカウント！
-                if dist < OBSTACLE_DIST_MAX: 
-                    sumx += i               # カメラの時と同じ！見つけた場所（インデックス）を足す
-                    collision_count += 1    # 当たったレーザーの本数を増やす
-                    obstacle_dist += dist   # 距離を足していく
-                    
+            # 360度すべて調べると横や後ろの壁に反応してしまうので、「真正面」の通路（車幅＋マージン）に
+            # 3m以上先で入ってくるレーザーだけをチェックします。レーザーの本数ではなく、距離[m]で決めています。
+            # lidar: width=180 max_range=80 fov=3.14159なら ±20度なので、70番〜110番のレーザーを調べます。
+            start, end = self.lidar_geometry.corridorRange(half_width, OBSTACLE_NEAR_DIST)
+
+            # --- 【ステップ2】本当にぶつかるかどうかの判定（三角関数） ---
+            # レーザー1本1本を「車の座標（前方向 x = 距離×cosθ, 横方向 y = 距離×sinθ）」に直して、
+            # 横方向のずれ y が「車幅の半分＋マージン」より小さいもの＝自分の車線に被っているものを探します。
+            # θ（各レーザーの角度）の sin, cos は、コンストラクタで1回だけ計算した表（lidar_geometry）を使います。
+            # NumPyで全部のレーザーをまとめて計算し、ぶつかるものの中で一番手前のものを選びます。
+            index, obstacle_dist = lidar_processing.nearestCorridorHit(lidar_data, self.lidar_geometry, \
+                start, end, half_width, OBSTACLE_DIST_MAX)
+
             # --- 【ステップ3】障害物がない場合の処理 ---
-            if collision_count == 0 or obstacle_dist > collision_count * OBSTACLE_DIST_MAX:  
-                return self.UNKNOWN, self.UNKNOWN # 何もなかったので、UNKNOWN（見つからず）を返す
-                
-            # --- 【ステップ4】障害物の位置と距離を計算 ---
-            else:
-                # 障害物の「角度」を計算（※カメラで黄色い線の重心を求めたのと全く同じ計算式です！）
-                # obstacle_angle = (float(sumx) /(collision_count * self.lidar_width) - 0.5) * self.lidar_fov                
+            if index is None:
+                return self.UNKNOWN, self.UNKNOWN # 被っていない＝横を通り抜けられる！
+
+            # --- 【ステップ4】障害物の位置と距離 ---
+            # 一番手前のレーザーの角度（真正面を0度としたときのずれ[rad]）と、そのレーザーが測った距離を返します。
+            return float(self.lidar_geometry.angles[index]), obstacle_dist # 被っている＝衝突する！
+
+    """ 
+    LiDARの距離データを、障害物ごとに分けた一覧を返します。
+    2つの物が前にあっても、平均して「真ん中の幻の障害物」にせず、別々の障害物として返します。
+    一覧の各行は (左端の角度, 右端の角度, 一番近い距離, 幅) です（lidar_processing.OBSTACLE_DTYPE）。
+    """
+    def calcObstacles(self, lidar_data):
+        OBSTACLE_DIST_MAX = 20.0 # これより遠いもの（20m以上）は無視する
+        return lidar_processing.segmentScan(lidar_data, self.lidar_geometry, OBSTACLE_DIST_MAX)
 
-                # わかりやすいように数式を合体せず記載する
-                # 1. まず、障害物に当たったレーザーの「平均の番号（重心インデックス）」を計算する
-                # 例：80番と90番と100番のレーザーが当たったら、平均は90番になります。
-                center_ray_index = float(sumx) / collision_count 
-                
-                # 2. その平均の番号が、レーザー全体の総本数（180本）に対して「どの割合（0.0〜1.0）の位置にあるか」を計算する
-                # 例：平均が90番なら、90 / 180 = 0.5（ちょうど真ん中）になります。
-                ray_ratio = center_ray_index / self.lidar_width
-                
-                # 3. 真正面（0.5）からどれくらいズレているかを計算し、最後に視野角（fov）を掛けて実際の角度（ラジアン）に変換する
-                # 例：ray_ratioが0.5なら、(0.5 - 0.5) * fov = 0.0ラジアン（真正面にある）と計算されます。
-                obstacle_angle = (ray_ratio - 0.5) * self.lidar_fov
-                
-                # 障害物までの「距離」の平均を計算（合計距離 ÷ 当たった本数）
-                # LiDARは車の中心にあるため、障害物までの直線距離であるが、斜めとなる。
-                obstacle_dist  = obstacle_dist/collision_count
-                
-                # --- 【ステップ5】本当にぶつかるかどうかの最終判定（三角関数） ---
-                # ここが一番の山場！斜め前にある障害物が、自分の車の幅（車線）に被っているかを判定します。   
-                # 1.「まっすぐ前」を見た状態から、障害物を見るために首を横にどれくらい（何度）回したか？ —— その首を回した角度こそがθ
-                #   -0.5をしているから、正面を0度としたときのずれ
-                # 2.斜辺はliderから障害物までの直線
-                # 3.三平方の定理から「斜辺×sinΘ=高さ」なのでこれが車幅以下ならば衝突しているとみなす
-                # 4.Pythonのmath.sin(x)は引数xにラジアンをいれる。
-                # つまり、0.25の横ずれで視野角が3.14のとき、0.785 ラジアンとなり、現実のずれは４５度となるけれど、
-                # 0.25のずれであっても、視野角が1.0のときは現実のずれは、0.25ラジアン（約14度）ということ。
-                # 5.なぜ割合がラジアンになるかというと、分度器で考える場合分度器の真ん中は90度、）
-                #  分度器の「全体の 25%（0.25）]は45度となり、
-                #  「全体に対する割合（比率）」は、「全体の角度に対する割合」と完全に一致（比例）する
-                if abs(obstacle_dist * math.sin(obstacle_angle)) < 0.5 * self.CAR_WIDTH + OBSTACLE_MARGIN:
-                    return obstacle_angle, obstacle_dist # 被っている＝衝突する！
-                else:
-                    return self.UNKNOWN, self.UNKNOWN    # 被っていない＝横を通り抜けられる！
     """ 
     実行（メインループ）
     車が走っている間、ずっと「景色を見る→考える→ハンドルを切る」を繰り返す心臓部です。
     """
 
     def run1(self): 
-        step = -1
-        avoid_timer = 0 # 障害物を見つけたときに連続してよけ続ける
-        # シミュレーションが動いている限り、永遠にこの while ループの中をぐるぐる回り続けます。
-        while self.driver.step() != -1:
-            step +=1 
-            BASIC_TIME_STEP = 10 # シミュレータの「1コマ」は10[ms]です。
-            
-            # センサの更新間隔（TIME_STEP=30）ごとに1回だけ、以下の処理を行います。（つまり3コマに1回のペース）
-            if step % int(self.TIME_STEP / BASIC_TIME_STEP) == 0:
+        self.avoid_timer = 0 # 障害物を見つけたときに連続してよけ続ける
+        self.avoid_direction = 0.0 # よける向き
 
-                # 1. GPSデータの取得（現在は取得するだけで使っていません）    
-                values = self.gps.getValues()       
+        # センサの処理のタスクに、ハンドル操作（drive1）を加えます。
+        # ハンドル操作はセンサの更新間隔（TIME_STEP=30ms）ごとに1回実行されます。
+        self.scheduler = self.makeScheduler()
+        self.scheduler.addTask("drive", self.TIME_STEP, self.drive1)
+        self.addTelemetryTask()
+        self.scheduler.printTasks()
 
-                # 2. 目を開けて景色を見る（カメラ画像の取得）
-                camera_image = self.camera.getImage()
-                
-                # カメラから届いたデータはコンピュータが読みにくい暗号のような形なので、
-                # OpenCV（画像処理ライブラリ）が計算しやすい「3次元の配列（縦×横×色）」に変換します。
-                cv_image = np.frombuffer(camera_image, np.uint8).reshape((self.camera_height, self.camera_width, 4))
-
-
-                # 障害物回避
-                # Lidar
-                lidar_data = self.lidar.getRangeImage()  
-                obstacle_angle, obstacle_dist = self.calcObstacleAngleDist(lidar_data)
-                STOP_DIST = 5 # 停止距離[m]
-
-                if obstacle_dist < STOP_DIST:
-                    print("%d:Find obstacles(angle=%g, dist=%g)" % \
-                        (step, obstacle_angle, obstacle_dist))
-                    avoid_timer = 10
-                else:
-                    # 【追加】もし障害物がなくなったらストップを解除する
-                    stop = False    
-                # 3. 脳みそで考える（操舵角の計算）
-                # 変換した画像を calcSteeringAngle に渡して、ハンドルの角度を計算させます。
-                # さらに、その角度を maFilter（移動平均）に通して滑らかにします。
-                steering_angle = self.maFilter(self.calcSteeringAngle(cv_image))
+        # シミュレーションが動いている限り、永遠にこの while ループの中をぐるぐる回り続けます。
+        # 1コマ進むたびに、そのコマで実行する予定のタスクを実行します。
+        while self.driver.step() != -1:
+            self.scheduler.tick()
+        self.finish()
+
+    """ run1 のハンドル操作（if文による障害物回避） """
+    def drive1(self):
+        step = self.scheduler.step
+
+        # 別スレッドの結果がまだ無い・古すぎるときは、前の指令のまま走り続けます。
+        if not self.perception_ready:
+            return
+
+        # 障害物回避
+        STOP_DIST = 5 # 停止距離[m]
+
+        if self.obstacle_dist < STOP_DIST:
+            self.log.info("find_obstacle", step=step, angle=self.obstacle_angle, dist=self.obstacle_dist)
+            self.avoid_timer = 10
+            # よける向きは、見つけた瞬間に決めて覚えておきます（-0.5:左へ逃げる, 0.5:右へ逃げる）
+            # 障害物が自分の右側(プラス)にあるなら左へ、左側なら右へ逃げますが、
+            # 逃げる側に別の障害物があれば、空いている方へ逃げます。
+            self.avoid_direction = 0.5 * lidar_processing.escapeDirection(self.obstacles, self.obstacle_angle)
+        else:
+            # 【追加】もし障害物がなくなったらストップを解除する
+            stop = False    
+        
+        # 4. 手足を動かす（ハンドルの操作）
+        # 【モード1：回避モード】タイマーが0より大きい間は、絶対によけ続ける！
+        if self.avoid_timer > 0:
+            self.avoid_timer -= 1 # 1コマ進むごとにタイマーを1減らす
+            self.log.info("avoiding", step=step, timer=self.avoid_timer) # 障害物回避中！
+            self.setSpeed(self.SPEED * 0.5) 
+
+            # 障害物を見つけたときに決めた向きへ逃げる
+            direction = self.avoid_direction
                 
-                # 4. 手足を動かす（ハンドルの操作）
-                # 【モード1：回避モード】タイマーが0より大きい間は、絶対によけ続ける！
-                if avoid_timer > 0:
-                    avoid_timer -= 1 # 1コマ進むごとにタイマーを1減らす
-                    print("%d: 障害物回避中！(残りタイマー: %d)" % (step, avoid_timer))
-                    self.driver.setCruisingSpeed(self.SPEED * 0.5) 
-
-                    # 障害物が自分の右側(プラス)にあるなら左(マイナス)へ、左側なら右へ逃げる
-                    if obstacle_angle >= 0:
-                        direction = -0.5 # 左へ逃げる
-                    else:
-                        direction = 0.5  # 右へ逃げる
-                        
-                    if avoid_timer < 4:
-                        self.control(-direction)
-                    else:
-                        self.control(direction)
-                    
-                # 黄色い線が見つかっている場合
-                elif steering_angle != self.UNKNOWN:
-                    print("%d:Find the yellow line" % step)   # コンソールに「線を見つけた！」と表示
-                    
-                    if abs(steering_angle) > 0.05:
-                        self.driver.setCruisingSpeed(self.SPEED * 0.5) # カーブのときは減速する
-                    else:
-                        self.driver.setCruisingSpeed(self.SPEED)  # アクセルを踏んでスピードを維持します
-                    self.control(steering_angle)              # 計算した角度の通りにハンドルを切ります
-                    
-                # 黄色い線を見失っている場合
-                else: 
-                    print("%d:Lost the yellow line" % step)   # コンソールに「見失った！」と表示
-                    self.driver.setCruisingSpeed(0)           # 危険なので、スピードを0にして急ブレーキをかけます！
+            if self.avoid_timer < 4:
+                self.control(-direction)
+            else:
+                self.control(direction)
+            
+        # 黄色い線が見つかっている場合
+        elif self.steering_angle != self.UNKNOWN:
+            self.log.info("find_yellow_line", step=step, steering=self.steering_angle) # 「線を見つけた！」
+            
+            # カーブのときは減速する（ハンドルを切る前でも、遠くの線が曲がっていれば減速する）
+            if abs(self.steering_angle) > 0.05 or self.isCurveAhead():
+                self.setSpeed(self.SPEED * 0.5)
+            else:
+                self.setSpeed(self.SPEED)  # アクセルを踏んでスピードを維持します
+            self.control(self.steering_angle)              # 計算した角度の通りにハンドルを切ります
+            
+        # 黄色い線を見失っている場合
+        else: 
+            self.log.warning("lost_yellow_line", step=step) # 「見失った！」
+            self.setSpeed(0)                          # 危険なので、スピードを0にして急ブレーキをかけます！
 
     """ 
     実行（メインループ）
     車が走っている間、ずっと「景色を見る→考える→ハンドルを切る」を繰り返す心臓部です。
     """
     def run2(self): 
-        step = -1        
-        # 【追加】ポテンシャル法の「記憶」用の変数
-        memory_timer = 0
+        # 【追加】ポテンシャル法の「記憶」：見つけた障害物を世界の座標で覚えておきます
+        import obstacle_memory # 見つけた障害物を世界の座標で覚えておく部品（run2 だけで使うので、ここで読み込みます）
+        self.obstacle_memory = obstacle_memory.ObstacleMemory(max_age=self.OBSTACLE_MEMORY_AGE)
+        self.startPoseEstimator() # 障害物を世界の座標に直すのに、車の位置と向きを使います
+        # APF_FIELD のときの、LiDAR の全部のレーザーからの反発力
+        self.repulsive_field = lidar_processing.RepulsiveField(self.lidar_geometry,
+            self.APF_INFLUENCE_DIST, self.APF_BUDGET_NS)
+
+        # センサの処理のタスクに、ハンドル操作（drive2）を加えます。
+        self.scheduler = self.makeScheduler()
+        self.scheduler.addTask("drive", self.TIME_STEP, self.drive2)
+        self.addTelemetryTask()
+        self.scheduler.printTasks()
+
         # シミュレーションが動いている限り、永遠にこの while ループの中をぐるぐる回り続けます。
         while self.driver.step() != -1:
-            step +=1 
-            BASIC_TIME_STEP = 10 # シミュレータの「1コマ」は10[ms]です。
-            
-            # センサの更新間隔（TIME_STEP=30）ごとに1回だけ、以下の処理を行います。（つまり3コマに1回のペース）
-            if step % int(self.TIME_STEP / BASIC_TIME_STEP) == 0:
+            self.scheduler.tick()
+        self.finish()
+
+    """
+    今のスキャンの障害物を、推定した車の位置と向きで世界の座標に直して obstacle_memory に記録します。
+    正面の通路をふさいでいる障害物（calcObstacleAngleDist で見つけたもの）は新しく覚え、逃げる向きも決めます。
+    それ以外の障害物は、前に覚えたものと同じときだけ位置と時刻を新しくします（道ばたの物は覚えません）。
+    """
+    def rememberObstacles(self, avoid_dist):
+        x, y, heading = self.pose
+        now = self.driver.getTime()
+        sx = x + self.LIDAR_OFFSET * math.cos(heading) # LiDAR の位置
+        sy = y + self.LIDAR_OFFSET * math.sin(heading)
+        blocking = self.obstacle_dist != self.UNKNOWN and self.obstacle_dist < avoid_dist
+        found_blocking = False
+        for obstacle in self.obstacles:
+            if obstacle["nearest_dist"] >= avoid_dist:
+                continue
+            # 障害物の真ん中は、一番近い点から半径の分だけ奥です（角度はプラスが右なので、世界の角度では引きます）
+            radius = max(0.5 * float(obstacle["width"]), 0.2)
+            angle  = heading - 0.5 * float(obstacle["start_angle"] + obstacle["end_angle"])
+            dist   = float(obstacle["nearest_dist"]) + radius
+            is_blocking = blocking and obstacle["start_angle"] <= self.obstacle_angle <= obstacle["end_angle"]
+            direction = 0.0
+            if is_blocking:
+                # 障害物が自分の右側(プラス)にあるなら左(マイナス)へ、左側なら右へ逃げる
+                # （逃げる側に別の障害物があれば、空いている方へ逃げる）
+                direction = 0.5 * lidar_processing.escapeDirection(self.obstacles, self.obstacle_angle)
+                found_blocking = True
+            self.obstacle_memory.observe(sx + dist * math.cos(angle), sy + dist * math.sin(angle),
+                                         radius, now, direction, new=is_blocking)
+        if blocking and not found_blocking:
+            # 一覧に無いとき（念のため）は、見つけたレーザーの先の点を小さな障害物として覚えます
+            angle = heading - self.obstacle_angle
+            self.obstacle_memory.observe(sx + self.obstacle_dist * math.cos(angle),
+                sy + self.obstacle_dist * math.sin(angle), 0.2, now,
+                0.5 * lidar_processing.escapeDirection(self.obstacles, self.obstacle_angle))
+
+    """
+    覚えている障害物のうち、avoid_dist[m] 以内で、まだ車（LiDAR）より前にあるもの全部からの反発力を足し合わせます。
+    1つ1つの反発力は、今までと同じ  逃げる向き * K_REP * (1 / 障害物の表面までの距離)  です。
+    """
+    def calcRepulsion(self, avoid_dist, k_rep):
+        import obstacle_memory # 覚えた障害物の中身の番号（X, Y, ...）を使います（run2 で読み込み済みです）
+        x, y, heading = self.pose
+        now = self.driver.getTime()
+        cos_h, sin_h = math.cos(heading), math.sin(heading)
+        sx, sy = x + self.LIDAR_OFFSET * cos_h, y + self.LIDAR_OFFSET * sin_h
+        repulsive_steer = 0.0
+        for entry in self.obstacle_memory.query(sx, sy, avoid_dist, now):
+            dx, dy = entry[obstacle_memory.X] - sx, entry[obstacle_memory.Y] - sy
+            if dx * cos_h + dy * sin_h <= 0.0:
+                continue # もう横か後ろにある障害物からは逃げません
+            safe_dist = max(math.hypot(dx, dy) - entry[obstacle_memory.RADIUS], 0.1)
+            repulsive_steer += entry[obstacle_memory.DIRECTION] * k_rep * (1.0 / safe_dist)
+            if now > entry[obstacle_memory.LAST_SEEN]:
+                # 視界ロスト！しかし覚えている障害物から回避継続中...
+                self.log.info("repulsion_memory", step=self.scheduler.step, dist=safe_dist,
+                              age=now - entry[obstacle_memory.LAST_SEEN])
+        return repulsive_steer
+
+    """
+    【ベクトルのポテンシャル法】カメラの引力と、LiDAR の全部のレーザーからの反発力を、
+    2次元の力（車の座標: 前 x, 右 y）として足し合わせ、合成した力の向きをハンドルの角度として返します。
+      引力   : ハンドルを切りたい向き attractive_steer を向いた、大きさ1の力
+      反発力 : lidar_processing.RepulsiveField（近い物ほど強く 1/d² で押し返す力の合計）× K_REP_FIELD
+    力の成分は force_attractive / force_repulsive に入れておきます（テレメトリに記録します）。
+    """
+    def calcFieldSteering(self, attractive_steer):
+        t0 = self.stage_timer.begin()
+        repulsive_x, repulsive_y = self.repulsive_field.compute(self.lidar_data) # "lidar" のタスクで取得したスキャン
+        self.stage_timer.end("repulsiveField", t0)
+        self.force_attractive = (math.cos(attractive_steer), math.sin(attractive_steer))
+        self.force_repulsive  = (self.K_REP_FIELD * repulsive_x, self.K_REP_FIELD * repulsive_y)
+        total_x = self.force_attractive[0] + self.force_repulsive[0]
+        total_y = self.force_attractive[1] + self.force_repulsive[1]
+        self.log.info("apf_field", step=self.scheduler.step, attractive_x=self.force_attractive[0],
+            attractive_y=self.force_attractive[1], repulsive_x=self.force_repulsive[0],
+            repulsive_y=self.force_repulsive[1], rays=self.repulsive_field.ray_count,
+            stride=self.repulsive_field.stride)
+        # 右がプラスなので、atan2(右, 前) がそのままハンドルの角度になります
+        return math.atan2(total_y, total_x)
+
+    """ run2 のハンドル操作（ポテンシャル法による障害物回避） """
+    def drive2(self):
+        step = self.scheduler.step
+
+        # 別スレッドの結果がまだ無い・古すぎるときは、前の指令のまま走り続けます。
+        if not self.perception_ready:
+            return
+
+        # 【元のコードをそのまま利用】カメラ画像から計算した、黄色い線を追うための角度（steering_angle）と、
+        # LiDARから計算した障害物の方位と距離を使います（どちらもタスクが更新しています）。
+
+        # ==========================================================
+        # 3. 脳みそで考える（ポテンシャル法による操舵角の計算）
+        # ==========================================================
+
+        # ① 引力（黄色い線へ向かう力）
+        if self.steering_angle != self.UNKNOWN:
+            attractive_steer = self.steering_angle # 線が見えていれば、そのPIDの角度がそのまま「引力」になる
+        else:
+            # 線を見失った場合は、右側通行なので「左側」に線があるはず。
+            # 探すために、ゆっくり左(-0.1)へ引っ張られる引力を設定しておく。
+            attractive_steer = -0.3
+
+        # ② 斥力（障害物から逃げる力）
+        repulsive_steer = 0.0
+        OBS_AVOID_DIST = 10.0 # 障害物の10m以内に近づいたら反発力を発生させる
+        K_REP = self.K_REP # 反発力の強さ（ゲイン）。大きくすると遠くから大きく避けます。
+
+        if self.APF_FIELD:
+            # 【ベクトル】LiDAR の全部のレーザーからの反発力と引力を2次元の力として合成し、
+            # その力の向きと引力だけの向きとの差を、斥力の分とします（最初のスキャンが届くまでは斥力0）
+            if self.lidar_data is not None:
+                repulsive_steer = self.calcFieldSteering(attractive_steer) - attractive_steer
+
+        elif self.pose_estimator.isReady():
+            # 【追加】見つけた障害物を世界の座標で覚えて、覚えている近くの障害物全部から反発力を計算する！
+            # （正面の通路から外れて見えなくなっても、まだ車の前にある間は逃げ続けます）
+            self.rememberObstacles(OBS_AVOID_DIST)
+            repulsive_steer = self.calcRepulsion(OBS_AVOID_DIST, K_REP)
+
+        elif self.obstacle_dist != self.UNKNOWN and self.obstacle_dist < OBS_AVOID_DIST:
+            # 走り始めで車の向きがまだ分からない間は、今見えている障害物だけから逃げます
+            direction = 0.5 * lidar_processing.escapeDirection(self.obstacles, self.obstacle_angle)
+
+            # 【ポテンシャル法の要】距離が近いほど反発力が強くなる計算式： K * (1 / 障害物との距離)
+            safe_dist = max(self.obstacle_dist, 0.1)
+            repulsive_steer = direction * K_REP * (1.0 / safe_dist)
+
+        # ③ 力の合成（引力 ＋ 斥力）
+        # 最終的なハンドルの角度は、この2つの力を足し算するだけで決まる！
+        total_steer = attractive_steer + repulsive_steer
+
+
+        # ==========================================================
+        # 4. 手足を動かす（ハンドルの操作とアクセル）
+        # ==========================================================
+        
+        # コンソールで「引力と斥力の綱引き」の様子を観察できるように表示します（5秒に1回まで）
+        self.log.info("apf", step=step, attractive=attractive_steer, repulsive=repulsive_steer,
+                      total=total_steer)
+        
+        # 急カーブ（障害物に近くて反発力が強い時など）は安全のために減速する
+        # 遠くの線が曲がっている（カーブの手前）ときも減速する
+        if abs(total_steer) > 0.1 or self.isCurveAhead():
+            self.setSpeed(self.SPEED * 0.5)
+        else:
+            self.setSpeed(self.SPEED)
+        
+        # 合成した力の通りにハンドルを切る！
+        # （※万が一計算結果が大きすぎても、controlメソッド内の LIMIT_ANGLE が安全に制限してくれます）
+        self.control(total_steer)
+
+    """ 
+    実行（メインループ）
+    車が走っている間、ずっと「景色を見る→考える→ハンドルを切る」を繰り返す心臓部です。
+    """
+    def run3(self): 
+        # ダイナミックウィンドウ法：(速度, ハンドルの角度) の候補の道すじを、最初に1回だけ全部計算しておきます
+        import dwa_planner # ダイナミックウィンドウ法の部品（run3 だけで使うので、ここで読み込みます）
+        self.dwa_planner = dwa_planner.DwaPlanner(self.SPEED / 3.6, self.WHEELBASE, self.CAR_WIDTH,
+            self.LIDAR_OFFSET, horizon=self.DWA_HORIZON, margin=self.DWA_MARGIN)
+        # LiDAR の後ろに行った障害物を地図で覚えておくので、USE_OCCUPANCY_GRID が False でも地図を作ります
+        self.startMap()
+
+        # センサの処理のタスクに、ハンドル操作（drive3）を加えます。
+        self.scheduler = self.makeScheduler()
+        self.scheduler.addTask("drive", self.TIME_STEP, self.drive3)
+        self.addTelemetryTask()
+        self.scheduler.printTasks()
 
-                # 1. GPSデータの取得（現在は取得するだけで使っていません）    
-                values = self.gps.getValues()       
+        # シミュレーションが動いている限り、永遠にこの while ループの中をぐるぐる回り続けます。
+        while self.driver.step() != -1:
+            self.scheduler.tick()
+        self.finish()
 
-                # 2. 目を開けて景色を見る（カメラ画像の取得）
-                camera_image = self.camera.getImage()
-                cv_image = np.frombuffer(camera_image, np.uint8).reshape((self.camera_height, self.camera_width, 4))
+    """
+    地図（occupancy_grid）で障害物があるマスのうち、LiDAR より後ろ（横を通り過ぎていて、もう見えない所）で
+    車の近くにあるものを、車の座標（前 x, 右 y。原点は車の位置）の点の配列にして返します。
+    地図が無いときや、車の向きがまだ分からないときは None を返します。
+    """
+    def mapPointsBehindLidar(self):
+        if self.occupancy_grid is None or not self.pose_estimator.isReady():
+            return None
+        x, y, heading = self.pose
+        points = self.occupancy_grid.occupiedPoints()
+        dx, dy = points[:, 0] - x, points[:, 1] - y
+        forward = dx * math.cos(heading) + dy * math.sin(heading)
+        right   = dx * math.sin(heading) - dy * math.cos(heading) # 右がプラスなので、左向きの成分の逆です
+        behind = (forward < self.LIDAR_OFFSET) & (forward > -self.CAR_LENGTH) & (np.abs(right) < self.CAR_LENGTH)
+        return np.stack([forward[behind], right[behind]], axis=1)
 
-                # 障害物回避 (Lidar)
-                lidar_data = self.lidar.getRangeImage()  
-                obstacle_angle, obstacle_dist = self.calcObstacleAngleDist(lidar_data)
+    """ 
+    run3 のハンドル操作（ダイナミックウィンドウ法による障害物回避）
+    今の速度から届く (速度, ハンドルの角度) の候補を全部先読みして、ぶつからずに、黄色い線を追う角度に近く、
+    障害物から離れて、速く走れる候補を選びます（dwa_planner.DwaPlanner）。
+    """
+    def drive3(self):
+        step = self.scheduler.step
 
+        # 別スレッドの結果がまだ無い・古すぎるときや、LiDAR のスキャンがまだ無いときは、前の指令のまま走り続けます。
+        if not self.perception_ready or self.lidar_data is None:
+            return
 
-                # ==========================================================
-                # 3. 脳みそで考える（ポテンシャル法による操舵角の計算）
-                # ==========================================================
-                
-                # 【元のコードをそのまま利用】カメラ画像から、黄色い線を追うための角度を計算
-                camera_steering = self.maFilter(self.calcSteeringAngle(cv_image))
-
-                # ① 引力（黄色い線へ向かう力）
-                if camera_steering != self.UNKNOWN:
-                    attractive_steer = camera_steering # 線が見えていれば、そのPIDの角度がそのまま「引力」になる
-                else:
-                    # 線を見失った場合は、右側通行なので「左側」に線があるはず。
-                    # 探すために、ゆっくり左(-0.1)へ引っ張られる引力を設定しておく。
-                    attractive_steer = -0.3
-
-                # ② 斥力（障害物から逃げる力）
-                repulsive_steer = 0.0
-                OBS_AVOID_DIST = 10.0 # 障害物の10m以内に近づいたら反発力を発生させる
-                
-                if obstacle_dist != self.UNKNOWN and obstacle_dist < OBS_AVOID_DIST:
-                    K_REP = 3.0 # 反発力の強さ（ゲイン）。大きくすると遠くから大きく避けます。
-                    
-                    # 障害物が自分の右側(プラス)にあるなら左(マイナス)へ、左側なら右へ逃げる
-                    if obstacle_angle >= 0:
-                        direction = -0.5 # 左へ逃げる
-                    else:
-                        direction = 0.5  # 右へ逃げる
-
-                    # 【ポテンシャル法の要】距離が近いほど反発力が強くなる計算式： K * (1 / 障害物との距離)
-                    safe_dist = max(obstacle_dist, 0.1)
-                    repulsive_steer = direction * K_REP * (1.0 / safe_dist)
-
-                    # 【追加】今計算した斥力を「記憶」し、タイマーをセットする！
-                    # （約1.5秒間は、視界から消えてもこの反発力を信じる）
-                    repulsive_memory = repulsive_steer
-                    memory_timer = 50
-                    
-                elif memory_timer > 0:
-                    memory_timer -= 1 # 時間を減らす
-                    repulsive_steer = repulsive_memory # 記憶しておいた斥力を使い続ける！
-                    print(" -> 視界ロスト！しかし斥力を記憶して回避継続中... (残: %d)" % memory_timer)
-
-                # ③ 力の合成（引力 ＋ 斥力）
-                # 最終的なハンドルの角度は、この2つの力を足し算するだけで決まる！
-                total_steer = attractive_steer + repulsive_steer
-
-
-                # ==========================================================
-                # 4. 手足を動かす（ハンドルの操作とアクセル）
-                # ==========================================================
-                
-                # コンソールで「引力と斥力の綱引き」の様子を観察できるように表示します
-                print("%d: APF制御中 (引力: %.2f, 斥力: %.2f, 合計: %.2f)" % \
-                      (step, attractive_steer, repulsive_steer, total_steer))
-                
-                # 急カーブ（障害物に近くて反発力が強い時など）は安全のために減速する
-                if abs(total_steer) > 0.1:
-                    self.driver.setCruisingSpeed(self.SPEED * 0.5)
-                else:
-                    self.driver.setCruisingSpeed(self.SPEED)
-                
-                # 合成した力の通りにハンドルを切る！
-                # （※万が一計算結果が大きすぎても、controlメソッド内の LIMIT_ANGLE が安全に制限してくれます）
-                self.control(total_steer)
+        # 目標のハンドルの角度は、run2 の引力と同じです（線を見失ったら、左にあるはずの線の方へ）
+        if self.steering_angle != self.UNKNOWN:
+            target_steer = self.steering_angle
+        else:
+            target_steer = -0.3
+
+        # カーブのときは、候補の速度の上限を半分にします
+        speed_limit = self.SPEED
+        if abs(target_steer) > 0.1 or self.isCurveAhead():
+            speed_limit = self.SPEED * 0.5
+
+        # 今の速度[km/h]（走り始めで分からないときは止まっているとします）
+        current_speed = self.driver.getCurrentSpeed()
+        if math.isnan(current_speed):
+            current_speed = 0.0
+
+        # 今の LiDAR の点と、もう LiDAR の後ろに行って見えない、地図で覚えている障害物の点で候補を採点します
+        t0 = self.stage_timer.begin()
+        speed, steer = self.dwa_planner.plan(self.lidar_data, self.lidar_geometry,
+            current_speed / 3.6, target_steer, speed_limit / 3.6, self.mapPointsBehindLidar())
+        self.stage_timer.end("dwa", t0)
+
+        planner = self.dwa_planner
+        self.log.info("dwa", step=step, target=target_steer, steer=steer, speed=speed * 3.6,
+                      clearance=planner.clearance, candidates=planner.candidate_count,
+                      admissible=planner.admissible_count)
+        if planner.admissible_count == 0:
+            self.log.warning("dwa_no_path", step=step) # どの候補もぶつかる！急ブレーキ
+
+        # 選んだ速度は、先読みでぶつからないと確かめた速度なので、フィルタを通さずにそのまま送ります
+        self.setSpeed(speed * 3.6, smooth=False)
+        self.control(steer)
 
 """ 
 メイン関数
@@ -485,6 +990,7 @@ def main():
     robot_car = RobotCar() # 「RobotCar」という設計図をもとに、実体の車（インスタンス）を1台生み出します。
     # robot_car.run1()        # if文による障害物回避
     robot_car.run2()      # ポテンシャル法による障害物回避
+    # robot_car.run3()      # ダイナミックウィンドウ法による障害物回避
     
 """ 
 このスクリプトを直接実行した時のおまじない
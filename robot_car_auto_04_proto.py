@@ -7,6 +7,7 @@
 """
 
 import math
+import car_logger # 回数を制限して表示するログ
 from vehicle import Driver
 
 TIME_STEP = 60
@@ -16,6 +17,9 @@ driver = Driver()
 driver.setSteeringAngle(0.0)
 driver.setCruisingSpeed(10)
 
+# ログの準備。毎コマの値は、シミュレーションの時間で5秒に1回だけ表示します（CAR_LOG_LEVEL=DEBUG なら細かい値も表示）
+log = car_logger.getLogger("robot_car_auto_04_proto", clock=driver.getTime)
+
 
 # 車の向きを覚えるための変数
 x1, y1 = -45.0, 45.88
@@ -47,24 +51,22 @@ while driver.step() != -1:
     x1 += speed_ms * math.cos(car_angle) * dt
     y1 += speed_ms * math.sin(car_angle) * dt
 
-    print(f"posion:{x1,y1}")
+    log.debug("position", x=x1, y=y1)
 
     if 'wp_idx' not in locals(): wp_idx = 0
     way_point = targets[wp_idx]
 
     # 目標への方角（ワールド座標での角度）。角度は公式「アークタンジェント＊（高さ/底辺）」で求められる。
     target_angle = math.atan2(way_point[1] - y1, way_point[0] - x1)
-    
-    print(f"target_angle(ラジアン）: {target_angle}")
-    print(f"target_angle(角度）: {math.degrees(target_angle)}")
+    log.debug("target_angle", rad=target_angle, deg=math.degrees(target_angle))
     
     # 車とウェイポイントの２点の距離を計算（弾同士の当たり判定と同じ理屈）
     distance = math.sqrt((x1 - way_point[0])**2 + (y1 - way_point[1])**2)
     
-    print(f"distance:{distance}")
     # 次のウェイポイントに向かう
     if distance < 5:
         wp_idx = (wp_idx + 1) % len(targets)
+        log.info("next_waypoint", index=wp_idx, x=targets[wp_idx][0], y=targets[wp_idx][1])
 
     # 「目標の方角」から「今の車の向き」を引いて、ズレを出す
     # この diff が 0 になれば、車は目標を真っ直ぐ向いていることになります
@@ -73,5 +75,7 @@ while driver.step() != -1:
     # 「角度の正規化」を行う-3.14から3.14の範囲にする
     while diff > math.pi: diff -= 2.0 * math.pi
     while diff < -math.pi: diff += 2.0 * math.pi
-    print(f"diff:{diff}")
+
+    # 今の状態を1つの記録にまとめて表示します（5秒に1回まで）
+    log.info("state", x=x1, y=y1, target_angle=target_angle, distance=distance, diff=diff)
     driver.setSteeringAngle(0.5 * -diff)
\ No newline at end of file
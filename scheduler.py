@@ -0,0 +1,83 @@
+"""
+いくつもの仕事（タスク）を、それぞれ決まった間隔で実行するための部品です。
+
+これまでの run1 / run2 は「シミュレータの1コマ=10ms」と決めつけて、
+step % (TIME_STEP / 10) == 0 のときにカメラ・LiDAR・GPS・キーボードを全部まとめて処理していました。
+TaskScheduler は、シミュレータの本当の1コマの長さ（getBasicTimeStep()）を使い、
+タスクごとに「何msごとに実行するか（周期）」と「何msずらすか（位相）」を決められます。
+
+重いタスク（画像処理やLiDAR処理）は heavy=True で登録すると、位相を自動でずらして、
+なるべく同じコマで重いタスクが重ならないようにします。
+"""
+import math
+
+
+""" 1つのタスク（実行する関数と、その周期・位相[コマ]） """
+class Task():
+    def __init__(self, name, func, period, phase, heavy):
+        self.name   = name
+        self.func   = func
+        self.period = period # 何コマごとに実行するか
+        self.phase  = phase  # 何コマずらすか（0 〜 period-1）
+        self.heavy  = heavy
+
+
+class TaskScheduler():
+    """ basic_time_step: シミュレータの1コマの長さ[ms]（driver.getBasicTimeStep() の値） """
+    def __init__(self, basic_time_step):
+        self.basic_time_step = float(basic_time_step)
+        self.tasks = []
+        self.step  = 0 # 今のコマの番号（tick() のたびに1つ進みます）
+
+    """ 時間[ms]を、一番近いコマ数に直します（最低1コマ） """
+    def toSteps(self, time_ms):
+        return max(1, int(round(time_ms / self.basic_time_step)))
+
+    """
+    タスクを登録します。同じコマで実行されるタスクは、登録した順に実行されます。
+      period_ms : 何msごとに実行するか
+      phase_ms  : 何msずらすか。None なら、重いタスクは自動でずらし、軽いタスクは0にします。
+      heavy     : 重いタスクなら True（ほかの重いタスクとなるべく同じコマにならないようにします）
+    """
+    def addTask(self, name, period_ms, func, phase_ms=None, heavy=False):
+        period = self.toSteps(period_ms)
+        if phase_ms is not None:
+            phase = int(round(phase_ms / self.basic_time_step)) % period
+        elif heavy:
+            phase = self.leastLoadedPhase(period)
+        else:
+            phase = 0
+        task = Task(name, func, period, phase, heavy)
+        self.tasks.append(task)
+        return task
+
+    """
+    周期 period のタスクを、すでにある重いタスクと重なるコマが一番少ない位相を返します。
+    周期 a, 位相 pa のタスクと、周期 b, 位相 pb のタスクは、(pa - pb) が gcd(a, b) で割り切れるときだけ
+    同じコマで実行されることがあるので、それを数えて比べます。
+    """
+    def leastLoadedPhase(self, period):
+        best_phase, best_load = 0, None
+        for phase in range(period):
+            load = 0
+            for task in self.tasks:
+                if task.heavy and (phase - task.phase) % math.gcd(period, task.period) == 0:
+                    load += 1
+            if best_load is None or load < best_load:
+                best_phase, best_load = phase, load
+        return best_phase
+
+    """ 1コマ分進めます。このコマで実行するタスクを全部実行します（driver.step() のたびに呼びます） """
+    def tick(self):
+        step = self.step
+        for task in self.tasks:
+            if (step - task.phase) % task.period == 0:
+                task.func()
+        self.step = step + 1
+
+    """ 登録したタスクの一覧を、周期と位相[ms]つきで表示します """
+    def printTasks(self):
+        for task in self.tasks:
+            print("task %-10s period=%gms phase=%gms%s" % (task.name,
+                task.period * self.basic_time_step, task.phase * self.basic_time_step,
+                " (heavy)" if task.heavy else ""))
@@ -0,0 +1,135 @@
+"""
+センサのデータ（カメラ画像・LiDAR・GPS・時刻）をファイルに保存して、あとで読み出すための部品です。
+
+Webots を起動して走らせなくても、保存したデータを replay.py で RobotCar にもう一度流せば、
+calcSteeringAngle や calcObstacleAngleDist を何度でも同じ条件で試せます。
+
+ファイルの形（小さく、少しずつ読めるように「かたまり（チャンク）」ごとに圧縮します）:
+  先頭   : 目印 MAGIC（8バイト）, 情報の長さ（4バイト）, 情報（カメラやLiDARの大きさなどのJSON）
+  そのあと: チャンクの繰り返し。1つのチャンクは
+            フレーム数（4バイト）, 圧縮したデータの長さ（4バイト）, zlibで圧縮したデータ
+            圧縮したデータの中身は、時刻 → GPS → LiDAR → カメラ画像 の順に、フレーム数分ずつ並んでいます。
+
+書き込みも読み込みも、1チャンク分の箱を使い回すので、長く記録してもメモリは増えません。
+"""
+import json
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"CARCAP01"
+CHUNK_HEADER = struct.Struct("<II") # フレーム数, 圧縮したデータの長さ
+
+
+class CaptureWriter():
+    """
+    path         : 保存するファイル
+    info         : カメラ・LiDARの大きさなどの情報（辞書）。camera_width, camera_height, lidar_width は必ず入れます
+    chunk_frames : 1つのチャンクにまとめるフレーム数
+    level        : zlib の圧縮レベル（1 は速さ優先）
+    """
+    def __init__(self, path, info, chunk_frames=64, level=1):
+        self.info  = dict(info)
+        self.level = level
+        self.chunk_frames = chunk_frames
+        camera_shape = (info["camera_height"], info["camera_width"], 4)
+
+        # 1チャンク分の箱（最初に1回だけ確保して使い回します）
+        self.times  = np.zeros(chunk_frames, dtype=np.float64)
+        self.gps    = np.zeros((chunk_frames, 3), dtype=np.float64)
+        self.lidars = np.zeros((chunk_frames, info["lidar_width"]), dtype=np.float32)
+        self.images = np.zeros((chunk_frames,) + camera_shape, dtype=np.uint8)
+        self.count  = 0 # 箱に入っているフレーム数
+        self.frame_count = 0 # 保存したフレームの合計
+
+        self.file = open(path, "wb")
+        header = json.dumps(self.info).encode()
+        self.file.write(MAGIC)
+        self.file.write(struct.pack("<I", len(header)))
+        self.file.write(header)
+
+    """
+    1フレーム分を保存します。
+    camera_image は camera.getImage() のバイト列、lidar_data は lidar.getRangeImage() のリスト、
+    gps_values は gps.getValues() の [x, y, z]、stamp は driver.getTime() です。
+    """
+    def write(self, stamp, camera_image, lidar_data, gps_values):
+        i = self.count
+        self.times[i] = stamp
+        self.gps[i]   = gps_values
+        self.lidars[i] = lidar_data
+        self.images[i] = np.frombuffer(camera_image, np.uint8).reshape(self.images.shape[1:])
+        self.count += 1
+        self.frame_count += 1
+        if self.count == self.chunk_frames:
+            self.flush()
+
+    """ 箱に入っているフレームを、1つのチャンクとして圧縮して書き込みます """
+    def flush(self):
+        n = self.count
+        if n == 0:
+            return
+        compressor = zlib.compressobj(self.level)
+        parts = [compressor.compress(array[:n].tobytes())
+                 for array in (self.times, self.gps, self.lidars, self.images)]
+        parts.append(compressor.flush())
+        data = b"".join(parts)
+        self.file.write(CHUNK_HEADER.pack(n, len(data)))
+        self.file.write(data)
+        self.count = 0
+
+    """ 残りを書き込んで、ファイルを閉じます """
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+""" 保存したファイルを、先頭から1フレームずつ読み出します """
+class CaptureReader():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a sensor capture file" % path)
+        (size,) = struct.unpack("<I", self.file.read(4))
+        self.info = json.loads(self.file.read(size).decode())
+        self.camera_shape = (self.info["camera_height"], self.info["camera_width"], 4)
+        self.lidar_width  = self.info["lidar_width"]
+
+    """
+    次のチャンクを読んで (時刻, GPS, LiDAR, カメラ画像) の配列を返します。もう無ければ None です。
+    配列はチャンクのデータをそのまま見せるビューなので、コピーはしません。
+    """
+    def readChunk(self):
+        header = self.file.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            return None
+        n, size = CHUNK_HEADER.unpack(header)
+        data = self.file.read(size)
+        if len(data) < size:
+            return None # 途中で記録が止まったチャンクは読みません
+        data = zlib.decompress(data)
+        arrays = []
+        offset = 0
+        for dtype, shape in ((np.float64, (n,)), (np.float64, (n, 3)),
+                             (np.float32, (n, self.lidar_width)), (np.uint8, (n,) + self.camera_shape)):
+            count = int(np.prod(shape))
+            arrays.append(np.frombuffer(data, dtype, count, offset).reshape(shape))
+            offset += count * np.dtype(dtype).itemsize
+        return tuple(arrays)
+
+    """ (時刻, カメラ画像, LiDAR, GPS) を1フレームずつ返すジェネレータです """
+    def frames(self):
+        while True:
+            chunk = self.readChunk()
+            if chunk is None:
+                return
+            times, gps, lidars, images = chunk
+            for i in range(len(times)):
+                yield times[i], images[i], lidars[i], gps[i]
+
+    def close(self):
+        self.file.close()
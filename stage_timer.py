@@ -0,0 +1,123 @@
+"""
+制御ループの中の「どの処理に何秒かかったか」を測るための部品です。
+
+run1 / run2 の1コマの中では、カメラ画像の取得（camera.getImage）、配列への変換（np.frombuffer）、
+黄色ラインの検出（calcSteeringAngle）、LiDARの取得（getRangeImage）、障害物の検出（calcObstacleAngleDist）、
+アクセル・ハンドルの操作、と色々な処理をしています。StageTimer は、それぞれの処理（ステージ）に
+名前をつけて time.perf_counter_ns() で時間を測り、ステージごとのヒストグラムに記録します。
+
+  t0 = timer.begin()
+  camera_image = self.camera.getImage()
+  timer.end("getImage", t0)
+
+【ヒストグラム】測った時間を全部覚えておくとメモリが増え続けるので、
+1マイクロ秒〜約100秒を「10%ずつ大きくなる箱」に分けて、それぞれの箱に入った回数だけを数えます。
+何回測ってもメモリは増えず、p50 / p95 / p99（50% / 95% / 99% の処理がこの時間以内に終わった）を
+10% くらいの誤差で求められます。最大値だけは正確に覚えておきます。
+
+【止めているとき】enabled=False なら begin() は 0 を返し、end() は何もせずに戻るだけなので、
+ほとんど時間はかかりません。
+"""
+import math
+import time
+
+
+""" 1つのステージの処理時間のヒストグラム（大きさが変わらない） """
+class LatencyHistogram():
+    MIN_NS  = 1000 # 一番小さい箱の境目 1マイクロ秒[ns]
+    GROWTH  = 1.1  # 箱の境目は 1.1倍ずつ大きくなります（誤差は最大10%）
+    BINS    = 200  # 箱の数（1マイクロ秒 × 1.1^200 ≒ 190秒 まで）
+    LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.counts = [0] * self.BINS
+        self.count    = 0 # 測った回数
+        self.total_ns = 0 # 合計時間[ns]
+        self.max_ns   = 0 # 一番長かった時間[ns]
+
+    """ 測った時間[ns]を1つ記録します """
+    def add(self, elapsed_ns):
+        if elapsed_ns <= self.MIN_NS:
+            index = 0
+        else:
+            index = int(math.log(elapsed_ns / self.MIN_NS) / self.LOG_GROWTH) + 1
+            if index >= self.BINS:
+                index = self.BINS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    """ 全体の ratio（0〜1）の処理がこの時間[ns]以内に終わった、という値を返します（箱の上側の境目） """
+    def quantile(self, ratio):
+        if self.count == 0:
+            return 0
+        target = ratio * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.MIN_NS * self.GROWTH ** index, self.max_ns)
+        return self.max_ns
+
+    """ 平均の時間[ns] """
+    def mean(self):
+        return self.total_ns / self.count if self.count else 0
+
+    """ 記録を全部消します """
+    def reset(self):
+        self.counts[:] = [0] * self.BINS
+        self.count    = 0
+        self.total_ns = 0
+        self.max_ns   = 0
+
+
+class StageTimer():
+    """
+    enabled         : False なら時間を測りません（ほとんど負荷がかかりません）
+    report_interval : まとめを表示する間隔[s]（シミュレーションの時間）。0 なら終わりのときだけ表示します
+    """
+    def __init__(self, enabled=True, report_interval=10.0):
+        self.enabled = enabled
+        self.report_interval = report_interval
+        self.histograms  = {} # ステージの名前 -> LatencyHistogram（最初に測った順に並びます）
+        self.last_report = 0.0
+
+    """ 時間を測り始めます。戻り値を end() に渡してください """
+    def begin(self):
+        if not self.enabled:
+            return 0
+        return time.perf_counter_ns()
+
+    """ begin() からの時間を、ステージ name の処理時間として記録します """
+    def end(self, name, start_ns):
+        if not self.enabled:
+            return
+        elapsed_ns = time.perf_counter_ns() - start_ns
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.add(elapsed_ns)
+
+    """
+    シミュレーションの時刻 sim_time[s] が、前回のまとめから report_interval 以上進んでいたら、
+    まとめを表示します（毎コマ呼んでかまいません）
+    """
+    def report(self, sim_time):
+        if not self.enabled or self.report_interval <= 0:
+            return
+        if sim_time - self.last_report >= self.report_interval:
+            self.last_report = sim_time
+            self.printSummary("t=%.1fs" % sim_time)
+
+    """ ステージごとの回数と p50 / p95 / p99 / 最大値[ms] を表示します """
+    def printSummary(self, title="summary"):
+        if not self.enabled or not self.histograms:
+            return
+        print("stage timing (%s)" % title)
+        print("  %-22s %8s %8s %8s %8s %8s %8s" % ("stage", "count", "mean", "p50", "p95", "p99", "max"))
+        for name, histogram in self.histograms.items():
+            print("  %-22s %8d %8.3f %8.3f %8.3f %8.3f %8.3f" % (name, histogram.count,
+                histogram.mean() / 1e6, histogram.quantile(0.50) / 1e6, histogram.quantile(0.95) / 1e6,
+                histogram.quantile(0.99) / 1e6, histogram.max_ns / 1e6))
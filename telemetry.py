@@ -0,0 +1,160 @@
+"""
+走行中の値（GPS、ハンドル、速度、障害物、PID制御の中身など）を、毎コマ記録するための部品です。
+
+print() で表示すると遅く、あとで調べるのも大変なので、決まった大きさ（固定長）の記録を
+ファイルにそのまま並べて書き込みます。
+  - ファイルは最初に capacity 件分の大きさで作り、メモリマップ（ファイルをメモリのように読み書きする仕組み）で開きます。
+  - 書き込みは配列の1行に値を入れるだけなので、1件あたり数マイクロ秒です。
+  - capacity 件を超えたら、一番古い記録から上書きします（リングバッファ）。
+    どれだけ長く走っても、ファイルの大きさもメモリも増えません。
+  - flush_every 件ごとに、ヘッダ（書いた件数）を更新してディスクへ書き出します。
+    途中でシミュレーションが止まっても、そこまでの記録は読み込めます。
+
+ファイルの形:
+  先頭 HEADER_SIZE バイト : ヘッダ（目印, 1件の大きさ, capacity, 書いた件数, 記録の形(dtype)のJSON）
+  そのあと               : capacity 件の記録
+
+読み込み:
+  records = telemetry.load("telemetry.bin")        # 古い順に並んだ NumPy の構造化配列
+  records["steering"], records["gps_x"] ...        # 列ごとに取り出せます
+上書きが一周していなければ、load() はファイルをコピーせずにそのまま見せます（メモリマップのビュー）。
+（走行中に読むと、読めるのは最後に書き出した（flush）ところまでです）
+"""
+import json
+
+import numpy as np
+
+MAGIC       = b"CARTLM01"
+HEADER_SIZE = 4096
+HEADER_DTYPE = np.dtype([
+    ("magic",    "S8"),
+    ("itemsize", "<u4"),
+    ("reserved", "<u4"),
+    ("capacity", "<u8"),
+    ("written",  "<u8"), # これまでに書いた件数（capacity を超えても数え続けます）
+    ("descr",    "S%d" % (HEADER_SIZE - 32)), # 記録の形（dtype.descr）のJSON
+])
+
+# RobotCar が毎コマ記録する値
+TELEMETRY_DTYPE = np.dtype([
+    ("step",           "<i4"), # コマの番号
+    ("time",           "<f8"), # シミュレーションの時刻[s]
+    ("gps_x",          "<f4"), # GPSの位置[m]（まだ取れていなければ nan）
+    ("gps_y",          "<f4"),
+    ("gps_z",          "<f4"),
+    ("lane_steering",  "<f4"), # カメラから計算した操舵角[rad]（線が無ければ UNKNOWN）
+    ("steering",       "<f4"), # 実際に送ったハンドルの角度[rad]
+    ("speed",          "<f4"), # 実際に送った速度[km/h]
+    ("obstacle_angle", "<f4"), # 障害物の方位[rad]（無ければ UNKNOWN）
+    ("obstacle_dist",  "<f4"), # 障害物の距離[m]（無ければ UNKNOWN）
+    ("pid_p",          "<f4"), # PID制御の P の項
+    ("pid_i",          "<f4"), # PID制御の I の項
+    ("pid_d",          "<f4"), # PID制御の D の項
+    ("force_att_x",    "<f4"), # run2 の APF_FIELD の引力（車の座標: 前 x, 右 y）。使わないときは nan
+    ("force_att_y",    "<f4"),
+    ("force_rep_x",    "<f4"), # run2 の APF_FIELD の反発力
+    ("force_rep_y",    "<f4"),
+])
+
+
+class TelemetryRecorder():
+    """
+    path        : 書き込むファイル
+    capacity    : 覚えておく件数（これを超えたら古い記録から上書きします）
+    dtype       : 1件の記録の形（NumPy の構造化dtype）
+    flush_every : この件数ごとにディスクへ書き出します
+    """
+    def __init__(self, path, capacity, dtype=TELEMETRY_DTYPE, flush_every=1000):
+        self.path        = path
+        self.capacity    = int(capacity)
+        self.dtype       = np.dtype(dtype)
+        self.flush_every = flush_every
+
+        descr = json.dumps(self.dtype.descr).encode()
+        if len(descr) > HEADER_DTYPE["descr"].itemsize:
+            raise ValueError("record dtype is too large for the telemetry header")
+
+        # ファイルを最後まで作ってから、ヘッダと記録の部分をそれぞれメモリマップで開きます
+        with open(path, "wb") as f:
+            f.truncate(HEADER_SIZE + self.capacity * self.dtype.itemsize)
+        self.header  = np.memmap(path, dtype=HEADER_DTYPE, mode="r+", shape=1)
+        self.records = np.memmap(path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE,
+                                 shape=self.capacity)
+        self.header["magic"]    = MAGIC
+        self.header["itemsize"] = self.dtype.itemsize
+        self.header["capacity"] = self.capacity
+        self.header["written"]  = 0
+        self.header["descr"]    = descr
+        self.written = 0  # これまでに書いた件数
+        self.index   = 0  # 次に書き込む場所
+        self.header.flush()
+
+    """ 1件書き込みます。values は dtype の並び順どおりのタプルです """
+    def append(self, values):
+        self.records[self.index] = values
+        self.index += 1
+        if self.index == self.capacity:
+            self.index = 0
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.flush()
+
+    """ 書いた件数をヘッダに書き込み、ディスクへ書き出します """
+    def flush(self):
+        self.header["written"] = self.written
+        self.records.flush()
+        self.header.flush()
+
+    """ 残りを書き出してファイルを閉じます """
+    def close(self):
+        if self.records is None:
+            return
+        self.flush()
+        self.records = None
+        self.header  = None
+
+
+"""
+記録ファイルのヘッダを読んで (記録の配列（ファイル上の並びのまま）, 書いた件数) を返します。
+記録の配列はメモリマップなので、ファイルの中身はコピーしません。
+"""
+def openRecords(path):
+    header = np.memmap(path, dtype=HEADER_DTYPE, mode="r", shape=1)[0]
+    if header["magic"] != MAGIC:
+        raise ValueError("%s is not a telemetry file" % path)
+    descr = json.loads(header["descr"].decode())
+    dtype = np.dtype([tuple(field) for field in descr])
+    if dtype.itemsize != header["itemsize"]:
+        raise ValueError("%s: record size does not match its header" % path)
+    records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=int(header["capacity"]))
+    return records, int(header["written"])
+
+
+"""
+記録ファイルを読み込んで、古い順に並んだ構造化配列を返します。
+上書きが一周していなければ、コピーせずにファイルをそのまま見せるビューを返します。
+一周していれば、古い部分と新しい部分をつなぐために1回だけコピーします
+（コピーしたくなければ loadSegments() を使ってください）。
+"""
+def load(path):
+    older, newer = loadSegments(path)
+    if len(older) == 0:
+        return newer
+    if len(newer) == 0:
+        return older
+    return np.concatenate([older, newer])
+
+
+"""
+記録ファイルを読み込んで、(古い部分, 新しい部分) の2つのビューを返します（どちらもコピーしません）。
+上書きが一周していなければ、古い部分は長さ0です。
+"""
+def loadSegments(path):
+    records, written = openRecords(path)
+    capacity = len(records)
+    if written <= capacity:
+        return records[:0], records[:written]
+    split = written % capacity
+    if split == 0:
+        return records, records[:0]
+    return records[split:], records[:split]
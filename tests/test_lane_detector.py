@@ -0,0 +1,63 @@
+"""
+lane_detector.LaneDetector の追跡窓のテストです。
+線が動いたり曲がったりする画像の列で、追跡窓を使ったときと、毎回画像全体を調べたときの
+重心と線の形が同じになることを確かめます。
+
+使い方:  python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lane_detector
+
+YELLOW    = [95, 187, 203]
+THRESHOLD = 30
+
+
+"""
+灰色の道路に、曲がった黄色い線を描いた画像（BGRA）の列を作ります。
+線は左右に揺れながら曲がり具合を変え、jump_every フレームごとに大きく横に跳びます。
+"""
+def makeCurveSequence(width, height, count, jump_every=40):
+    rng = np.random.default_rng(1)
+    line_width = max(2, width // 32)
+    v = (height - 1 - np.arange(height)) / float(height)
+    frames = []
+    for i in range(count):
+        image = rng.integers(60, 120, size=(height, width, 4), dtype=np.uint8)
+        image[:, :, 3] = 255
+        offset = 0.3 + 0.1 * np.sin(i * 0.07) + (0.25 if (i // jump_every) % 2 else 0.0)
+        centers = width * (offset + 0.1 * v + 0.6 * np.sin(i * 0.03) * v ** 2)
+        for y in range(height):
+            x0 = int(centers[y])
+            if 0 <= x0 < width:
+                image[y, x0:x0 + line_width, :3] = YELLOW
+        frames.append(image)
+    return frames
+
+
+""" 追跡窓を使っても、画像全体を調べたときと同じ (sumx, pixel_count) と線の形になること """
+def test_tracking_matches_full_scan_on_curves():
+    width, height = 128, 64
+    full    = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD, track_half_width=0)
+    tracked = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD)
+    for index, image in enumerate(makeCurveSequence(width, height, 200)):
+        assert tracked.scan(image) == full.scan(image), "frame %d" % index
+        assert tracked.lane_shape == full.lane_shape, "frame %d" % index
+    # 追跡窓で済んだフレームもあること（全部を調べ直しているだけではないこと）
+    assert 0.0 < tracked.fastPathRatio() < 1.0
+
+
+""" 線が追跡窓の端にかかったら、画像全体を調べ直すこと """
+def test_line_cut_by_window_falls_back():
+    width, height = 128, 64
+    detector = lane_detector.LaneDetector(width, height, [YELLOW], THRESHOLD)
+    image = np.full((height, width, 4), 90, dtype=np.uint8)
+    image[:, 30:34, :3] = YELLOW
+    detector.scan(image)                 # 1フレーム目は画像全体
+    image[height // 2:, 34:60, :3] = YELLOW # 下半分で、線が窓の右端の外まで広がる
+    assert detector.scan(image) == lane_detector.scanLineNumpy(image, YELLOW, THRESHOLD, detector.y_start)
+    assert detector.fast_count == 0
@@ -0,0 +1,32 @@
+"""
+Webots が無くても、このリポジトリのコントローラを動かすための「にせものの Webots」です。
+
+Webots の controller / vehicle モジュールの代わりになるモジュールと、
+車の運動モデル・作り物のコース・センサの元（ソース）を持っています。
+シミュレーションの時間を待たずに、CPUの速さいっぱいで進めます。
+
+使い方:
+  python -m webots_stub robot_car_auto_02.py --duration 60     # 60秒分（シミュレーションの時間）走らせる
+  python -m webots_stub raspimouse_controller.py --duration 10
+
+Pythonの中から使うとき:
+  import webots_stub
+  world = webots_stub.World(duration=30, obstacles=[(-100, 0, 1.0)])
+  webots_stub.install(world)   # これより後の "import controller" / "import vehicle" はにせものになります
+  import robot_car_auto_02
+"""
+import sys
+
+from . import controller, sources, vehicle
+from .world import BicycleModel, DifferentialDriveModel, Track, World
+
+
+"""
+world を使うように、にせものの controller / vehicle モジュールを登録します。
+すでに読み込んだコントローラのスクリプトは、読み込み直すまで前の World のままです。
+"""
+def install(world=None):
+    controller.setWorld(world if world is not None else World())
+    sys.modules["controller"] = controller
+    sys.modules["vehicle"]    = vehicle
+    return controller.getWorld()
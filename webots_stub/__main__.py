@@ -0,0 +1,51 @@
+"""
+コントローラのスクリプトを、にせものの Webots で動かします。
+
+  python -m webots_stub robot_car_auto_02.py --duration 60
+  python -m webots_stub robot_car_auto_03.py --obstacle -102 -5 1.0    # 障害物を置く
+  python -m webots_stub robot_car_auto_02.py --capture capture.bin     # 記録したセンサのデータで動かす
+"""
+import argparse
+import os
+import runpy
+import sys
+import time
+
+from . import install, sources
+from .world import World
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m webots_stub",
+                                     description="Webots が無くてもコントローラを動かします")
+    parser.add_argument("script", help="動かすコントローラのスクリプト")
+    parser.add_argument("--duration", type=float, default=60.0, help="走らせる時間[s]（シミュレーションの時間）")
+    parser.add_argument("--basic-time-step", type=float, default=10.0, help="1コマの長さ[ms]")
+    parser.add_argument("--obstacle", nargs=3, type=float, action="append", default=[],
+                        metavar=("X", "Y", "R"), help="円い障害物を置く（何回でも指定できます）")
+    parser.add_argument("--capture", help="カメラ・LiDAR・GPS に、sensor_capture で記録したデータを使う")
+    args = parser.parse_args()
+
+    world_sources = {}
+    basic_time_step = args.basic_time_step
+    duration = args.duration
+    if args.capture:
+        capture = sources.CaptureSource(args.capture)
+        world_sources = {"camera": capture.camera(), "Sick LMS 291": capture.lidar(), "gps": capture.gps()}
+        basic_time_step = capture.info.get("basic_time_step", basic_time_step)
+        duration = None # 記録が終わるまで
+    world = install(World(basic_time_step=basic_time_step, duration=duration,
+                          obstacles=args.obstacle, sources=world_sources))
+
+    # スクリプトのあるフォルダを import の場所に加えて、直接実行したときと同じように動かします
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    sys.argv = [args.script]
+    start = time.perf_counter()
+    runpy.run_path(args.script, run_name="__main__")
+    elapsed = time.perf_counter() - start
+    print("webots_stub: %.1f s of simulation in %.2f s (%.0fx real time)" % \
+        (world.time, elapsed, world.time / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
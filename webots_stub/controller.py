@@ -0,0 +1,184 @@
+"""
+Webots の controller モジュールの代わりです（このリポジトリのスクリプトが使う所だけ）。
+  Robot    : step / getTime / getBasicTimeStep / getDevice
+  Camera   : enable / getWidth / getHeight / getFov / getImage
+  Lidar    : enable / getHorizontalResolution / getMaxRange / getFov / getRangeImage
+  GPS      : enable / getValues
+  Keyboard : enable / getKey（UP / DOWN / RIGHT / LEFT の番号も Webots と同じです）
+  Motor    : setPosition / setVelocity
+  Display  : attachCamera / setColor（何もしません）
+装置のデータは、World に登録したソース（sources.py）から受け取ります。
+"""
+import math
+
+from . import sources
+
+
+"""
+センサの共通部分です。enable(period) で決めた間隔[ms]ごとにソースからデータを読み直し、
+それ以外のときは前回のデータを返します（Webots と同じく、enable しないとデータはありません）。
+"""
+class Sensor():
+    def __init__(self, world, source):
+        self.world  = world
+        self.source = source
+        self.period = 0
+        self.value  = None
+        self.next_update = 0.0
+
+    def enable(self, sampling_period):
+        self.period = sampling_period
+
+    def disable(self):
+        self.period = 0
+
+    def getSamplingPeriod(self):
+        return self.period
+
+    def read(self):
+        if self.period <= 0:
+            return None
+        if self.value is None or self.world.time >= self.next_update - 1e-9:
+            self.value = self.source.read(self.world)
+            self.next_update = self.world.time + self.period / 1000.0
+        return self.value
+
+
+class Camera(Sensor):
+    def getWidth(self):
+        return self.source.width
+
+    def getHeight(self):
+        return self.source.height
+
+    def getFov(self):
+        return self.source.fov
+
+    """ BGRA の画像（NumPy配列）を返します。np.frombuffer() でそのまま読めます """
+    def getImage(self):
+        return self.read()
+
+
+class Lidar(Sensor):
+    def getHorizontalResolution(self):
+        return self.source.width
+
+    def getMaxRange(self):
+        return self.source.max_range
+
+    def getFov(self):
+        return self.source.fov
+
+    def getRangeImage(self):
+        return self.read()
+
+
+class GPS(Sensor):
+    def getValues(self):
+        value = self.read()
+        return value if value is not None else [math.nan, math.nan, math.nan]
+
+
+class Keyboard(Sensor):
+    END, HOME, LEFT, UP, RIGHT, DOWN = 312, 313, 314, 315, 316, 317
+
+    """ Webots と同じく、Keyboard() は引数なしでも作れます（キーはワールドのソースから受け取ります） """
+    def __init__(self, world=None, source=None):
+        if world is None:
+            world = getWorld()
+        if source is None:
+            source = world.sources.get("keyboard") or sources.ScriptedKeyboard()
+        super().__init__(world, source)
+
+    def getKey(self):
+        if self.period <= 0:
+            return -1
+        return self.source.read(self.world)
+
+
+""" 車輪のモーターです。setPosition(inf) にすると、setVelocity の速さで回り続けます """
+class Motor():
+    def __init__(self, world, name):
+        self.world = world
+        self.name  = name
+        self.velocity = 0.0
+
+    def setPosition(self, position):
+        self.position = position
+
+    def setVelocity(self, velocity):
+        self.velocity = velocity
+        self.world.makeBody("differential").wheel_velocities[self.name] = velocity
+
+    def getVelocity(self):
+        return self.velocity
+
+
+class Display():
+    def attachCamera(self, camera):
+        pass
+
+    def setColor(self, color):
+        pass
+
+
+""" Node の定数はこのリポジトリでは使っていないので、名前だけ用意します """
+class Node():
+    pass
+
+
+_world = None
+
+
+""" 使う World を決めます（install() から呼ばれます） """
+def setWorld(world):
+    global _world
+    _world = world
+
+
+""" 今の World を返します。まだ無ければ、既定の設定で作ります """
+def getWorld():
+    global _world
+    if _world is None:
+        from .world import World
+        _world = World()
+    return _world
+
+
+class Robot():
+    def __init__(self):
+        self.world   = getWorld()
+        self.devices = {}
+
+    """ time_step[ms] だけ時刻を進めます（省略すると1コマ）。世界が終わっていれば -1 を返します """
+    def step(self, time_step=None):
+        if time_step is None:
+            time_step = self.world.basic_time_step
+        return 0 if self.world.advance(time_step) else -1
+
+    def getTime(self):
+        return self.world.time
+
+    def getBasicTimeStep(self):
+        return self.world.basic_time_step
+
+    """ 名前で装置を取り出します。同じ名前なら、いつも同じ装置を返します """
+    def getDevice(self, name):
+        if name not in self.devices:
+            self.devices[name] = self.makeDevice(name)
+        return self.devices[name]
+
+    def makeDevice(self, name):
+        source = self.world.sources.get(name)
+        lowered = name.lower()
+        if lowered.startswith("camera"):
+            return Camera(self.world, source or sources.SyntheticCamera())
+        if "lidar" in lowered or "lms" in lowered:
+            return Lidar(self.world, source or sources.RaycastLidar())
+        if lowered.startswith("gps"):
+            return GPS(self.world, source or sources.PoseGps())
+        if lowered.startswith("display"):
+            return Display()
+        if "wheel" in lowered or "motor" in lowered:
+            return Motor(self.world, name)
+        raise KeyError("webots_stub has no device named %r" % name)
@@ -0,0 +1,181 @@
+"""
+にせものの装置（カメラ・LiDAR・GPS・キーボード）に、データを作って渡す「センサの元（ソース）」です。
+
+どのソースも read(world) で今の時刻のデータを返します。World(sources={装置の名前: ソース}) で
+差し替えられるので、作り物のコースを映すカメラの代わりに、記録したデータ（CaptureSource）も流せます。
+  SyntheticCamera : コースの黄色い線を、車に付けたカメラから見た画像（BGRA）を作ります
+  RaycastLidar    : 円い障害物までの距離を、レーザー1本ずつ計算します
+  PoseGps         : 車の位置をそのまま返します
+  ScriptedKeyboard: 決めておいた時刻に、決めておいたキーを押します
+  CaptureSource   : sensor_capture.py で保存したデータを、時刻に合わせて返します
+"""
+import math
+
+import numpy as np
+
+
+"""
+地面を見下ろすカメラです。画素ごとに「地面のどこが映るか」を最初に1回だけ計算しておき、
+毎フレーム、その点がコースの黄色い線の上にあるかどうかで色を決めます。
+  mount_height : カメラの高さ[m]、pitch : 下向きの角度[rad]、offset : 後ろの車軸から前へのずれ[m]
+"""
+class SyntheticCamera():
+    YELLOW = (95, 187, 203) # RobotCar.YELLOW と同じ（B, G, R）
+    GROUND = (90, 90, 90)
+    SKY    = (200, 170, 120)
+
+    def __init__(self, width=128, height=64, fov=1.0, mount_height=1.3, pitch=0.2, offset=1.5, seed=0):
+        self.width, self.height, self.fov = width, height, fov
+        self.offset = offset
+
+        # 画素ごとの、カメラから見た向き（ピンホールカメラ）
+        focal = (width / 2.0) / math.tan(fov / 2.0)
+        u = (np.arange(width) + 0.5 - width / 2.0) / focal   # 右がプラス
+        v = (np.arange(height) + 0.5 - height / 2.0) / focal # 下がプラス
+        right, down = np.meshgrid(u, v)
+        forward = math.cos(pitch) - down * math.sin(pitch)
+        down    = math.sin(pitch) + down * math.cos(pitch)
+
+        # 下を向いている画素だけ地面が映ります。その地面の点（車の座標: 前 x, 右 y）を覚えておきます
+        self.ground = down > 1e-6
+        scale = mount_height / down[self.ground]
+        self.ground_forward = forward[self.ground] * scale + offset
+        self.ground_right   = right[self.ground] * scale
+
+        # 背景（地面のざらざらと空）は毎回同じなので、最初に作っておきます
+        rng = np.random.default_rng(seed)
+        self.background = np.empty((height, width, 4), dtype=np.uint8)
+        self.background[..., :3] = self.SKY
+        noise = rng.integers(-25, 25, size=(int(self.ground.sum()), 3))
+        self.background[self.ground, :3] = np.clip(np.asarray(self.GROUND) + noise, 0, 255)
+        self.background[..., 3] = 255
+        self.image = self.background.copy()
+
+    def read(self, world):
+        x, y, heading = world.pose()
+        cos_h, sin_h = math.cos(heading), math.sin(heading)
+        # 車の座標（前, 右）を世界の座標に直します（右は向きを時計回りに90度回した方向）
+        points = np.empty((len(self.ground_forward), 2))
+        points[:, 0] = x + self.ground_forward * cos_h + self.ground_right * sin_h
+        points[:, 1] = y + self.ground_forward * sin_h - self.ground_right * cos_h
+        on_line = world.track.onLine(points)
+
+        np.copyto(self.image, self.background)
+        ground = self.image[self.ground]
+        ground[on_line, :3] = self.YELLOW
+        self.image[self.ground] = ground
+        return self.image
+
+
+"""
+円い障害物を見るLiDARです（Sick LMS 291 と同じ 180本・180度・80m が既定）。
+レーザーの角度は RobotCar と同じく (i / width - 0.5) * fov で、プラスが右側です。
+何にも当たらないレーザーは inf を返します。
+"""
+class RaycastLidar():
+    def __init__(self, width=180, fov=math.pi, max_range=80.0, offset=3.6):
+        self.width, self.fov, self.max_range = width, fov, max_range
+        self.offset = offset
+        self.angles = (np.arange(width) / float(width) - 0.5) * fov
+        self.ranges = np.empty(width, dtype=np.float32)
+
+    def read(self, world):
+        self.ranges[:] = np.inf
+        if len(world.obstacles) == 0:
+            return self.ranges
+        x, y, heading = world.pose()
+        ox = x + self.offset * math.cos(heading)
+        oy = y + self.offset * math.sin(heading)
+        directions = heading - self.angles # 右がプラスなので、世界の角度では引きます
+        dx, dy = np.cos(directions), np.sin(directions)
+
+        # レーザー（半直線）と円の交わり: |o + t*d - c|^2 = r^2 の小さい方の t
+        cx = world.obstacles[:, 0] - ox
+        cy = world.obstacles[:, 1] - oy
+        r  = world.obstacles[:, 2]
+        b = dx[:, None] * cx + dy[:, None] * cy              # レーザー x 障害物
+        c = cx * cx + cy * cy - r * r
+        disc = b * b - c
+        hit_t = np.where(disc >= 0, b - np.sqrt(np.maximum(disc, 0.0)), np.inf)
+        hit_t = np.where(hit_t > 0, hit_t, np.where(c < 0, 0.0, np.inf)) # 後ろの交点は当たらない
+        nearest = hit_t.min(axis=1)
+        self.ranges[:] = np.where(nearest <= self.max_range, nearest, np.inf)
+        return self.ranges
+
+
+""" 車の今の位置を返すGPSです（z は地面からの高さ） """
+class PoseGps():
+    def __init__(self, height=0.3):
+        self.height = height
+
+    def read(self, world):
+        x, y, _ = world.pose()
+        return [x, y, self.height]
+
+
+"""
+決めておいた時刻にキーを押すキーボードです。keys は [(時刻[s], キーの番号), ...] です。
+押したキーは1回だけ返し、それ以外のときは -1（何も押されていない）を返します。
+"""
+class ScriptedKeyboard():
+    def __init__(self, keys=()):
+        self.keys = sorted(keys)
+        self.next_index = 0
+
+    def read(self, world):
+        if self.next_index < len(self.keys) and self.keys[self.next_index][0] <= world.time + 1e-9:
+            self.next_index += 1
+            return self.keys[self.next_index - 1][1]
+        return -1
+
+
+"""
+sensor_capture.py で保存したデータを返すソースです。
+センサは「今の時刻より前に記録された、一番新しいフレーム」を返し、記録が終わると世界も終わります。
+camera() / lidar() / gps() で、それぞれの装置用のソースを取り出します。
+"""
+class CaptureSource():
+    def __init__(self, path):
+        import sensor_capture
+        self.reader = sensor_capture.CaptureReader(path)
+        self.info   = self.reader.info
+        self.frames = self.reader.frames()
+        self.current = next(self.frames, None) # 今のフレーム (時刻, カメラ画像, LiDAR, GPS)
+        if self.current is None:
+            raise ValueError("%s has no frames" % path)
+        self.following = next(self.frames, None) # 次のフレーム
+        self.frame_count = 1
+
+    """ 時刻 now までフレームを進めます。もう次のフレームが無ければ False を返します """
+    def advance(self, now):
+        while self.following is not None and self.following[0] <= now + 1e-9:
+            self.current, self.following = self.following, next(self.frames, None)
+            self.frame_count += 1
+        return self.following is not None
+
+    def camera(self):
+        return CaptureChannel(self, 1, width=self.info["camera_width"],
+                              height=self.info["camera_height"], fov=self.info["camera_fov"])
+
+    def lidar(self):
+        return CaptureChannel(self, 2, width=self.info["lidar_width"],
+                              max_range=self.info["lidar_range"], fov=self.info["lidar_fov"])
+
+    def gps(self):
+        return CaptureChannel(self, 3)
+
+
+""" CaptureSource の中の1つの装置のデータ（index 番目）を返すソースです """
+class CaptureChannel():
+    def __init__(self, capture, index, **spec):
+        self.capture = capture
+        self.index   = index
+        for key, value in spec.items():
+            setattr(self, key, value)
+
+    def advance(self, now):
+        return self.capture.advance(now)
+
+    def read(self, world):
+        value = self.capture.current[self.index]
+        return list(value) if self.index == 3 else value
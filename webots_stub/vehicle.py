@@ -0,0 +1,29 @@
+"""
+Webots の vehicle モジュールの代わりです。Driver は自転車モデル（world.BicycleModel）で車を動かします。
+速度の単位は Webots と同じく km/h です。
+"""
+from .controller import Robot
+
+
+class Driver(Robot):
+    def __init__(self):
+        super().__init__()
+        self.body = self.world.makeBody("car")
+
+    def setSteeringAngle(self, steering_angle):
+        self.body.setSteering(steering_angle)
+
+    def getSteeringAngle(self):
+        return self.body.steering
+
+    def setCruisingSpeed(self, speed):
+        self.body.cruising_speed = speed / 3.6
+
+    def getTargetCruisingSpeed(self):
+        return self.body.cruising_speed * 3.6
+
+    def getCurrentSpeed(self):
+        return self.body.speed * 3.6
+
+    def setDippedBeams(self, state):
+        pass
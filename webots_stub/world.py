@@ -0,0 +1,235 @@
+"""
+にせものの Webots の「世界」です。時刻・車の動き（運動モデル）・コース・障害物を持っています。
+
+【座標のきまり】Webots と同じく、地面が x-y 平面で、z が上です。
+  車の向き heading は x 軸から反時計回りの角度[rad]です（robot_car_01.py の car_angle と同じ）。
+  ハンドルの角度はプラスが右に曲がる向きです（robot_car_auto_04_proto.py の計算と同じ）。
+"""
+import math
+
+import numpy as np
+
+# robot_car_01.py / robot_car_auto_04_proto.py のウェイポイントを回るコース（黄色い線の通り道）
+DEFAULT_TRACK = [[-98, 24], [-107, -33], [-83, -100], [40, -95], [45, 5], [15, 35], [-54, 45]]
+
+
+"""
+閉じた折れ線の角を、smoothing 回だけ切り落として（チャイキン法）、なめらかなカーブにします。
+"""
+def roundCorners(points, smoothing):
+    points = np.asarray(points, dtype=np.float64)
+    for _ in range(smoothing):
+        following = np.roll(points, -1, axis=0)
+        rounded = np.empty((2 * len(points), 2))
+        rounded[0::2] = 0.75 * points + 0.25 * following
+        rounded[1::2] = 0.25 * points + 0.75 * following
+        points = rounded
+    return points
+
+
+"""
+黄色い線のコース（閉じた折れ線）です。角は roundCorners() でなめらかにします。
+onLine() で、地面の点が線の上にあるかどうかをまとめて調べます。
+速く調べられるように、最初にコースを resolution[m] ごとのマス目に塗っておき（ラスタ）、
+あとはマス目を引くだけにしています。
+"""
+class Track():
+    def __init__(self, points=DEFAULT_TRACK, line_width=0.3, smoothing=3, resolution=0.1):
+        self.points = roundCorners(points, smoothing)
+        self.line_width = line_width
+        self.starts = self.points
+        self.ends   = np.roll(self.points, -1, axis=0)
+        self.dirs   = self.ends - self.starts
+        self.lengths_sq = np.einsum("ij,ij->i", self.dirs, self.dirs)
+        self.lengths    = np.sqrt(self.lengths_sq)
+        self.cumulative = np.concatenate([[0.0], np.cumsum(self.lengths)]) # 各線分の始まりまでの道のり[m]
+        self.perimeter  = self.cumulative[-1] # 1周の長さ[m]
+        self.resolution = resolution
+        self.buildRaster()
+
+    """ 点（N x 2 の配列）から、一番近い線分までの距離（長さ N の配列）を返します """
+    def distance(self, points):
+        best = np.full(len(points), np.inf)
+        for start, direction, length_sq in zip(self.starts, self.dirs, self.lengths_sq):
+            rel = points - start
+            t = np.clip(rel @ direction / length_sq, 0.0, 1.0)
+            d = rel - t[:, None] * direction
+            np.minimum(best, np.einsum("ij,ij->i", d, d), out=best)
+        return np.sqrt(best)
+
+    """
+    点 (x, y) に一番近いコース上の位置を探して、(スタートからの道のり[m]（0 〜 perimeter）, 線までの距離[m]) を返します
+    """
+    def locate(self, point):
+        rel = np.asarray(point, dtype=np.float64) - self.starts
+        t = np.clip(np.einsum("ij,ij->i", rel, self.dirs) / self.lengths_sq, 0.0, 1.0)
+        d = rel - t[:, None] * self.dirs
+        dist_sq = np.einsum("ij,ij->i", d, d)
+        nearest = int(np.argmin(dist_sq))
+        return float(self.cumulative[nearest] + t[nearest] * self.lengths[nearest]), math.sqrt(dist_sq[nearest])
+
+    """
+    スタートから道のり s[m] のコース上の点から、進む向きの右側に offset[m] ずらした位置 (x, y) と、
+    そこでのコースの向き[rad] を返します
+    """
+    def pointAt(self, s, offset=0.0):
+        s = s % self.perimeter
+        index = min(int(np.searchsorted(self.cumulative, s, side="right")) - 1, len(self.starts) - 1)
+        direction = self.dirs[index] / self.lengths[index]
+        point = self.starts[index] + (s - self.cumulative[index]) * direction
+        right = np.array([direction[1], -direction[0]])
+        x, y = point + offset * right
+        return x, y, math.atan2(direction[1], direction[0])
+
+    """ 線分ごとに、そのまわりのマス目だけ距離を計算して、線の上のマス目を塗ります """
+    def buildRaster(self):
+        half = 0.5 * self.line_width
+        self.origin = self.points.min(axis=0) - 1.0
+        size = np.ceil((self.points.max(axis=0) + 1.0 - self.origin) / self.resolution).astype(int)
+        self.raster = np.zeros((size[0], size[1]), dtype=bool)
+        for start, end, direction, length_sq in zip(self.starts, self.ends, self.dirs, self.lengths_sq):
+            low  = np.floor((np.minimum(start, end) - half - self.origin) / self.resolution).astype(int)
+            high = np.ceil((np.maximum(start, end) + half - self.origin) / self.resolution).astype(int)
+            ix, iy = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1),
+                                 indexing="ij")
+            cells = (np.stack([ix, iy], axis=-1) + 0.5) * self.resolution + self.origin
+            rel = cells - start
+            t = np.clip(rel @ direction / length_sq, 0.0, 1.0)
+            d = rel - t[..., None] * direction
+            self.raster[ix, iy] |= np.einsum("...j,...j->...", d, d) <= half * half
+
+    """ 点（N x 2 の配列）が黄色い線の上にあれば True の配列を返します """
+    def onLine(self, points):
+        index = np.floor((points - self.origin) / self.resolution).astype(np.intp)
+        inside = (index[:, 0] >= 0) & (index[:, 0] < self.raster.shape[0]) & \
+                 (index[:, 1] >= 0) & (index[:, 1] < self.raster.shape[1])
+        result = np.zeros(len(points), dtype=bool)
+        result[inside] = self.raster[index[inside, 0], index[inside, 1]]
+        return result
+
+    """
+    最初の線分の真ん中から、進む向きの右側に offset[m] ずらした位置と向きを返します。
+    RobotCar は黄色い線を画面の左側に見ながら走るので、車は線の右側から走り始めます。
+    """
+    def startPose(self, offset=2.0):
+        return self.pointAt(0.5 * self.lengths[0], offset)
+
+
+"""
+車の運動モデル（自転車モデル）です。後ろの車軸の真ん中の位置 (x, y) と向き heading を持ちます。
+速度は setCruisingSpeed の値へ、加速度 max_accel[m/s^2] で近づきます。
+"""
+class BicycleModel():
+    def __init__(self, x, y, heading, wheelbase=2.995, max_steering=0.6, max_accel=4.0):
+        self.x, self.y, self.heading = x, y, heading
+        self.wheelbase    = wheelbase # PROTOファイルのホイールベース[m]
+        self.max_steering = max_steering
+        self.max_accel    = max_accel
+        self.speed          = 0.0 # 今の速度[m/s]
+        self.cruising_speed = 0.0 # 目標の速度[m/s]
+        self.steering       = 0.0 # ハンドルの角度[rad]
+
+    def setSteering(self, angle):
+        self.steering = max(-self.max_steering, min(self.max_steering, angle))
+
+    """ 今の指令 (ハンドルの角度[rad], 目標の速度[km/h]) """
+    def command(self):
+        return self.steering, self.cruising_speed * 3.6
+
+    """ dt[s] だけ進めます """
+    def update(self, dt):
+        delta = self.cruising_speed - self.speed
+        limit = self.max_accel * dt
+        self.speed += max(-limit, min(limit, delta))
+        # プラスのハンドルで右（時計回り）に曲がります
+        self.heading -= self.speed * math.tan(self.steering) / self.wheelbase * dt
+        self.x += self.speed * math.cos(self.heading) * dt
+        self.y += self.speed * math.sin(self.heading) * dt
+
+
+"""
+左右の車輪の回転の速さで動くロボット（ラズパイマウスなど）の運動モデルです。
+車輪の速さ（setVelocity）は角速度[rad/s]で、wheel_radius[m] と tread（左右の車輪の間隔[m]）から動きを計算します。
+"""
+class DifferentialDriveModel():
+    def __init__(self, x, y, heading, wheel_radius=0.024, tread=0.0925):
+        self.x, self.y, self.heading = x, y, heading
+        self.wheel_radius = wheel_radius
+        self.tread = tread
+        self.wheel_velocities = {} # 車輪の名前 -> 角速度[rad/s]
+        self.left_name, self.right_name = "left_wheel_joint", "right_wheel_joint"
+
+    def update(self, dt):
+        left  = self.wheel_velocities.get(self.left_name, 0.0) * self.wheel_radius
+        right = self.wheel_velocities.get(self.right_name, 0.0) * self.wheel_radius
+        speed = 0.5 * (left + right)
+        self.heading += (right - left) / self.tread * dt
+        self.x += speed * math.cos(self.heading) * dt
+        self.y += speed * math.sin(self.heading) * dt
+
+
+"""
+世界全体です。時刻を進め、車（body）を動かし、センサ（sources）にデータを作らせます。
+  basic_time_step : 1コマの長さ[ms]（Webots の WorldInfo.basicTimeStep）
+  duration        : この時間[s]（シミュレーションの時間）が過ぎたら step() が -1 を返します。None なら止まりません
+  track           : 黄色い線のコース
+  obstacles       : 円い障害物の一覧 [(x, y, 半径), ...]（LiDARに映ります）
+  sources         : 装置の名前 -> センサの元（sources.py）。ここに無い名前は既定のものを使います
+  record_commands : True なら、毎コマの車への指令 (時刻, ハンドル, 速度) を commands に記録します
+"""
+class World():
+    def __init__(self, basic_time_step=10, duration=60.0, track=None, obstacles=(), sources=None,
+                 start_pose=None, record_commands=False):
+        self.basic_time_step = float(basic_time_step)
+        self.duration  = duration
+        self.track     = track if track is not None else Track()
+        self.obstacles = np.asarray(obstacles, dtype=np.float64).reshape(-1, 3)
+        self.sources   = dict(sources or {})
+        self.start_pose = start_pose if start_pose is not None else self.track.startPose()
+        self.step_count = 0
+        self.time = 0.0
+        self.body = None     # 車の運動モデル（Driver / Robot が作ります）
+        self.finished = False
+        self.commands = [] if record_commands else None
+        self.observers = [] # 1コマ進むたびに呼ぶ関数（addObserver で登録します）
+
+    """ 車の運動モデルを作ります（最初の1回だけ。2回目からは同じものを返します） """
+    def makeBody(self, kind):
+        if self.body is None:
+            x, y, heading = self.start_pose
+            if kind == "car":
+                self.body = BicycleModel(x, y, heading)
+            else:
+                self.body = DifferentialDriveModel(x, y, heading)
+        return self.body
+
+    """ 1コマ進むたびに func(world) を呼ぶようにします（走りの採点などに使います） """
+    def addObserver(self, func):
+        self.observers.append(func)
+
+    """ duration[ms] だけ進めます。もう終わりの時刻を過ぎていれば False を返します """
+    def advance(self, duration_ms):
+        steps = max(1, int(round(duration_ms / self.basic_time_step)))
+        dt = self.basic_time_step / 1000.0
+        for _ in range(steps):
+            if self.commands is not None and self.body is not None and self.time > 0.0:
+                self.commands.append((self.time,) + self.body.command())
+            if self.body is not None:
+                self.body.update(dt)
+            # 足し算を繰り返すと誤差がたまるので、コマ数から時刻を計算します
+            self.step_count += 1
+            self.time = self.step_count * dt
+            for observer in self.observers:
+                observer(self)
+        for source in self.sources.values():
+            if hasattr(source, "advance") and not source.advance(self.time):
+                self.finished = True
+        if self.duration is not None and self.time >= self.duration - 1e-9:
+            self.finished = True
+        return not self.finished
+
+    """ 車の今の位置と向き (x, y, heading) """
+    def pose(self):
+        if self.body is None:
+            return self.start_pose
+        return self.body.x, self.body.y, self.body.heading